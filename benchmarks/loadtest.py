@@ -0,0 +1,471 @@
+"""
+End-to-end load test: drives the real Application and conversation handlers
+with simulated students, against a fake Bot API and a fake Groq server.
+Nothing leaves the machine, so it can run in CI.
+
+Run with: python -m benchmarks.loadtest --users 50 --flows 3
+Use --database-url postgresql://... to test against a local Postgres instead
+of a throwaway SQLite file. Other bot settings (CONCURRENT_UPDATES,
+LLM_MAX_CONCURRENCY, ...) are read from the environment as usual.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import resource
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FLOWS = ["tutor", "assignment", "advisor", "project"]
+DEFAULT_WEIGHTS = "tutor=5,assignment=3,advisor=3,project=1"
+
+QUESTIONS = [
+    "Explain photosynthesis", "What is Newton's second law?", "How do I balance a redox equation?",
+    "Explain supply and demand", "What is the difference between mitosis and meiosis?",
+    "How does compound interest work?", "Explain the causes of the Nigerian civil war",
+]
+TOPICS = [
+    "The impact of social media on students' academic performance",
+    "Renewable energy adoption in West Africa", "Effects of inflation on small businesses",
+]
+COURSES = ["Computer Science", "Medicine and Surgery", "Law", "Accounting", "Mass Communication"]
+WORDS = (
+    "the student should *remember* that each _concept_ builds on the previous one and "
+    "practice with `examples` until the idea is clear because understanding matters more than memorising"
+).split()
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+# --- Fake Groq server ---
+
+class FakeGroq:
+    """
+    Groq-compatible /openai/v1/chat/completions endpoint on a local port, with
+    configurable latency, streaming speed and injected failures.
+    """
+
+    def __init__(self, first_token: float, token_interval: float, tokens: int, error_rate: float, rate_limit_rate: float, seed: int):
+        self.first_token = first_token
+        self.token_interval = token_interval
+        self.tokens = tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.seed = seed
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.requests = Counter()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+
+    def reply_for(self, prompt: str, rng: random.Random) -> str:
+        if "Plan this final year project as exactly" in prompt:
+            count = int(prompt.split("as exactly", 1)[1].split()[0])
+            chapters = [
+                {"title": f"Chapter title {n}", "summary": "What this chapter covers.", "key_points": ["point"]}
+                for n in range(1, count + 1)
+            ]
+            return json.dumps({"chapters": chapters, "key_terms": ["students"]})
+        if '"replacements"' in prompt:
+            return json.dumps({"replacements": []})
+        return " ".join(rng.choice(WORDS) for _ in range(self.tokens))
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, status: int, body: dict, headers: dict = None):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with fake.lock:
+                    rng = random.Random(fake.seed * 1_000_003 + next(fake.counter))
+                model = body["model"]
+                stream = body.get("stream", False)
+                fake.requests[model] += 1
+
+                roll = rng.random()
+                if roll < fake.error_rate:
+                    fake.requests["injected_5xx"] += 1
+                    return self.send_json(500, {"error": {"message": "injected failure"}})
+                if roll < fake.error_rate + fake.rate_limit_rate:
+                    fake.requests["injected_429"] += 1
+                    return self.send_json(429, {"error": {"message": "injected rate limit"}}, {"retry-after": "1"})
+
+                text = fake.reply_for(body["messages"][-1]["content"], rng)
+                prompt_tokens = sum(len(m["content"]) // 4 for m in body["messages"])
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(text) // 4, "total_tokens": prompt_tokens + len(text) // 4}
+                time.sleep(rng.expovariate(1 / fake.first_token) if fake.first_token else 0)
+
+                if not stream:
+                    time.sleep(fake.token_interval * fake.tokens)
+                    return self.send_json(200, {
+                        "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                        "usage": usage,
+                    })
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                pieces = [word + " " for word in text.split(" ")]
+                for n, piece in enumerate(pieces):
+                    chunk = {
+                        "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                        "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                    }
+                    if n == len(pieces) - 1:
+                        chunk["choices"][0]["finish_reason"] = "stop"
+                        chunk["x_groq"] = {"id": "fake", "usage": usage}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(fake.token_interval)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+        return Handler
+
+# --- Fake Bot API ---
+
+class FakeBotAPI:
+    """
+    Answers Bot API calls in-process and records every call. Simulated users
+    wait on expect() for the bot's reply to each of their steps.
+    """
+
+    def __init__(self):
+        self.message_ids = itertools.count(1000)
+        self.calls = Counter()
+        self.last_message = {}
+        self.waiters = defaultdict(list)
+
+    def expect(self, chat_id: int, text: str = None) -> asyncio.Future:
+        """
+        Resolves on the next call to chat_id that carries a keyboard or, when
+        given, whose text contains `text`.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[chat_id].append((text, future))
+        return future
+
+    def record(self, method: str, params: dict) -> dict:
+        self.calls[method] += 1
+        chat_id = params.get("chat_id")
+        if chat_id is None:
+            return True
+        chat_id = int(chat_id)
+        text = params.get("text") or params.get("caption") or ""
+        has_keyboard = bool(params.get("reply_markup"))
+        for waiter in list(self.waiters[chat_id]):
+            expected, future = waiter
+            if future.done() or (expected in text if expected else has_keyboard):
+                self.waiters[chat_id].remove(waiter)
+                if not future.done():
+                    future.set_result(time.perf_counter())
+
+        if method in ("deleteMessage", "sendChatAction"):
+            return True
+        message_id = int(params.get("message_id") or next(self.message_ids))
+        self.last_message[chat_id] = message_id
+        message = {"message_id": message_id, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}, "text": text}
+        if method == "sendDocument":
+            message["document"] = {"file_id": f"file-{message_id}", "file_unique_id": f"u-{message_id}"}
+        return message
+
+def fake_request_class():
+    from telegram.request import BaseRequest
+
+    class FakeRequest(BaseRequest):
+        def __init__(self, api: FakeBotAPI):
+            self.api = api
+
+        @property
+        def read_timeout(self):
+            return None
+
+        async def initialize(self):
+            pass
+
+        async def shutdown(self):
+            pass
+
+        async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None, connect_timeout=None, pool_timeout=None):
+            endpoint = url.rsplit("/", 1)[-1]
+            if endpoint == "getMe":
+                result = {"id": 1, "is_bot": True, "first_name": "Load Test", "username": "loadtest_bot"}
+            elif endpoint == "getUpdates":
+                await asyncio.sleep(1)
+                result = []
+            else:
+                params = request_data.parameters if request_data is not None else {}
+                result = self.api.record(endpoint, params)
+            return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+    return FakeRequest
+
+# --- Simulated users ---
+
+class SimulatedUser:
+    def __init__(self, harness, user_id: int, rng: random.Random):
+        self.harness = harness
+        self.user_id = user_id
+        self.rng = rng
+
+    def _user(self) -> dict:
+        return {"id": self.user_id, "is_bot": False, "first_name": f"Student{self.user_id}", "username": f"student{self.user_id}"}
+
+    def _chat(self) -> dict:
+        return {"id": self.user_id, "type": "private"}
+
+    def text_update(self, text: str) -> dict:
+        message = {
+            "message_id": next(self.harness.api.message_ids), "date": int(time.time()),
+            "chat": self._chat(), "from": self._user(), "text": text,
+        }
+        if text.startswith("/"):
+            command = text.split()[0]
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        return {"update_id": next(self.harness.update_ids), "message": message}
+
+    def callback_update(self, data: str) -> dict:
+        message_id = self.harness.api.last_message.get(self.user_id, 1)
+        return {
+            "update_id": next(self.harness.update_ids),
+            "callback_query": {
+                "id": str(next(self.harness.update_ids)), "from": self._user(), "chat_instance": str(self.user_id), "data": data,
+                "message": {"message_id": message_id, "date": int(time.time()), "chat": self._chat(), "text": "menu"},
+            },
+        }
+
+    async def step(self, name: str, payload: dict, expect: str = None, timeout: float = None):
+        waiter = self.harness.api.expect(self.user_id, expect)
+        started = time.perf_counter()
+        await self.harness.submit(payload)
+        try:
+            finished = await asyncio.wait_for(waiter, timeout or self.harness.step_timeout)
+            self.harness.latencies[name].append(finished - started)
+        except asyncio.TimeoutError:
+            self.harness.timeouts[name] += 1
+        await asyncio.sleep(self.rng.uniform(0, self.harness.think_time))
+
+    async def tutor(self):
+        await self.step("tutor.open", self.callback_update("MENU_TUTOR"))
+        await self.step("tutor.question", self.text_update(self.rng.choice(QUESTIONS)))
+        await self.step("tutor.ask_follow_up", self.callback_update("ask_follow_up"))
+        await self.step("tutor.follow_up", self.text_update("Can you give me another example?"))
+
+    async def assignment(self):
+        await self.step("assignment.open", self.callback_update("MENU_ASSIGNMENT"))
+        await self.step("assignment.topic", self.text_update(self.rng.choice(TOPICS)))
+        await self.step("assignment.ask_follow_up", self.callback_update("ask_follow_up"))
+        await self.step("assignment.follow_up", self.text_update("What sources should I use?"))
+
+    async def advisor(self):
+        await self.step("advisor.open", self.callback_update("MENU_COURSE_ADVISOR"))
+        await self.step("advisor.course", self.text_update(self.rng.choice(COURSES)))
+        await self.step("advisor.ask_follow_up", self.callback_update("ask_follow_up"))
+        await self.step("advisor.follow_up", self.text_update("Which universities offer it?"))
+
+    async def project(self):
+        await self.step("project.open", self.callback_update("MENU_PROJECT"))
+        await self.step("project.title", self.text_update(self.rng.choice(TOPICS)), expect="Got it")
+        details = (
+            "Department: Computer Science\nResearch Type: Survey\n"
+            f"Number of Chapters: {self.harness.chapters}\nReferencing Style: APA 7th Edition"
+        )
+        await self.step("project.details", self.text_update(details))
+        done = self.harness.api.expect(self.user_id, "All chapters have been generated")
+        started = time.perf_counter()
+        await self.step("project.queue", self.callback_update("start_generating"))
+        try:
+            finished = await asyncio.wait_for(done, self.harness.project_timeout)
+            self.harness.latencies["project.complete"].append(finished - started)
+        except asyncio.TimeoutError:
+            self.harness.timeouts["project.complete"] += 1
+
+    async def run(self, flows: int, weights: dict):
+        await self.step("start", self.text_update("/start"))
+        for _ in range(flows):
+            flow = self.rng.choices(list(weights), weights=list(weights.values()))[0]
+            await getattr(self, flow)()
+            await self.step("menu", self.callback_update("BACK_TO_MENU"))
+
+class Harness:
+    def __init__(self, args, application, api: FakeBotAPI):
+        self.application = application
+        self.api = api
+        self.update_ids = itertools.count(1)
+        self.latencies = defaultdict(list)
+        self.timeouts = Counter()
+        self.updates = 0
+        self.think_time = args.think_time
+        self.step_timeout = args.step_timeout
+        self.project_timeout = args.project_timeout
+        self.chapters = args.chapters
+
+    async def submit(self, payload: dict):
+        from telegram import Update
+        self.updates += 1
+        await self.application.update_queue.put(Update.de_json(payload, self.application.bot))
+
+def parse_weights(text: str) -> dict:
+    weights = {}
+    for item in text.split(","):
+        name, weight = item.split("=")
+        if name not in FLOWS:
+            raise SystemExit(f"Unknown flow '{name}', expected one of {FLOWS}")
+        weights[name] = float(weight)
+    return weights
+
+def configure_environment(args, fake_groq: FakeGroq, workdir: str):
+    """bot.config reads the environment at import time, so this runs before any bot import."""
+    os.environ["BOT_TOKEN"] = "123456:LOADTEST"
+    os.environ["GROQ_API_KEY"] = "loadtest"
+    os.environ["GROQ_BASE_URL"] = fake_groq.url
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{os.path.join(workdir, 'loadtest.db')}"
+    os.environ["METRICS_PORT"] = "0"
+    os.environ.setdefault("PROJECT_JOB_POLL_SECONDS", "0.5")
+    os.environ.setdefault("PROJECT_CHAPTER_CONCURRENCY", str(args.chapters))
+    if not args.database_url:
+        # SQLite allows one writer at a time
+        os.environ.setdefault("DB_THREADS", "1")
+
+async def run(args):
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    fake_groq = FakeGroq(args.first_token, args.token_interval, args.tokens, args.error_rate, args.rate_limit_rate, args.seed)
+    fake_groq.start()
+    configure_environment(args, fake_groq, workdir)
+
+    from bot import app
+    from bot.models import db
+    from bot.__main__ import build_application
+    from bot.services.session_manager import session_manager
+
+    # One line per LLM and Bot API request would drown the report
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    with app.app_context():
+        db.create_all()
+
+    api = FakeBotAPI()
+    FakeRequest = fake_request_class()
+    application = build_application(request=FakeRequest(api), get_updates_request=FakeRequest(api))
+    harness = Harness(args, application, api)
+    weights = parse_weights(args.weights)
+    rng = random.Random(args.seed)
+
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+
+    started = time.perf_counter()
+    users = []
+    for n in range(args.users):
+        user = SimulatedUser(harness, 100_000 + n, random.Random(rng.random()))
+        users.append(asyncio.create_task(user.run(args.flows, weights)))
+        await asyncio.sleep(args.ramp / max(args.users, 1))
+    await asyncio.gather(*users)
+    elapsed = time.perf_counter() - started
+    sessions = session_manager.stats()
+
+    await application.stop()
+    await application.shutdown()
+    await application.post_shutdown(application)
+    fake_groq.stop()
+
+    report(args, harness, api, fake_groq, elapsed, sessions)
+
+def report(args, harness: Harness, api: FakeBotAPI, fake_groq: FakeGroq, elapsed: float, sessions: dict):
+    steps = sum(len(v) for v in harness.latencies.values())
+    rows = {}
+    for name in sorted(set(harness.latencies) | set(harness.timeouts)):
+        values = harness.latencies[name]
+        rows[name] = {
+            "count": len(values),
+            "timeouts": harness.timeouts[name],
+            "p50": percentile(values, 0.50),
+            "p95": percentile(values, 0.95),
+            "p99": percentile(values, 0.99),
+        }
+    summary = {
+        "users": args.users,
+        "elapsed_seconds": elapsed,
+        "updates": harness.updates,
+        "updates_per_second": harness.updates / elapsed,
+        "steps_per_second": steps / elapsed,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "resident_sessions": sessions["resident_sessions"],
+        "resident_session_kb": sessions["resident_bytes"] / 1024,
+        "bot_api_calls": dict(api.calls),
+        "llm_requests": dict(fake_groq.requests),
+        "steps": rows,
+    }
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    print(f"\n{args.users} users, {harness.updates} updates in {elapsed:.1f}s "
+          f"({summary['updates_per_second']:.1f} updates/s, {summary['steps_per_second']:.1f} steps/s)")
+    print(f"max RSS {summary['max_rss_mb']:.0f} MB, {sessions['resident_sessions']} resident sessions "
+          f"({summary['resident_session_kb']:.0f} KB)")
+    print(f"Bot API calls: {dict(api.calls)}")
+    print(f"LLM requests: {dict(fake_groq.requests)}\n")
+    print(f"{'step':<26} {'count':>6} {'timeouts':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for name, row in rows.items():
+        print(f"{name:<26} {row['count']:>6} {row['timeouts']:>8} {row['p50']:>7.2f}s {row['p95']:>7.2f}s {row['p99']:>7.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="simulated students")
+    parser.add_argument("--flows", type=int, default=2, help="flows each student runs")
+    parser.add_argument("--weights", default=DEFAULT_WEIGHTS, help="relative frequency of each flow")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which students arrive")
+    parser.add_argument("--think-time", type=float, default=1.0, help="max pause between a student's steps")
+    parser.add_argument("--chapters", type=int, default=3, help="chapters per generated project")
+    parser.add_argument("--first-token", type=float, default=0.5, help="mean LLM time to first token (s)")
+    parser.add_argument("--token-interval", type=float, default=0.01, help="delay between streamed tokens (s)")
+    parser.add_argument("--tokens", type=int, default=150, help="words per LLM answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of LLM calls answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of LLM calls answered with a 429")
+    parser.add_argument("--step-timeout", type=float, default=120.0)
+    parser.add_argument("--project-timeout", type=float, default=600.0)
+    parser.add_argument("--database-url", help="defaults to a temporary SQLite file")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
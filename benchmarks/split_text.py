@@ -0,0 +1,91 @@
+"""
+Benchmark for the Markdown-aware message splitter.
+
+Run with: python -m benchmarks.split_text
+"""
+import os
+import random
+import time
+
+# bot.config refuses to load without these; the splitter does not use them
+os.environ.setdefault("BOT_TOKEN", "benchmark")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+from bot.utils.message_utils import MAX_MESSAGE_LENGTH, MarkdownSplitter, split_text, utf16_length
+
+SIZES = [100_000, 500_000, 2_000_000]
+STREAM_PIECE = 40
+
+FRAGMENTS = [
+    "The quick brown fox jumps over the lazy dog.",
+    "*Key point:* remember the _definition_ here.",
+    "Use `numpy.dot` for this.",
+    "See [the docs](https://example.com/docs) for more.",
+    "Exam tips 📚✍️ and emoji 😀.",
+    "* a bullet item",
+    "\n",
+    "\n\n",
+]
+
+def quadratic_split(text: str, max_length: int = MAX_MESSAGE_LENGTH) -> list:
+    """The previous rfind-based splitter, kept as a baseline."""
+    if len(text) <= max_length:
+        return [text]
+    chunks = []
+    while len(text) > 0:
+        if len(text) <= max_length:
+            chunks.append(text)
+            break
+        split_pos = text.rfind('\n', 0, max_length)
+        if split_pos == -1:
+            split_pos = text.rfind(' ', 0, max_length)
+        if split_pos == -1:
+            split_pos = max_length
+        chunks.append(text[:split_pos])
+        text = text[split_pos:].lstrip()
+    return chunks
+
+def make_text(size: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts, length = [], 0
+    while length < size:
+        if rng.random() < 0.02:
+            lines = [f"total += values[{i}]  # 😀" for i in range(rng.randint(10, 300))]
+            part = "```python\n" + "\n".join(lines) + "\n```\n"
+        else:
+            part = rng.choice(FRAGMENTS) + " "
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)
+
+def check(chunks: list):
+    for chunk in chunks:
+        assert utf16_length(chunk) <= MAX_MESSAGE_LENGTH, "chunk over the Telegram limit"
+        assert chunk.count("```") % 2 == 0, "unbalanced code block"
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def stream(text: str) -> list:
+    splitter = MarkdownSplitter()
+    chunks = []
+    for i in range(0, len(text), STREAM_PIECE):
+        chunks.extend(splitter.feed(text[i:i + STREAM_PIECE]))
+    return chunks + splitter.finish()
+
+def main():
+    print(f"{'size':>10} {'chunks':>7} {'split_text':>11} {'streamed':>9} {'old':>9}")
+    for size in SIZES:
+        text = make_text(size)
+        chunks, split_seconds = timed(split_text, text)
+        streamed, stream_seconds = timed(stream, text)
+        _, old_seconds = timed(quadratic_split, text)
+        check(chunks)
+        assert streamed == chunks, "streamed and one-shot splits differ"
+        print(f"{size:>10} {len(chunks):>7} {split_seconds:>10.3f}s {stream_seconds:>8.3f}s {old_seconds:>8.3f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Regression check for the tutor answer cache: rephrased questions must hit,
+questions that differ only in numbers or symbols must miss.
+
+Run with: python -m benchmarks.tutor_cache
+"""
+import os
+
+# bot.config refuses to load without these; the cache does not use them
+os.environ.setdefault("BOT_TOKEN", "benchmark")
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+from bot.config import Config
+from bot.services.semantic_cache import SemanticCache, embed
+
+SAME = [
+    ("What is photosynthesis?", "explain photosynthesis"),
+    ("Explain the causes of world war 1", "what are the causes of world war 1"),
+    ("solve x^2 + 5x + 6 = 0", "please solve x^2 + 5x + 6 = 0"),
+]
+DIFFERENT = [
+    ("solve x^2 + 5x + 6 = 0", "solve x^2 + 5x + 4 = 0"),
+    ("Explain the causes of world war 1", "Explain the causes of world war 2"),
+    ("What is 2 + 3?", "What is 2 * 3?"),
+    ("Simplify 3/4 + 1/2", "Simplify 3/4 - 1/2"),
+]
+
+def lookup(stored: str, asked: str):
+    cache = SemanticCache(max_size=8, ttl=60, threshold=Config.TUTOR_CACHE_THRESHOLD)
+    cache.put(stored, stored, cost=1.0)
+    return cache.get(asked), float(embed(stored) @ embed(asked))
+
+def main():
+    failures = []
+    for expected_hit, pairs in ((True, SAME), (False, DIFFERENT)):
+        for stored, asked in pairs:
+            answer, similarity = lookup(stored, asked)
+            hit = answer is not None
+            print(f"{'hit ' if hit else 'miss'} {similarity:.3f}  {stored!r} / {asked!r}")
+            if hit != expected_hit:
+                failures.append((stored, asked))
+    assert not failures, f"wrong cache result for {failures}"
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Fairness check for the update queue consumer (worker mode).
+
+One chat sends a burst of more updates than there are CONCURRENT_UPDATES
+slots; a second chat sends a single update right after. The second chat must
+be answered about as fast as if it were alone. A burst of text messages sent
+through single_request must also still be joined into one request.
+
+Run with: python -m benchmarks.update_queue
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+# bot.config refuses to load without these; nothing talks to Telegram or Groq
+os.environ.setdefault("BOT_TOKEN", "benchmark")
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+os.environ["CONCURRENT_UPDATES"] = "4"
+os.environ["UPDATE_POLL_SECONDS"] = "0.02"
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/update_queue.db"
+
+from bot import app
+from bot.config import Config
+from bot.models import db
+from bot.services.update_queue import UpdateConsumer, enqueue_update
+from bot.utils.decorators import single_request
+
+HANDLER_SECONDS = 0.3
+BURST = Config.CONCURRENT_UPDATES * 3
+BURSTING_CHAT, QUIET_CHAT, TYPING_CHAT = 101, 202, 303
+
+# Requests answer() received, after single_request joined the texts
+requests = []
+
+@single_request
+async def answer(update, context, text):
+    requests.append(text)
+    await asyncio.sleep(HANDLER_SECONDS)
+
+class FakeApplication:
+    """Stands in for the Application: updates are handled slowly, TYPING_CHAT's through single_request."""
+
+    bot = None
+
+    def __init__(self):
+        self.finished = {}
+
+    async def process_update(self, update):
+        if update.effective_chat.id == TYPING_CHAT:
+            await answer(update, None)
+        else:
+            await asyncio.sleep(HANDLER_SECONDS)
+        self.finished[update.update_id] = time.monotonic()
+
+def message(update_id: int, chat_id: int, text: str = "hi") -> dict:
+    user = {"id": chat_id, "is_bot": False, "first_name": "Student"}
+    return {
+        "update_id": update_id,
+        "message": {"message_id": update_id, "date": 0, "chat": {"id": chat_id, "type": "private"}, "from": user, "text": text},
+    }
+
+async def run_consumer(application: FakeApplication, update_ids: list, timeout: float = 30):
+    consumer = UpdateConsumer(application, shard=0)
+    task = asyncio.create_task(consumer.run())
+    started = time.monotonic()
+    while not all(update_id in application.finished for update_id in update_ids):
+        assert time.monotonic() - started < timeout, "updates were not processed in time"
+        await asyncio.sleep(0.01)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    await consumer.drain()
+    return started
+
+def check_burst_does_not_block_other_chats():
+    with app.app_context():
+        for n in range(BURST):
+            enqueue_update(message(n + 1, BURSTING_CHAT))
+        enqueue_update(message(BURST + 1, QUIET_CHAT))
+
+    application = FakeApplication()
+    started = asyncio.run(run_consumer(application, list(range(1, BURST + 2))))
+    quiet = application.finished[BURST + 1] - started
+    burst = application.finished[BURST] - started
+    print(f"{BURST} updates from one chat took {burst:.2f}s; the other chat was answered after {quiet:.2f}s")
+    assert quiet < 2 * HANDLER_SECONDS, "a bursting chat delayed another chat"
+
+def check_burst_is_debounced():
+    texts = ["Explain", "photosynthesis", "in simple terms"]
+    first = 1000
+    with app.app_context():
+        for n, text in enumerate(texts):
+            enqueue_update(message(first + n, TYPING_CHAT, text))
+
+    application = FakeApplication()
+    asyncio.run(run_consumer(application, [first + n for n in range(len(texts))]))
+    print(f"{len(texts)} quick messages became {len(requests)} request(s): {requests}")
+    assert requests == ["\n".join(texts)], "queued messages were not joined by single_request"
+
+def main():
+    with app.app_context():
+        db.create_all()
+    check_burst_does_not_block_other_chats()
+    check_burst_is_debounced()
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,37 @@
+import asyncio
 import logging
+import signal
 import sys
 import os
-from pathlib import Path
 from telegram import Update
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, PicklePersistence
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, TypeHandler
 
 from bot.config import Config
 from bot import app
-from bot.models import db
+from bot.models import add_hash_columns, db
+from bot.persistence import SQLPersistence
+from bot.services.perplexica_service import close_llm_client
+from bot.services.project_jobs import project_workers, ensure_chapter_schema
+from bot.services.session_manager import session_manager
+from bot.services.update_queue import UpdateConsumer
+from bot.services.outbound import outbound_scheduler
+from bot.services.admission import admission
+from bot.services.semantic_cache import tutor_cache
+from bot.services.topic_index import assignment_index
+from bot.services.history_search import setup_search_index
+from bot.services.database import run_db
+from bot.services.metrics import instrument_handler, start_metrics_server, stats_collector, handler_listeners
+from bot.services.analytics import analytics
 
 # Import all handlers directly
 from bot.handlers.start import start_command
 from bot.handlers.course_advisor import advisor_conversation_handler
-from bot.handlers.project import project_conversation_handler
+from bot.handlers.project import project_conversation_handler, project_export_handlers
 from bot.handlers.assignment import assignment_conversation_handler
 from bot.handlers.tutor import tutor_conversation_handler
 from bot.handlers.admin import admin_handlers
 from bot.handlers.help import help_command
+from bot.handlers.history import history_handlers
 
 # Configure logging
 logging.basicConfig(
@@ -26,34 +41,55 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Define the path for the persistence file
-PERSISTENCE_FILE = Path(__file__).parent.parent / "conversation_persistence.pkl"
+async def start_services(application: Application):
+    stats_collector.add("outbound", outbound_scheduler.stats)
+    stats_collector.add("sessions", session_manager.stats)
+    stats_collector.add("llm_admission", admission.stats)
+    if Config.TUTOR_CACHE_ENABLED:
+        stats_collector.add("tutor_cache", tutor_cache.stats)
+    if Config.ASSIGNMENT_DEDUP_ENABLED:
+        stats_collector.add("assignment_dedup", assignment_index.stats)
+    stats_collector.add("analytics", analytics.stats)
+    handler_listeners.append(analytics.handler_called)
+    start_metrics_server()
+    await run_db(setup_search_index)
+    await analytics.start()
+    project_workers.start(application.bot)
+    session_manager.start(application)
 
-def main():
-    logger.info("Initializing database...")
-    try:
-        with app.app_context():
-            db.create_all()
-        logger.info("Database initialized successfully!")
-    except Exception as e:
-        logger.error(f"Database initialization failed: {e}")
-        import traceback
-        traceback.print_exc()
-        sys.exit(1)
+async def shutdown_services(application: Application):
+    await project_workers.stop()
+    await session_manager.stop()
+    await analytics.stop()
+    await close_llm_client()
 
+def build_application(request=None, get_updates_request=None) -> Application:
+    """
+    Builds the application with every handler registered. The optional
+    BaseRequest objects replace the HTTP transport to the Bot API (used by
+    benchmarks/loadtest.py).
+    """
     logger.info("Building Telegram application with persistence...")
     
-    # Create the persistence object
-    persistence = PicklePersistence(filepath=PERSISTENCE_FILE)
+    # Conversation state is stored row-by-row in the database
+    persistence = SQLPersistence()
     
-    application = (
+    builder = (
         Application.builder()
         .token(Config.BOT_TOKEN)
         .persistence(persistence)
-        .build()
+        .concurrent_updates(Config.CONCURRENT_UPDATES)
+        .rate_limiter(outbound_scheduler)
+        .post_init(start_services)
+        .post_shutdown(shutdown_services)
     )
+    if request is not None:
+        builder = builder.request(request).get_updates_request(get_updates_request)
+    application = builder.build()
 
     # --- Handler Registration ---
+    application.add_handler(TypeHandler(Update, analytics.track_update), group=-2)
+    application.add_handler(TypeHandler(Update, session_manager.track_activity), group=-1)
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(advisor_conversation_handler)
     application.add_handler(project_conversation_handler)
@@ -61,10 +97,72 @@ def main():
     application.add_handler(tutor_conversation_handler)
     for handler in admin_handlers:
         application.add_handler(handler)
+    for handler in project_export_handlers:
+        application.add_handler(handler)
+    for handler in history_handlers:
+        application.add_handler(handler)
     application.add_handler(CallbackQueryHandler(help_command, pattern="^MENU_HELP$"))
     application.add_handler(CallbackQueryHandler(start_command, pattern="^BACK_TO_MENU$"))
 
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            instrument_handler(handler)
+
     logger.info("All handlers registered successfully!")
+    return application
+
+async def run_worker(application: Application):
+    """
+    Processes updates queued by webhook_app for this process's shard instead
+    of long polling. Run one worker per shard (WORKER_SHARD=0..UPDATE_SHARDS-1).
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    async with application:
+        await application.post_init(application)
+        if Config.WEBHOOK_URL and Config.WORKER_SHARD == 0:
+            await application.bot.set_webhook(
+                url=Config.WEBHOOK_URL,
+                secret_token=Config.WEBHOOK_SECRET,
+                allowed_updates=Update.ALL_TYPES
+            )
+            logger.info(f"Webhook set to {Config.WEBHOOK_URL}")
+        await application.start()
+
+        consumer = UpdateConsumer(application, Config.WORKER_SHARD)
+        consuming = asyncio.create_task(consumer.run())
+        await stop.wait()
+        consuming.cancel()
+        await asyncio.gather(consuming, return_exceptions=True)
+        await consumer.drain()
+
+        await application.stop()
+    await application.post_shutdown(application)
+
+def main():
+    logger.info("Initializing database...")
+    try:
+        with app.app_context():
+            db.create_all()
+            add_hash_columns()
+            ensure_chapter_schema()
+        logger.info("Database initialized successfully!")
+    except Exception as e:
+        logger.error(f"Database initialization failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+    application = build_application()
+
+    if Config.BOT_MODE == "worker":
+        logger.info(f"Starting Student AI Telegram Bot worker for shard {Config.WORKER_SHARD}...")
+        asyncio.run(run_worker(application))
+        return
+
     logger.info("Starting Student AI Telegram Bot... Press Ctrl+C to stop.")
     
     application.run_polling(allowed_updates=Update.ALL_TYPES)
@@ -8,9 +8,134 @@ class Config:
     ADMIN_USER_ID = int(os.getenv('ADMIN_USER_ID', 0))
     DATABASE_URL = os.getenv('DATABASE_URL')
     GROQ_API_KEY = os.getenv('GROQ_API_KEY')
+    # Only set to point the bot at a Groq-compatible server other than api.groq.com
+    GROQ_BASE_URL = os.getenv('GROQ_BASE_URL')
     SQLALCHEMY_DATABASE_URI = DATABASE_URL
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Database connection pool and the thread pool that runs blocking queries
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 5))
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    DB_THREADS = int(os.getenv('DB_THREADS', DB_POOL_SIZE))
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_pre_ping': True,
+        'pool_recycle': DB_POOL_RECYCLE,
+    }
+    if DATABASE_URL and not DATABASE_URL.startswith('sqlite'):
+        SQLALCHEMY_ENGINE_OPTIONS.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+
+    # LLM client: shared connection pool, in-flight limit and per-request timeout
+    LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 16))
+    LLM_MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', 32))
+    LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', 60))
+    LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 2))
+    LLM_RETRY_BASE_DELAY = float(os.getenv('LLM_RETRY_BASE_DELAY', 0.5))
+    LLM_RETRY_MAX_DELAY = float(os.getenv('LLM_RETRY_MAX_DELAY', 8))
+    # Seconds before a slow request is raced against the next model in its route (0 disables)
+    LLM_HEDGE_AFTER = float(os.getenv('LLM_HEDGE_AFTER', 8))
+
+    # LLM admission control: queue length and queue-time deadline (seconds) per
+    # priority class, and the share of slots background work may hold
+    ADMISSION_INTERACTIVE_QUEUE = int(os.getenv('ADMISSION_INTERACTIVE_QUEUE', 200))
+    ADMISSION_INTERACTIVE_DEADLINE = float(os.getenv('ADMISSION_INTERACTIVE_DEADLINE', 30))
+    ADMISSION_STANDARD_QUEUE = int(os.getenv('ADMISSION_STANDARD_QUEUE', 100))
+    ADMISSION_STANDARD_DEADLINE = float(os.getenv('ADMISSION_STANDARD_DEADLINE', 45))
+    ADMISSION_BACKGROUND_QUEUE = int(os.getenv('ADMISSION_BACKGROUND_QUEUE', 50))
+    ADMISSION_BACKGROUND_DEADLINE = float(os.getenv('ADMISSION_BACKGROUND_DEADLINE', 300))
+    ADMISSION_BACKGROUND_SHARE = float(os.getenv('ADMISSION_BACKGROUND_SHARE', 0.5))
+
+    # Conversation turns kept verbatim before older ones are summarized
+    HISTORY_KEEP_TURNS = int(os.getenv('HISTORY_KEEP_TURNS', 4))
+
+    # telegram_id -> user cache used for menu navigation and lookups
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+    USER_CACHE_TTL_SECONDS = int(os.getenv('USER_CACHE_TTL_SECONDS', 600))
+
+    # Course advisor answer cache
+    COURSE_CACHE_SIZE = int(os.getenv('COURSE_CACHE_SIZE', 512))
+    COURSE_CACHE_TTL_HOURS = int(os.getenv('COURSE_CACHE_TTL_HOURS', 24 * 30))
+
+    # Semantic cache for first-turn tutor questions (opt-in)
+    TUTOR_CACHE_ENABLED = os.getenv('TUTOR_CACHE_ENABLED', 'false').lower() == 'true'
+    TUTOR_CACHE_SIZE = int(os.getenv('TUTOR_CACHE_SIZE', 2000))
+    TUTOR_CACHE_TTL_HOURS = float(os.getenv('TUTOR_CACHE_TTL_HOURS', 24 * 7))
+    TUTOR_CACHE_THRESHOLD = float(os.getenv('TUTOR_CACHE_THRESHOLD', 0.9))
+
+    # Reuse of earlier analyses for the same or a near-identical assignment topic
+    ASSIGNMENT_DEDUP_ENABLED = os.getenv('ASSIGNMENT_DEDUP_ENABLED', 'true').lower() == 'true'
+    ASSIGNMENT_DEDUP_DAYS = int(os.getenv('ASSIGNMENT_DEDUP_DAYS', 60))
+    ASSIGNMENT_DEDUP_THRESHOLD = float(os.getenv('ASSIGNMENT_DEDUP_THRESHOLD', 0.85))
+
+    # Background project generation
+    PROJECT_WORKERS = int(os.getenv('PROJECT_WORKERS', 2))
+    PROJECT_JOB_POLL_SECONDS = float(os.getenv('PROJECT_JOB_POLL_SECONDS', 5))
+    PROJECT_JOB_LEASE_SECONDS = int(os.getenv('PROJECT_JOB_LEASE_SECONDS', 600))
+    PROJECT_JOB_MAX_ATTEMPTS = int(os.getenv('PROJECT_JOB_MAX_ATTEMPTS', 3))
+    # 'outline' plans the project first and writes chapters concurrently;
+    # 'sequential' writes each chapter from the full text of the previous ones
+    PROJECT_GENERATION_MODE = os.getenv('PROJECT_GENERATION_MODE', 'outline')
+    PROJECT_CHAPTER_CONCURRENCY = int(os.getenv('PROJECT_CHAPTER_CONCURRENCY', 3))
+
+    # Rendered chapter cache and in-memory size of compiled .docx exports before spilling to disk
+    DOCX_CACHE_MB = int(os.getenv('DOCX_CACHE_MB', 32))
+    DOCX_SPOOL_MB = int(os.getenv('DOCX_SPOOL_MB', 4))
+
+    # Admin analytics: seconds between flushes of buffered events to the rollup tables
+    ANALYTICS_FLUSH_SECONDS = float(os.getenv('ANALYTICS_FLUSH_SECONDS', 30))
+
+    # Conversation state persistence
+    PERSISTENCE_UPDATE_INTERVAL = float(os.getenv('PERSISTENCE_UPDATE_INTERVAL', 10))
+    PERSISTENCE_WRITE_DELAY = float(os.getenv('PERSISTENCE_WRITE_DELAY', 1))
+    PERSISTENCE_SHARED = os.getenv('PERSISTENCE_SHARED', 'false').lower() == 'true'
+
+    # In-memory session limits
+    SESSION_IDLE_SECONDS = int(os.getenv('SESSION_IDLE_SECONDS', 30 * 60))
+    SESSION_MEMORY_LIMIT_MB = int(os.getenv('SESSION_MEMORY_LIMIT_MB', 256))
+    SESSION_SWEEP_SECONDS = float(os.getenv('SESSION_SWEEP_SECONDS', 60))
+
+    # Number of updates the bot may process at the same time
+    CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', 64))
+
+    # Messages a user sends within this window are answered as one request
+    REQUEST_DEBOUNCE_SECONDS = float(os.getenv('REQUEST_DEBOUNCE_SECONDS', 0.8))
+
+    # Outbound Telegram pacing (messages per second)
+    OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', 30))
+    OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', 1))
+    OUTBOUND_GROUP_RATE = float(os.getenv('OUTBOUND_GROUP_RATE', 20 / 60))
+    OUTBOUND_CHAT_BURST = float(os.getenv('OUTBOUND_CHAT_BURST', 3))
+    # Edits and deletes (e.g. streamed answers) per chat, on top of OUTBOUND_CHAT_RATE
+    OUTBOUND_EDIT_RATE = float(os.getenv('OUTBOUND_EDIT_RATE', 1))
+    OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', 3))
+    OUTBOUND_MAX_CHAT_BUCKETS = int(os.getenv('OUTBOUND_MAX_CHAT_BUCKETS', 10000))
+
+    # Prometheus metrics endpoint (0 disables) and sampled logging of slow updates
+    METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))
+    METRICS_ADDR = os.getenv('METRICS_ADDR', '127.0.0.1')
+    TRACE_SLOW_SECONDS = float(os.getenv('TRACE_SLOW_SECONDS', 10))
+    TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 0.1))
+
+    # 'polling' runs a single long-polling process; 'worker' consumes one shard
+    # of the update queue filled by webhook_app
+    BOT_MODE = os.getenv('BOT_MODE', 'polling')
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+    WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+    UPDATE_SHARDS = int(os.getenv('UPDATE_SHARDS', 1))
+    WORKER_SHARD = int(os.getenv('WORKER_SHARD', 0))
+    UPDATE_POLL_SECONDS = float(os.getenv('UPDATE_POLL_SECONDS', 0.2))
+    UPDATE_BATCH_SIZE = int(os.getenv('UPDATE_BATCH_SIZE', 50))
+    # Claimed but not yet started updates kept in memory per chat
+    UPDATE_CHAT_BACKLOG = int(os.getenv('UPDATE_CHAT_BACKLOG', 20))
+    UPDATE_LEASE_SECONDS = int(os.getenv('UPDATE_LEASE_SECONDS', 300))
+    # How long processed update ids are remembered to drop Telegram redeliveries
+    UPDATE_DEDUP_HOURS = float(os.getenv('UPDATE_DEDUP_HOURS', 24))
+
     @classmethod
     def validate(cls):
         required_vars = ['BOT_TOKEN', 'DATABASE_URL', 'GROQ_API_KEY']
@@ -18,6 +143,9 @@ class Config:
             if not getattr(cls, var):
                 raise ValueError(f"Missing required configuration: {var}")
             print(f"✓ {var}: {'*' * 10}")
+        if cls.BOT_MODE == 'worker' and not cls.WEBHOOK_SECRET:
+            # webhook_app rejects every update without it, so workers would never receive any
+            raise ValueError("Missing required configuration: WEBHOOK_SECRET (required when BOT_MODE=worker)")
 
 try:
     Config.validate()
@@ -1,44 +1,157 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, CallbackQueryHandler, CommandHandler
+from telegram.helpers import escape_markdown
 from bot.models import User, db
-from bot import app
+from bot.services.database import run_db
 from bot.utils.decorators import admin_required
+from bot.services.session_manager import session_manager
+from bot.services.admission import admission
+from bot.services.semantic_cache import tutor_cache
+from bot.services.analytics import load_overview, USERS_COUNTER
+from bot.config import Config
 import logging
+from datetime import datetime, timedelta
 
 logger = logging.getLogger(__name__)
 
+USERS_PAGE_SIZE = 10
+ANALYTICS_DAYS = 7
+
+def recent_users(before: int = None, limit: int = USERS_PAGE_SIZE):
+    """
+    One page of users, newest first, keyset-paginated on the primary key:
+    before is the id of the last user on the previous page. Returns (users, has_more).
+    """
+    query = db.session.query(User.id, User.username, User.telegram_id)
+    if before is not None:
+        query = query.filter(User.id < before)
+    rows = query.order_by(User.id.desc()).limit(limit + 1).all()
+    return [(row.id, row.username, row.telegram_id) for row in rows[:limit]], len(rows) > limit
+
+def totals_by(stats: dict, metric: str, day=None) -> dict:
+    """Sums (count, total) of metric per dimension, over all days or one day."""
+    totals = {}
+    for (stat_day, stat_metric, dimension), (count, total) in stats.items():
+        if stat_metric == metric and (day is None or stat_day == day):
+            previous = totals.get(dimension, (0, 0.0))
+            totals[dimension] = (previous[0] + count, previous[1] + total)
+    return totals
+
+def day_count(stats: dict, day, metric: str) -> int:
+    return stats.get((day, metric, ""), (0, 0.0))[0]
+
+def find_user(telegram_id: int):
+    user = User.query.filter_by(telegram_id=telegram_id).first()
+    return (user.username, user.telegram_id, bool(user.is_admin), user.created_at) if user else None
+
 @admin_required
 async def admin_dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show the admin dashboard with key metrics."""
     query = update.callback_query
     await query.answer()
-    with app.app_context():
-        total_users = User.query.count()
+    counters, stats = await run_db(load_overview, ANALYTICS_DAYS)
+    today = datetime.utcnow().date()
+    active_week = sum(day_count(stats, today - timedelta(days=n), "active_users") for n in range(ANALYTICS_DAYS))
+    requests_today = sum(count for count, _ in totals_by(stats, "requests", today).values())
+    sessions = session_manager.stats()
+    llm = admission.stats()
+    cache_line = ""
+    if Config.TUTOR_CACHE_ENABLED:
+        cache = tutor_cache.stats()
+        cache_line = f"\nTutor Cache: {cache['hit_rate']:.0%} hit rate, {cache['seconds_saved_total']:.0f}s saved"
 
     keyboard = [
+        [InlineKeyboardButton("📈 Analytics", callback_data="ADMIN_ANALYTICS")],
         [InlineKeyboardButton("👥 User Management", callback_data="ADMIN_USERS")],
         [InlineKeyboardButton("🔙 Back to Main Menu", callback_data="BACK_TO_MENU")]
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(f"🏠 **Admin Dashboard**\n\n📊 **System Overview**\nTotal Users: {total_users}\n\nWhat would you like to manage?", reply_markup=reply_markup, parse_mode='Markdown')
+    await query.edit_message_text(f"🏠 **Admin Dashboard**\n\n📊 **System Overview**\nTotal Users: {counters.get(USERS_COUNTER, 0)} (+{day_count(stats, today, 'new_users')} today)\nActive Users: {day_count(stats, today, 'active_users')} today, {active_week / ANALYTICS_DAYS:.1f}/day over {ANALYTICS_DAYS} days\nRequests Today: {requests_today}\nSessions in Memory: {sessions['resident_sessions']} ({sessions['resident_bytes'] // 1024} KB)\nLLM Slots: {llm['active']}/{llm['capacity']} (queued: {llm['interactive_queued']}/{llm['standard_queued']}/{llm['background_queued']}){cache_line}\n\nWhat would you like to manage?", reply_markup=reply_markup, parse_mode='Markdown')
+
+@admin_required
+async def admin_analytics(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Daily users and requests, and LLM usage per focus mode, from the rollup tables."""
+    query = update.callback_query
+    await query.answer()
+    _, stats = await run_db(load_overview, ANALYTICS_DAYS)
+    today = datetime.utcnow().date()
+
+    lines = [f"📈 Analytics (last {ANALYTICS_DAYS} days, UTC)", "", "Day      New  Active  Requests"]
+    for n in range(ANALYTICS_DAYS):
+        day = today - timedelta(days=n)
+        requests = sum(count for count, _ in totals_by(stats, "requests", day).values())
+        lines.append(f"{day:%d %b}  {day_count(stats, day, 'new_users'):>5}  {day_count(stats, day, 'active_users'):>6}  {requests:>8}")
+
+    features = sorted(totals_by(stats, "requests").items(), key=lambda item: -item[1][0])
+    lines += ["", "Requests by feature:"]
+    lines += [f"  {feature}: {count}" for feature, (count, _) in features] or ["  none yet"]
+
+    prompt_tokens = totals_by(stats, "llm_prompt_tokens")
+    completion_tokens = totals_by(stats, "llm_completion_tokens")
+    llm_calls = sorted(totals_by(stats, "llm_calls").items(), key=lambda item: -item[1][0])
+    lines += ["", "LLM calls by focus mode:"]
+    for focus_mode, (calls, seconds) in llm_calls:
+        tokens = prompt_tokens.get(focus_mode, (0, 0.0))[1] + completion_tokens.get(focus_mode, (0, 0.0))[1]
+        lines.append(f"  {focus_mode}: {calls} calls, {seconds / calls:.1f}s avg, {tokens / 1000:.1f}k tokens")
+    if not llm_calls:
+        lines.append("  none yet")
+
+    keyboard = [[InlineKeyboardButton("🔙 Back to Admin Dashboard", callback_data="ADMIN_DASHBOARD")]]
+    await query.edit_message_text("\n".join(lines), reply_markup=InlineKeyboardMarkup(keyboard))
 
 @admin_required
 async def handle_admin_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle user management commands."""
+    """Browse users, newest first; ADMIN_USERS_<id> shows the page after that user."""
     query = update.callback_query
     await query.answer()
-    with app.app_context():
-        users = User.query.order_by(User.created_at.desc()).limit(10).all()
+    before = int(query.data.rsplit("_", 1)[1]) if query.data != "ADMIN_USERS" else None
+    users, has_more = await run_db(recent_users, before)
     if not users:
         await query.edit_message_text("No users found in the system.")
         return
-    user_list = "\n".join(f"{i+1}. @{user.username or 'N/A'} (ID: {user.telegram_id})" for i, user in enumerate(users))
-    keyboard = [[InlineKeyboardButton("🔙 Back to Admin Dashboard", callback_data="ADMIN_DASHBOARD")]]
+    user_list = "\n".join(f"• @{username or 'N/A'} (ID: {telegram_id})" for _, username, telegram_id in users)
+    navigation = []
+    if before is not None:
+        navigation.append(InlineKeyboardButton("⏮ Newest", callback_data="ADMIN_USERS"))
+    if has_more:
+        navigation.append(InlineKeyboardButton("⬅️ Older", callback_data=f"ADMIN_USERS_{users[-1][0]}"))
+    keyboard = [navigation] if navigation else []
+    keyboard.append([InlineKeyboardButton("🔙 Back to Admin Dashboard", callback_data="ADMIN_DASHBOARD")])
     reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text(f"👥 **Recent Users**\n\n{user_list}\n\nUse /admin_user [ID] to manage a user.", reply_markup=reply_markup)
+    await query.edit_message_text(f"👥 **Users** (newest first)\n\n{user_list}\n\nUse /admin_user [ID] to view a user.", reply_markup=reply_markup)
+
+async def show_user(update: Update, telegram_id: int):
+    details = await run_db(find_user, telegram_id)
+    keyboard = [[InlineKeyboardButton("🔙 Back to Admin Dashboard", callback_data="ADMIN_DASHBOARD")]]
+    if not details:
+        text = f"No user with ID {telegram_id}."
+    else:
+        username, telegram_id, user_is_admin, created_at = details
+        text = (
+            f"👤 **User Details**\n\n"
+            f"Username: {escape_markdown('@' + username) if username else 'N/A'}\n"
+            f"ID: {telegram_id}\n"
+            f"Admin: {'Yes' if user_is_admin else 'No'}\n"
+            f"Joined: {created_at:%Y-%m-%d}"
+        )
+
+    if update.callback_query:
+        await update.callback_query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+    else:
+        await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+
+@admin_required
+async def admin_user_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show a single user: /admin_user [ID]"""
+    if not context.args or not context.args[0].isdigit():
+        await update.message.reply_text("Usage: /admin_user [ID]")
+        return
+    await show_user(update, int(context.args[0]))
 
 admin_handlers = [
     CallbackQueryHandler(admin_dashboard, pattern="^MENU_ADMIN$"),
     CallbackQueryHandler(admin_dashboard, pattern="^ADMIN_DASHBOARD$"),
-    CallbackQueryHandler(handle_admin_users, pattern="^ADMIN_USERS$"),
+    CallbackQueryHandler(admin_analytics, pattern="^ADMIN_ANALYTICS$"),
+    CallbackQueryHandler(handle_admin_users, pattern=r"^ADMIN_USERS(_\d+)?$"),
+    CommandHandler("admin_user", admin_user_command),
 ]
@@ -1,15 +1,30 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler, MessageHandler, filters, CallbackQueryHandler, CommandHandler
-from bot.models import Assignment, User, db
-from bot import app
-from bot.services.perplexica_service import query_perplexica
-from bot.utils.message_utils import send_long_message # New Import
+from bot.config import Config
+from bot.models import Assignment, db
+from bot.services.database import run_db
+from bot.services.user_registry import user_registry
+from bot.services.perplexica_service import stream_perplexica, is_complete_answer
+from bot.services.topic_index import assignment_index
+from bot.services.history_search import index_entry, ASSIGNMENT
+from bot.services.history_manager import prepare_history, record_turn
+from bot.utils.message_utils import send_streaming_message, queue_notice, cached_answer
+from bot.utils.decorators import single_request, single_callback
 import logging
 
 logger = logging.getLogger(__name__)
 
 ASSIGNMENT_TOPIC, FOLLOW_UP = range(2)
 
+def save_assignment(user_id: int, topic: str, ai_response: str, index: bool = False):
+    assignment = Assignment(user_id=user_id, topic=topic, ai_response=ai_response)
+    db.session.add(assignment)
+    db.session.flush()
+    index_entry(user_id, ASSIGNMENT, assignment.id, topic, ai_response)
+    if index:
+        assignment_index.add(assignment.id, topic)
+    db.session.commit()
+
 async def start_assignment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -21,45 +36,54 @@ async def start_assignment(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return ASSIGNMENT_TOPIC
 
-async def process_assignment_topic(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    topic = update.message.text.strip()
+async def analyze_topic(update: Update, context: ContextTypes.DEFAULT_TYPE, status_msg, topic: str, reuse: bool = True):
+    """
+    Sends the analysis of topic into status_msg and saves it. With reuse, an
+    earlier analysis of the same or a near-identical topic is sent instead of
+    asking the LLM, together with a button to regenerate it.
+    """
+    previous = None
+    if reuse and Config.ASSIGNMENT_DEDUP_ENABLED:
+        previous = await run_db(assignment_index.lookup, topic)
+
+    keyboard = [
+        [InlineKeyboardButton("❓ Ask a Follow-up", callback_data="ask_follow_up")],
+        [InlineKeyboardButton("🔙 Back to Menu", callback_data="BACK_TO_MENU")]
+    ]
+    header = f"**Analysis for '{topic}':**\n\n"
+    if previous:
+        keyboard.insert(0, [InlineKeyboardButton("🔄 Regenerate", callback_data="assignment_regenerate")])
+        header += "♻️ This assignment was analyzed before, so here is that analysis. Tap Regenerate for a fresh one.\n\n"
+        chunks = cached_answer(previous[1])
+    else:
+        prompt = f"Analyze the assignment topic '{topic}' and provide a detailed analysis, key points, and suggestions."
+        chunks = stream_perplexica(prompt, focus_mode="academic", on_queued=queue_notice(status_msg))
+
+    ai_response = await send_streaming_message(
+        update,
+        context,
+        status_msg,
+        chunks,
+        reply_markup=InlineKeyboardMarkup(keyboard),
+        header=header
+    )
+
+    # Error, busy and cut-off replies are not saved, so they never show up in My History
+    if is_complete_answer(ai_response):
+        db_user = await user_registry.get_or_create(update.effective_user.id, update.effective_user.username)
+        index = Config.ASSIGNMENT_DEDUP_ENABLED and not previous
+        await run_db(save_assignment, db_user.id, topic, ai_response, index)
+
+    context.user_data['assignment_topic'] = topic
+    context.user_data['history'] = []
+    record_turn(context.user_data, f"Assignment topic: {topic}", ai_response)
+    return FOLLOW_UP
+
+@single_request
+async def process_assignment_topic(update: Update, context: ContextTypes.DEFAULT_TYPE, topic: str):
     status_msg = await update.message.reply_text("Analyzing...")
-    prompt = f"Analyze the assignment topic '{topic}' and provide a detailed analysis, key points, and suggestions."
-    
     try:
-        ai_response = await query_perplexica(prompt, focus_mode="academic")
-        
-        with app.app_context():
-            user = User.query.filter_by(telegram_id=update.effective_user.id).first()
-            if not user:
-                await update.message.reply_text("Please /start the bot first.")
-                return ConversationHandler.END
-            
-            assignment = Assignment(user_id=user.id, topic=topic, ai_response=ai_response)
-            db.session.add(assignment)
-            db.session.commit()
-            
-        context.user_data['history'] = [
-            {"role": "user", "content": f"Assignment topic: {topic}"},
-            {"role": "assistant", "content": ai_response}
-        ]
-            
-        await status_msg.delete()
-        
-        keyboard = [
-            [InlineKeyboardButton("❓ Ask a Follow-up", callback_data="ask_follow_up")],
-            [InlineKeyboardButton("🔙 Back to Menu", callback_data="BACK_TO_MENU")]
-        ]
-        
-        # FIX: Use the new utility to send the message
-        await send_long_message(
-            update,
-            context,
-            text=f"**Analysis for '{topic}':**\n\n{ai_response}",
-            reply_markup=InlineKeyboardMarkup(keyboard)
-        )
-        return FOLLOW_UP
-        
+        return await analyze_topic(update, context, status_msg, topic)
     except Exception as e:
         logger.error(f"Assignment processing failed: {e}")
         await status_msg.delete()
@@ -67,6 +91,26 @@ async def process_assignment_topic(update: Update, context: ContextTypes.DEFAULT
         await update.message.reply_text("⚠️ An error occurred.", reply_markup=InlineKeyboardMarkup(keyboard))
         return ConversationHandler.END
 
+@single_callback
+async def regenerate_analysis(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Asks the LLM for a fresh analysis instead of the reused one."""
+    query = update.callback_query
+    await query.answer()
+    topic = context.user_data.pop('assignment_topic', None)
+    if topic is None:
+        # Already regenerating, or the session has expired
+        return FOLLOW_UP
+    await query.edit_message_reply_markup(reply_markup=None)
+    status_msg = await query.message.reply_text("Analyzing...")
+    try:
+        return await analyze_topic(update, context, status_msg, topic, reuse=False)
+    except Exception as e:
+        logger.error(f"Assignment regeneration failed: {e}")
+        await status_msg.delete()
+        keyboard = [[InlineKeyboardButton("🔙 Back to Menu", callback_data="BACK_TO_MENU")]]
+        await query.message.reply_text("⚠️ An error occurred.", reply_markup=InlineKeyboardMarkup(keyboard))
+        return ConversationHandler.END
+
 async def ask_follow_up(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -74,23 +118,25 @@ async def ask_follow_up(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.edit_message_text("What is your follow-up question?", reply_markup=InlineKeyboardMarkup(keyboard))
     return FOLLOW_UP
 
-async def process_follow_up(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    follow_up_question = update.message.text.strip()
+@single_request
+async def process_follow_up(update: Update, context: ContextTypes.DEFAULT_TYPE, follow_up_question: str):
     status_msg = await update.message.reply_text("Thinking...")
-    history = context.user_data.get('history', [])
-    history.append({"role": "user", "content": follow_up_question})
-    prompt = f"Based on the previous analysis, answer this new question:\n\nCONTEXT:\n{history}\n\nNEW QUESTION:\n{follow_up_question}"
+    prompt = f"Based on the previous analysis, answer this new question:\n\n{follow_up_question}"
     
     try:
-        answer = await query_perplexica(prompt, focus_mode="academic")
-        history.append({"role": "assistant", "content": answer})
-        context.user_data['history'] = history
-        await status_msg.delete()
+        history = await prepare_history(context.user_data, "academic", prompt)
         keyboard = [
             [InlineKeyboardButton("❓ Ask Another Follow-up", callback_data="ask_follow_up")],
             [InlineKeyboardButton("🔙 Back to Menu", callback_data="BACK_TO_MENU")]
         ]
-        await send_long_message(update, context, text=answer, reply_markup=InlineKeyboardMarkup(keyboard))
+        answer = await send_streaming_message(
+            update,
+            context,
+            status_msg,
+            stream_perplexica(prompt, focus_mode="academic", history=history, on_queued=queue_notice(status_msg)),
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        record_turn(context.user_data, follow_up_question, answer)
         return FOLLOW_UP
     except Exception as e:
         logger.error(f"Follow-up Error: {e}")
@@ -114,8 +160,11 @@ assignment_conversation_handler = ConversationHandler(
         ASSIGNMENT_TOPIC: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_assignment_topic)],
         FOLLOW_UP: [
             CallbackQueryHandler(ask_follow_up, pattern="^ask_follow_up$"),
+            CallbackQueryHandler(regenerate_analysis, pattern="^assignment_regenerate$"),
             MessageHandler(filters.TEXT & ~filters.COMMAND, process_follow_up)
         ],
     },
-    fallbacks=[CommandHandler('cancel', universal_cancel), CallbackQueryHandler(universal_cancel, pattern="^BACK_TO_MENU$")]
+    fallbacks=[CommandHandler('cancel', universal_cancel), CallbackQueryHandler(universal_cancel, pattern="^BACK_TO_MENU$")],
+    name="assignment_conversation",
+    persistent=True
 )
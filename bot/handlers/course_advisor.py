@@ -1,6 +1,10 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler, MessageHandler, filters, CommandHandler, CallbackQueryHandler
-from bot.services.perplexica_service import query_perplexica
+from bot.services.perplexica_service import query_perplexica, is_complete_answer
+from bot.services.course_cache import get_course_advice, save_course_advice
+from bot.services.history_manager import prepare_history, record_turn
+from bot.utils.decorators import single_request
+from bot.utils.message_utils import queue_notice
 import logging
 
 logger = logging.getLogger(__name__)
@@ -18,8 +22,8 @@ async def start_advisor(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return COURSE_NAME
 
-async def process_course_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    course_name = update.message.text.strip()
+@single_request
+async def process_course_name(update: Update, context: ContextTypes.DEFAULT_TYPE, course_name: str):
     status_msg = await update.message.reply_text("🔎 Researching admission requirements...")
     prompt = (
         f"For a Nigerian student wanting to study '{course_name}', provide ONLY the following information concisely:\n"
@@ -28,8 +32,13 @@ async def process_course_name(update: Update, context: ContextTypes.DEFAULT_TYPE
         f"3. **UTME Subjects:** The 4 required subjects for JAMB."
     )
     try:
-        response_text = await query_perplexica(prompt, focus_mode="webSearch")
-        context.user_data['history'] = [{"role": "user", "content": f"Requirements for {course_name}"}, {"role": "assistant", "content": response_text}]
+        response_text = await get_course_advice(course_name)
+        if response_text is None:
+            response_text = await query_perplexica(prompt, focus_mode="webSearch", on_queued=queue_notice(status_msg))
+            if is_complete_answer(response_text):
+                await save_course_advice(course_name, response_text)
+        context.user_data['history'] = []
+        record_turn(context.user_data, f"Requirements for {course_name}", response_text)
         keyboard = [
             [InlineKeyboardButton("❓ Ask a Follow-up", callback_data="ask_follow_up")],
             [InlineKeyboardButton("🔙 Back to Menu", callback_data="BACK_TO_MENU")]
@@ -54,16 +63,14 @@ async def ask_follow_up(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.edit_message_text("What is your follow-up question?", reply_markup=InlineKeyboardMarkup(keyboard))
     return FOLLOW_UP
 
-async def process_follow_up(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    follow_up_question = update.message.text.strip()
+@single_request
+async def process_follow_up(update: Update, context: ContextTypes.DEFAULT_TYPE, follow_up_question: str):
     status_msg = await update.message.reply_text("Thinking...")
-    history = context.user_data.get('history', [])
-    history.append({"role": "user", "content": follow_up_question})
-    prompt = f"Based on the previous conversation, answer this follow-up question:\n\nCONTEXT:\n{history}\n\nNEW QUESTION:\n{follow_up_question}"
+    prompt = f"Based on the previous conversation, answer this follow-up question:\n\n{follow_up_question}"
     try:
-        answer = await query_perplexica(prompt, focus_mode="academic")
-        history.append({"role": "assistant", "content": answer})
-        context.user_data['history'] = history
+        history = await prepare_history(context.user_data, "academic", prompt)
+        answer = await query_perplexica(prompt, focus_mode="academic", history=history, on_queued=queue_notice(status_msg))
+        record_turn(context.user_data, follow_up_question, answer)
         await status_msg.delete()
         keyboard = [
             [InlineKeyboardButton("❓ Ask Another Follow-up", callback_data="ask_follow_up")],
@@ -96,5 +103,7 @@ advisor_conversation_handler = ConversationHandler(
             MessageHandler(filters.TEXT & ~filters.COMMAND, process_follow_up)
         ],
     },
-    fallbacks=[CommandHandler('cancel', universal_cancel), CallbackQueryHandler(universal_cancel, pattern="^BACK_TO_MENU$")]
+    fallbacks=[CommandHandler('cancel', universal_cancel), CallbackQueryHandler(universal_cancel, pattern="^BACK_TO_MENU$")],
+    name="advisor_conversation",
+    persistent=True
 )
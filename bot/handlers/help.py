@@ -13,6 +13,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "📝 **Projects**: Start a new research project and generate chapters.\n\n"
         "📄 **Assignments**: Get help with your assignments, with or without a PDF.\n\n"
         "🧠 **Mini Tutor**: Ask any academic question and get a detailed explanation.\n\n"
+        "🗂 **My History**: Find your past assignments and project chapters. Search them with /history <words>.\n\n"
         "💎 **Subscribe**: View and subscribe to premium plans to unlock all features.\n\n"
         "Use the buttons below or the corresponding commands to get started."
     )
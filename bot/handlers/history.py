@@ -0,0 +1,81 @@
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes, CallbackQueryHandler, CommandHandler
+from bot.services.database import run_db
+from bot.services.history_search import list_entries, load_entry, ASSIGNMENT
+from bot.services.user_registry import user_registry
+from bot.utils.message_utils import send_long_message
+import logging
+
+logger = logging.getLogger(__name__)
+
+def history_page(entries: list, has_more: bool, search: str = None):
+    """Returns the text and keyboard of one page of history entries."""
+    if search:
+        heading = f"🔎 Results for \"{search}\":"
+        empty = f"Nothing in your history matches \"{search}\"."
+    else:
+        heading = "🗂 Your history (newest first):"
+        empty = "You have no saved assignments or project chapters yet."
+    if not entries:
+        return empty, InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Back to Menu", callback_data="BACK_TO_MENU")]])
+
+    lines = [heading, ""]
+    keyboard = []
+    for number, (entry_id, kind, title, snippet, created_at) in enumerate(entries, 1):
+        icon = "📄" if kind == ASSIGNMENT else "📚"
+        lines.append(f"{number}. {icon} {title} ({created_at:%d %b %Y})\n{snippet}\n")
+        keyboard.append([InlineKeyboardButton(f"{number}. {icon} {title[:45]}", callback_data=f"HISTORY_VIEW_{entry_id}")])
+    if has_more:
+        keyboard.append([InlineKeyboardButton("⬅️ Older", callback_data=f"HISTORY_MORE_{entries[-1][0]}")])
+    keyboard.append([InlineKeyboardButton("🔙 Back to Menu", callback_data="BACK_TO_MENU")])
+    if not search:
+        lines.append("Tip: search with /history <words>")
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
+async def show_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/history [words] and the menu button: the newest entries, or those matching the words."""
+    search = " ".join(context.args).strip() if context.args else None
+    context.user_data['history_search'] = search
+
+    db_user = await user_registry.get_or_create(update.effective_user.id, update.effective_user.username)
+    entries, has_more = await run_db(list_entries, db_user.id, search)
+    text, reply_markup = history_page(entries, has_more, search)
+
+    if update.callback_query:
+        await update.callback_query.answer()
+        await update.callback_query.edit_message_text(text, reply_markup=reply_markup)
+    else:
+        await update.message.reply_text(text, reply_markup=reply_markup)
+
+async def more_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Shows the next (older) page after the entry in the callback data."""
+    query = update.callback_query
+    await query.answer()
+    before = int(query.data.rsplit("_", 1)[1])
+    search = context.user_data.get('history_search')
+
+    db_user = await user_registry.get_or_create(update.effective_user.id, update.effective_user.username)
+    entries, has_more = await run_db(list_entries, db_user.id, search, before)
+    text, reply_markup = history_page(entries, has_more, search)
+    await query.edit_message_text(text, reply_markup=reply_markup)
+
+async def view_history_entry(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Sends the full text of one history entry."""
+    query = update.callback_query
+    await query.answer()
+    entry_id = int(query.data.rsplit("_", 1)[1])
+
+    db_user = await user_registry.get_or_create(update.effective_user.id, update.effective_user.username)
+    entry = await run_db(load_entry, db_user.id, entry_id)
+    if entry is None:
+        await query.message.reply_text("Sorry, that entry could not be found.")
+        return
+    title, body = entry
+    await send_long_message(update, context, f"**{title}**\n\n{body}")
+
+history_handlers = [
+    CommandHandler("history", show_history),
+    CallbackQueryHandler(show_history, pattern="^MENU_HISTORY$"),
+    CallbackQueryHandler(more_history, pattern=r"^HISTORY_MORE_\d+$"),
+    CallbackQueryHandler(view_history_entry, pattern=r"^HISTORY_VIEW_\d+$"),
+]
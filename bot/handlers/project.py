@@ -1,10 +1,13 @@
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler, MessageHandler, filters, CallbackQueryHandler, CommandHandler
-from bot.services.perplexica_service import query_perplexica
-from bot.models import Project, ProjectChapter, User, db
-from bot import app
+from bot.models import Project, ProjectChapter, User
+from bot.services.database import run_db
+from bot.services.project_jobs import enqueue_project, numbered_chapters
+from bot.services.user_registry import user_registry
+from bot.services.docx_renderer import compile_project
+import asyncio
 import logging
-import io
+import re
 
 logger = logging.getLogger(__name__)
 
@@ -16,9 +19,6 @@ async def start_project(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     context.user_data.clear()
     
-    # Store initial prompt to guide the AI later
-    context.user_data['history'] = []
-    
     keyboard = [[InlineKeyboardButton("🔙 Back to Menu", callback_data="BACK_TO_MENU")]]
     await query.edit_message_text(
         "📝 **Final Year Project Generator**\n\nFirst, what is the **Project Title**?",
@@ -76,61 +76,98 @@ async def generate_chapters(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.edit_message_text("Ok, let's start over. What is the project title?", reply_markup=InlineKeyboardMarkup(keyboard))
         return TITLE
 
-    await query.edit_message_text("Great! I will now start generating your project, chapter by chapter. This may take some time.")
-    
-    num_chapters = context.user_data.get('num_chapters', 5)
-    
-    # Construct the initial user prompt for the AI
-    initial_prompt = (
-        f"Project Title: {context.user_data['title']}\n"
-        f"Department: {context.user_data['department']}\n"
-        f"Research Type: {context.user_data['research_type']}\n"
-        f"Referencing Style: {context.user_data['referencing']}\n\n"
-        "Generate the first chapter (Introduction) of this project. After you are done, simply say 'Chapter 1 Complete.' and nothing else."
-    )
-    
-    history = context.user_data.get('history', [])
-    history.append({"role": "user", "content": initial_prompt})
+    details = {
+        'title': context.user_data['title'],
+        'department': context.user_data['department'],
+        'research_type': context.user_data['research_type'],
+        'num_chapters': context.user_data.get('num_chapters', 5),
+        'referencing': context.user_data['referencing'],
+    }
+    keyboard = [[InlineKeyboardButton("🔙 Back to Menu", callback_data="BACK_TO_MENU")]]
 
-    for i in range(1, num_chapters + 1):
-        status_msg = await context.bot.send_message(chat_id=update.effective_chat.id, text=f"✍️ Generating Chapter {i}...")
-        
-        try:
-            ai_response = await query_perplexica("", focus_mode="project_generator", history=history)
-            history.append({"role": "assistant", "content": ai_response})
-            
-            # Create a document in memory
-            doc_content = ai_response.encode('utf-8')
-            doc_stream = io.BytesIO(doc_content)
-            doc_stream.name = f"Chapter_{i}.docx"
-            
-            await status_msg.delete()
-            await context.bot.send_document(
-                chat_id=update.effective_chat.id,
-                document=doc_stream,
-                caption=f"Here is Chapter {i} of your project."
-            )
-
-            # If it's not the last chapter, ask for the next one
-            if i < num_chapters:
-                next_prompt = f"Excellent. Now, generate Chapter {i+1} based on the previous chapters. After you are done, simply say 'Chapter {i+1} Complete.' and nothing else."
-                history.append({"role": "user", "content": next_prompt})
-            
-        except Exception as e:
-            logger.error(f"Project generation failed at Chapter {i}: {e}")
-            await status_msg.delete()
-            await context.bot.send_message(chat_id=update.effective_chat.id, text=f"Sorry, an error occurred while generating Chapter {i}.")
-            return ConversationHandler.END
+    try:
+        db_user = await user_registry.get_or_create(update.effective_user.id, update.effective_user.username)
+        await enqueue_project(db_user.id, update.effective_chat.id, details)
+    except Exception as e:
+        logger.error(f"Queueing project failed: {e}")
+        await query.edit_message_text("Sorry, an error occurred while queueing your project.", reply_markup=InlineKeyboardMarkup(keyboard))
+        return ConversationHandler.END
 
-    keyboard = [[InlineKeyboardButton("🔙 Back to Menu", callback_data="BACK_TO_MENU")]]
-    await context.bot.send_message(
-        chat_id=update.effective_chat.id,
-        text="✅ All chapters have been generated!",
+    await query.edit_message_text(
+        "Great! Your project is in the queue. I will send each chapter here as soon as it is ready, "
+        "so feel free to use the other features in the meantime.",
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
     context.user_data.clear()
     return ConversationHandler.END
 
+def user_projects(telegram_id: int, limit: int = 5) -> list:
+    projects = (
+        Project.query.join(User)
+        .filter(User.telegram_id == telegram_id, Project.status == 'completed')
+        .order_by(Project.created_at.desc())
+        .limit(limit)
+        .all()
+    )
+    return [(project.id, project.title) for project in projects]
+
+def load_project_export(project_id: int, telegram_id: int):
+    """Returns (title, [chapter markdown in order]) if the project belongs to the user."""
+    project = Project.query.join(User).filter(Project.id == project_id, User.telegram_id == telegram_id).first()
+    if project is None:
+        return None
+    chapters = numbered_chapters(ProjectChapter.query.filter_by(project_id=project_id).order_by(ProjectChapter.id).all())
+    return project.title, [chapters[number] or "" for number in sorted(chapters)]
+
+async def list_projects(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/projects: lists the user's finished projects for download."""
+    projects = await run_db(user_projects, update.effective_user.id)
+    if not projects:
+        await update.message.reply_text("You have no completed projects yet.")
+        return
+    keyboard = [
+        [InlineKeyboardButton(f"📚 {title[:50]}", callback_data=f"PROJECT_EXPORT_{project_id}")]
+        for project_id, title in projects
+    ]
+    await update.message.reply_text("Choose a project to download:", reply_markup=InlineKeyboardMarkup(keyboard))
+
+async def export_project(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Sends the whole project as one .docx."""
+    query = update.callback_query
+    await query.answer()
+    project_id = int(query.data.rsplit("_", 1)[1])
+
+    export = await run_db(load_project_export, project_id, update.effective_user.id)
+    if not export or not export[1]:
+        await query.message.reply_text("Sorry, that project could not be found.")
+        return
+
+    title, chapters = export
+    status_msg = await query.message.reply_text("📚 Compiling your project...")
+    document = None
+    try:
+        loop = asyncio.get_running_loop()
+        document = await loop.run_in_executor(None, compile_project, title, chapters)
+        filename = re.sub(r"[^\w\- ]+", "", title).strip().replace(" ", "_")[:60] or "Project"
+        await context.bot.send_document(
+            chat_id=update.effective_chat.id,
+            document=document,
+            filename=f"{filename}.docx",
+            caption=f"Here is your complete project: {title}"
+        )
+    except Exception as e:
+        logger.error(f"Project export {project_id} failed: {e}")
+        await query.message.reply_text("Sorry, an error occurred while compiling your project.")
+    finally:
+        if document is not None:
+            document.close()
+        await status_msg.delete()
+
+project_export_handlers = [
+    CallbackQueryHandler(export_project, pattern=r"^PROJECT_EXPORT_\d+$"),
+    CommandHandler("projects", list_projects),
+]
+
 async def universal_cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data.clear()
     if update.callback_query:
@@ -147,5 +184,7 @@ project_conversation_handler = ConversationHandler(
         DETAILS: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_details)],
         GENERATING: [CallbackQueryHandler(generate_chapters)],
     },
-    fallbacks=[CommandHandler('cancel', universal_cancel), CallbackQueryHandler(universal_cancel, pattern="^BACK_TO_MENU$")]
+    fallbacks=[CommandHandler('cancel', universal_cancel), CallbackQueryHandler(universal_cancel, pattern="^BACK_TO_MENU$")],
+    name="project_conversation",
+    persistent=True
 )
@@ -1,8 +1,7 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from bot.models import User, db
-from bot import app
 from bot.config import Config
+from bot.services.user_registry import user_registry
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handles the /start command and the 'Back to Menu' button."""
@@ -12,14 +11,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     telegram_id = user.id
     username = user.username
 
-    with app.app_context():
-        db_user = User.query.filter_by(telegram_id=telegram_id).first()
-        if not db_user:
-            db_user = User(telegram_id=telegram_id, username=username)
-            db.session.add(db_user)
-            if telegram_id == Config.ADMIN_USER_ID:
-                db_user.is_admin = True
-            db.session.commit()
+    db_user = await user_registry.get_or_create(telegram_id, username)
         
     keyboard = [
         [
@@ -30,7 +22,10 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             InlineKeyboardButton("📄 Assignments", callback_data="MENU_ASSIGNMENT"),
             InlineKeyboardButton("🧠 Mini Tutor", callback_data="MENU_TUTOR")
         ],
-        [InlineKeyboardButton("ℹ️ Help & About", callback_data="MENU_HELP")]
+        [
+            InlineKeyboardButton("🗂 My History", callback_data="MENU_HISTORY"),
+            InlineKeyboardButton("ℹ️ Help & About", callback_data="MENU_HELP")
+        ]
     ]
 
     if telegram_id == Config.ADMIN_USER_ID:
@@ -1,7 +1,12 @@
+import time
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler, MessageHandler, filters, CallbackQueryHandler, CommandHandler
-from bot.services.perplexica_service import query_perplexica
-from bot.utils.message_utils import send_long_message # New Import
+from bot.config import Config
+from bot.services.perplexica_service import stream_perplexica, is_complete_answer
+from bot.services.semantic_cache import tutor_cache
+from bot.services.history_manager import prepare_history, record_turn
+from bot.utils.message_utils import send_streaming_message, queue_notice, cached_answer
+from bot.utils.decorators import single_request
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,21 +24,29 @@ async def start_tutor(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return TUTOR_QUESTION
 
-async def process_tutor_question(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    question = update.message.text.strip()
+@single_request
+async def process_tutor_question(update: Update, context: ContextTypes.DEFAULT_TYPE, question: str):
     status_msg = await update.message.reply_text("🤔 Thinking...")
     prompt = f"As an expert academic tutor, answer this student's question clearly and concisely: {question}"
     
     try:
-        answer = await query_perplexica(prompt, focus_mode="tutor", history=[])
-        context.user_data['history'] = [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
-        
-        await status_msg.delete()
         keyboard = [
             [InlineKeyboardButton("❓ Ask a Follow-up", callback_data="ask_follow_up")],
             [InlineKeyboardButton("🔙 Back to Menu", callback_data="BACK_TO_MENU")]
         ]
-        await send_long_message(update, context, text=answer, reply_markup=InlineKeyboardMarkup(keyboard))
+        cached = tutor_cache.get(question) if Config.TUTOR_CACHE_ENABLED else None
+        started = time.monotonic()
+        answer = await send_streaming_message(
+            update,
+            context,
+            status_msg,
+            cached_answer(cached) if cached else stream_perplexica(prompt, focus_mode="tutor", history=[], on_queued=queue_notice(status_msg)),
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        if Config.TUTOR_CACHE_ENABLED and not cached and is_complete_answer(answer):
+            tutor_cache.put(question, answer, time.monotonic() - started)
+        context.user_data['history'] = []
+        record_turn(context.user_data, question, answer)
         return FOLLOW_UP
 
     except Exception as e:
@@ -50,24 +63,24 @@ async def ask_follow_up(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.edit_message_text("What is your follow-up question?", reply_markup=InlineKeyboardMarkup(keyboard))
     return FOLLOW_UP
 
-async def process_follow_up(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    follow_up_question = update.message.text.strip()
+@single_request
+async def process_follow_up(update: Update, context: ContextTypes.DEFAULT_TYPE, follow_up_question: str):
     status_msg = await update.message.reply_text("Thinking about your follow-up...")
     
-    history = context.user_data.get('history', [])
-    
     try:
-        answer = await query_perplexica(follow_up_question, focus_mode="tutor", history=history)
-        history.append({"role": "user", "content": follow_up_question})
-        history.append({"role": "assistant", "content": answer})
-        context.user_data['history'] = history
-
-        await status_msg.delete()
+        history = await prepare_history(context.user_data, "tutor", follow_up_question)
         keyboard = [
             [InlineKeyboardButton("❓ Ask Another Follow-up", callback_data="ask_follow_up")],
             [InlineKeyboardButton("🔙 Back to Menu", callback_data="BACK_TO_MENU")]
         ]
-        await send_long_message(update, context, text=answer, reply_markup=InlineKeyboardMarkup(keyboard))
+        answer = await send_streaming_message(
+            update,
+            context,
+            status_msg,
+            stream_perplexica(follow_up_question, focus_mode="tutor", history=history, on_queued=queue_notice(status_msg)),
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+        record_turn(context.user_data, follow_up_question, answer)
         return FOLLOW_UP
 
     except Exception as e:
@@ -95,5 +108,7 @@ tutor_conversation_handler = ConversationHandler(
             MessageHandler(filters.TEXT & ~filters.COMMAND, process_follow_up)
         ],
     },
-    fallbacks=[CommandHandler('cancel', universal_cancel), CallbackQueryHandler(universal_cancel, pattern="^BACK_TO_MENU$")]
+    fallbacks=[CommandHandler('cancel', universal_cancel), CallbackQueryHandler(universal_cancel, pattern="^BACK_TO_MENU$")],
+    name="tutor_conversation",
+    persistent=True
 )
@@ -1,8 +1,96 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from functools import lru_cache
+import hashlib
+import logging
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zlib is always available; zstd compresses model output better when installed
+    zstandard = None
+
+logger = logging.getLogger(__name__)
 
 db = SQLAlchemy()
 
+# --- Content-addressed blob store for large AI outputs ---
+
+def compress(text: str) -> tuple:
+    """Returns (codec, data) for text; short or incompressible text is stored raw."""
+    raw = text.encode("utf-8")
+    if zstandard is not None:
+        codec, data = "zstd", zstandard.ZstdCompressor(level=10).compress(raw)
+    else:
+        codec, data = "zlib", zlib.compress(raw, 9)
+    if len(data) >= len(raw):
+        return "raw", raw
+    return codec, data
+
+def decompress(codec: str, data: bytes) -> str:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Blob is zstd-compressed but the zstandard package is not installed")
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif codec == "zlib":
+        data = zlib.decompress(data)
+    return data.decode("utf-8")
+
+class Blob(db.Model):
+    """Compressed text stored once per distinct content, keyed by its SHA-256."""
+    __tablename__ = 'blobs'
+    hash = db.Column(db.String(64), primary_key=True)
+    codec = db.Column(db.String(10), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    @property
+    def text(self) -> str:
+        return decompress(self.codec, self.data)
+
+    @staticmethod
+    def store(text: str) -> str:
+        """
+        Stores text unless identical content already exists and returns its hash.
+        Must be called inside an app context; the caller commits.
+        """
+        from bot.services.database import upsert
+
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        # Checks the key only, so existing content is neither loaded nor compressed again
+        if not db.session.query(db.exists().where(Blob.hash == digest)).scalar():
+            codec, data = compress(text)
+            upsert(Blob, [{
+                'hash': digest, 'codec': codec, 'size': len(text.encode("utf-8")),
+                'data': data, 'created_at': datetime.utcnow(),
+            }], ['hash'])
+        return digest
+
+@lru_cache(maxsize=256)
+def load_blob(digest: str) -> str:
+    """Decompressed text of a blob. Blobs never change, so the result is cached."""
+    blob = db.session.get(Blob, digest)
+    if blob is None:
+        raise LookupError(f"Blob {digest} does not exist")
+    return blob.text
+
+def blob_text(legacy: str, hash_column: str):
+    """
+    A text attribute backed by the blob store. Reads fall back to the legacy
+    inline column for rows that migrate_blobs.py has not moved yet; writes
+    always go to the blob store.
+    """
+    def get(self):
+        digest = getattr(self, hash_column)
+        return load_blob(digest) if digest else getattr(self, legacy)
+
+    def set(self, text):
+        setattr(self, hash_column, Blob.store(text) if text is not None else None)
+        setattr(self, legacy, None)
+
+    return property(get, set)
+
 class User(db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
@@ -24,22 +112,104 @@ class Project(db.Model):
     status = db.Column(db.String(20), default='draft')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     chapters = db.relationship('ProjectChapter', backref='project', lazy=True, cascade="all, delete-orphan")
+    __table_args__ = (db.Index('ix_projects_user_id_created_at', 'user_id', 'created_at'),)
 
 class ProjectChapter(db.Model):
     __tablename__ = 'project_chapters'
     id = db.Column(db.Integer, primary_key=True)
     project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
+    number = db.Column(db.Integer, nullable=True)
     title = db.Column(db.String(200), nullable=False)
-    content = db.Column(db.Text, nullable=True)
+    _content = db.Column('content', db.Text, nullable=True)
+    content_hash = db.Column(db.String(64), db.ForeignKey('blobs.hash'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    content = blob_text('_content', 'content_hash')
+    __table_args__ = (
+        db.Index('ix_project_chapters_project_id', 'project_id'),
+        # A job reclaimed by a second worker cannot store the same chapter twice
+        db.UniqueConstraint('project_id', 'number', name='uq_project_chapters_project_id_number'),
+    )
+
+class ProjectJob(db.Model):
+    __tablename__ = 'project_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False, index=True)
+    chat_id = db.Column(db.BigInteger, nullable=False)
+    num_chapters = db.Column(db.Integer, nullable=False, default=5)
+    mode = db.Column(db.String(20), nullable=False, default='outline')
+    outline = db.Column(db.Text, nullable=True)
+    chapters_sent = db.Column(db.Integer, nullable=False, default=0)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    project = db.relationship('Project', backref=db.backref('jobs', lazy=True, cascade="all, delete-orphan"))
 
 class Assignment(db.Model):
     __tablename__ = 'assignments'
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     topic = db.Column(db.Text, nullable=False)
-    ai_response = db.Column(db.Text, nullable=True)
+    _ai_response = db.Column('ai_response', db.Text, nullable=True)
+    ai_response_hash = db.Column(db.String(64), db.ForeignKey('blobs.hash'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    ai_response = blob_text('_ai_response', 'ai_response_hash')
+    __table_args__ = (db.Index('ix_assignments_user_id_created_at', 'user_id', 'created_at'),)
+
+class AssignmentFingerprint(db.Model):
+    """Topic fingerprint of a generated assignment analysis (see bot.services.topic_index)."""
+    __tablename__ = 'assignment_fingerprints'
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignments.id', ondelete='CASCADE'), primary_key=True, autoincrement=False)
+    topic_hash = db.Column(db.String(64), nullable=False, index=True)
+    minhash = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class AssignmentBand(db.Model):
+    """One MinHash LSH band of an assignment topic; topics sharing a band are near-duplicate candidates."""
+    __tablename__ = 'assignment_bands'
+    band = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    assignment_id = db.Column(db.Integer, db.ForeignKey('assignments.id', ondelete='CASCADE'), primary_key=True, autoincrement=False)
+
+class HistoryEntry(db.Model):
+    """A past assignment or project chapter of a user, listed and searched by bot.services.history_search."""
+    __tablename__ = 'history_entries'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    ref_id = db.Column(db.Integer, nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    snippet = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    __table_args__ = (
+        db.Index('ix_history_entries_user_id_created_at', 'user_id', 'created_at', 'id'),
+        db.UniqueConstraint('kind', 'ref_id', name='uq_history_entries_kind_ref_id'),
+    )
+
+class DailyStat(db.Model):
+    """
+    Per-day rollup of one analytics metric (see bot.services.analytics): count
+    events and their summed amount, e.g. LLM calls and seconds per focus mode.
+    """
+    __tablename__ = 'daily_stats'
+    day = db.Column(db.Date, primary_key=True)
+    metric = db.Column(db.String(40), primary_key=True)
+    dimension = db.Column(db.String(40), primary_key=True)
+    count = db.Column(db.BigInteger, nullable=False, default=0)
+    total = db.Column(db.Float, nullable=False, default=0.0)
+
+class DailyActiveUser(db.Model):
+    """Telegram ids seen on a day, kept only long enough to count each user once per day."""
+    __tablename__ = 'daily_active_users'
+    day = db.Column(db.Date, primary_key=True)
+    telegram_id = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+
+class AnalyticsCounter(db.Model):
+    """All-time counters such as the number of users, so the admin panel never counts whole tables."""
+    __tablename__ = 'analytics_counters'
+    name = db.Column(db.String(40), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
 
 class CourseRequirement(db.Model):
     __tablename__ = 'course_requirements'
@@ -47,3 +217,57 @@ class CourseRequirement(db.Model):
     course_name = db.Column(db.String(100), unique=True, nullable=False)
     advice = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class BotState(db.Model):
+    """Pickled user_data / chat_data / bot_data, one row per user or chat (see bot.persistence)."""
+    __tablename__ = 'bot_state'
+    kind = db.Column(db.String(10), primary_key=True)
+    key = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class QueuedUpdate(db.Model):
+    """
+    Telegram updates received by webhook_app, waiting for a bot worker (see
+    bot.services.update_queue). Processed updates are kept for a while with
+    done_at set, so the unique update_id rejects redeliveries of them too.
+    """
+    __tablename__ = 'update_queue'
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    update_id = db.Column(db.BigInteger, nullable=False, unique=True)
+    shard = db.Column(db.Integer, nullable=False)
+    chat_id = db.Column(db.BigInteger, nullable=True)
+    payload = db.Column(db.Text, nullable=False)
+    claimed_by = db.Column(db.String(100), nullable=True)
+    claimed_at = db.Column(db.DateTime, nullable=True)
+    done_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    __table_args__ = (db.Index('ix_update_queue_shard_done_at_id', 'shard', 'done_at', 'id'),)
+
+class ConversationState(db.Model):
+    __tablename__ = 'conversation_states'
+    name = db.Column(db.String(100), primary_key=True)
+    key = db.Column(db.String(200), primary_key=True)
+    state = db.Column(db.Text, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+# (model, table, text attribute, hash column) of every blob-backed text
+BLOB_COLUMNS = [
+    (Assignment, 'assignments', 'ai_response', 'ai_response_hash'),
+    (ProjectChapter, 'project_chapters', 'content', 'content_hash'),
+]
+
+def add_hash_columns():
+    """
+    Adds the blob reference columns to tables created before the blob store
+    existed. Cheap when they exist, so it runs on every start.
+    """
+    inspector = db.inspect(db.engine)
+    for _, table, _, hash_column in BLOB_COLUMNS:
+        existing = {column['name'] for column in inspector.get_columns(table)}
+        if hash_column not in existing:
+            logger.info(f"Adding {table}.{hash_column}...")
+            db.session.execute(db.text(
+                f"ALTER TABLE {table} ADD COLUMN {hash_column} VARCHAR(64) REFERENCES blobs (hash)"
+            ))
+    db.session.commit()
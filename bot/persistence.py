@@ -0,0 +1,198 @@
+import asyncio
+import json
+import logging
+import pickle
+from datetime import datetime
+from telegram.ext import BasePersistence, PersistenceInput
+from bot.config import Config
+from bot.models import BotState, ConversationState, db
+from bot.services.database import run_db, upsert
+
+logger = logging.getLogger(__name__)
+
+BOT_DATA_KEY = 0
+
+class SQLPersistence(BasePersistence):
+    """
+    Stores user_data, chat_data, bot_data and conversation states as individual
+    rows in the application database.
+
+    Nothing is loaded up front: a user's or chat's data is read the first time
+    one of their updates is processed (refresh_user_data/refresh_chat_data).
+    Updates only mark keys dirty, and the dirty keys are written in one batch
+    shortly afterwards, so the cost of a flush depends on how many users were
+    active rather than on the size of the user base.
+
+    With PERSISTENCE_SHARED enabled, data is re-read whenever another process
+    has written a newer row, so several bot processes can share state.
+    """
+
+    def __init__(self, update_interval: float = Config.PERSISTENCE_UPDATE_INTERVAL, write_delay: float = Config.PERSISTENCE_WRITE_DELAY):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=True, chat_data=True, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.write_delay = write_delay
+        self.shared = Config.PERSISTENCE_SHARED
+        # (kind, key) -> updated_at of the row this process last read or wrote
+        self._versions = {}
+        # (kind, key) -> pickled data, or None to delete the row
+        self._dirty_state = {}
+        # (name, key) -> JSON-encoded state, or None to delete the row
+        self._dirty_conversations = {}
+        self._flush_task = None
+        # Keeps batches in order when a shutdown flush overlaps a scheduled one
+        self._write_lock = asyncio.Lock()
+
+    # --- Loading ---
+
+    def _read_state(self, kind: str, key: int, known_version=None):
+        query = db.session.query(BotState.updated_at).filter_by(kind=kind, key=key)
+        version = query.scalar()
+        if version is None or version == known_version:
+            return version, None
+        row = db.session.get(BotState, (kind, key))
+        return row.updated_at, pickle.loads(row.data)
+
+    async def _refresh(self, kind: str, key: int, data: dict):
+        if (kind, key) in self._dirty_state:
+            # Our copy is newer than the database until the next flush
+            return
+        if (kind, key) in self._versions and not self.shared:
+            return
+
+        version, stored = await run_db(self._read_state, kind, key, self._versions.get((kind, key)))
+        self._versions[(kind, key)] = version
+        if stored is not None:
+            data.clear()
+            data.update(stored)
+
+    def forget(self, kind: str, key: int):
+        """Marks a key as not loaded, so it is read from the database on next access."""
+        self._versions.pop((kind, key), None)
+
+    def is_dirty(self, kind: str, key: int) -> bool:
+        return (kind, key) in self._dirty_state
+
+    async def get_user_data(self):
+        return {}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        _, stored = await run_db(self._read_state, 'bot', BOT_DATA_KEY)
+        return stored or {}
+
+    async def get_callback_data(self):
+        return None
+
+    def _read_conversations(self, name: str):
+        rows = ConversationState.query.filter_by(name=name).all()
+        return {tuple(json.loads(row.key)): json.loads(row.state) for row in rows}
+
+    async def get_conversations(self, name: str):
+        return await run_db(self._read_conversations, name)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict):
+        await self._refresh('user', user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict):
+        await self._refresh('chat', chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data: dict):
+        pass
+
+    # --- Write-behind ---
+
+    def _mark(self, kind: str, key: int, data):
+        self._dirty_state[(kind, key)] = None if data is None else pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        self._schedule_flush()
+
+    async def update_user_data(self, user_id: int, data: dict):
+        self._mark('user', user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: dict):
+        self._mark('chat', chat_id, data)
+
+    async def update_bot_data(self, data: dict):
+        self._mark('bot', BOT_DATA_KEY, data)
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id: int):
+        self._mark('user', user_id, None)
+
+    async def drop_chat_data(self, chat_id: int):
+        self._mark('chat', chat_id, None)
+
+    async def update_conversation(self, name: str, key, new_state):
+        self._dirty_conversations[(name, json.dumps(list(key)))] = None if new_state is None else json.dumps(new_state)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        await asyncio.sleep(self.write_delay)
+        await asyncio.shield(self._write_dirty())
+
+    def _write_batch(self, states: dict, conversations: dict) -> datetime:
+        now = datetime.utcnow()
+        upsert(
+            BotState,
+            [
+                {"kind": kind, "key": key, "data": data, "updated_at": now}
+                for (kind, key), data in states.items() if data is not None
+            ],
+            index_elements=["kind", "key"],
+            update_columns=["data", "updated_at"],
+        )
+        for (kind, key), data in states.items():
+            if data is None:
+                BotState.query.filter_by(kind=kind, key=key).delete()
+
+        upsert(
+            ConversationState,
+            [
+                {"name": name, "key": key, "state": state, "updated_at": now}
+                for (name, key), state in conversations.items() if state is not None
+            ],
+            index_elements=["name", "key"],
+            update_columns=["state", "updated_at"],
+        )
+        for (name, key), state in conversations.items():
+            if state is None:
+                ConversationState.query.filter_by(name=name, key=key).delete()
+        db.session.commit()
+        return now
+
+    async def _write_dirty(self):
+        async with self._write_lock:
+            if not self._dirty_state and not self._dirty_conversations:
+                return
+            states, self._dirty_state = self._dirty_state, {}
+            conversations, self._dirty_conversations = self._dirty_conversations, {}
+            try:
+                written_at = await run_db(self._write_batch, states, conversations)
+            except Exception as e:
+                logger.error(f"Persisting {len(states)} states and {len(conversations)} conversations failed: {e}")
+                # Put the batch back unless a newer value arrived in the meantime
+                for key, value in states.items():
+                    self._dirty_state.setdefault(key, value)
+                for key, value in conversations.items():
+                    self._dirty_conversations.setdefault(key, value)
+                return
+
+        for key, data in states.items():
+            if data is None:
+                self._versions.pop(key, None)
+            else:
+                self._versions[key] = written_at
+
+    async def flush(self):
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        await self._write_dirty()
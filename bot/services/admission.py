@@ -0,0 +1,159 @@
+import asyncio
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, most urgent first
+INTERACTIVE = "interactive"
+STANDARD = "standard"
+BACKGROUND = "background"
+PRIORITY_ORDER = [INTERACTIVE, STANDARD, BACKGROUND]
+
+FOCUS_CLASSES = {
+    "tutor": INTERACTIVE,
+    "webSearch": INTERACTIVE,
+    "academic": STANDARD,
+    "summary": STANDARD,
+    "project_generator": BACKGROUND,
+}
+
+class Overloaded(Exception):
+    """Raised when a request is shed because its class queue is full or its deadline passed."""
+
+class PriorityClass:
+    def __init__(self, name: str, max_queue: int, deadline: float, max_active: int):
+        self.name = name
+        self.max_queue = max_queue
+        self.deadline = deadline
+        self.max_active = max_active
+        self.active = 0
+        self.waiters = deque()
+        self.admitted_total = 0
+        self.shed_total = 0
+
+class AdmissionController:
+    """
+    Hands out the LLM_MAX_CONCURRENCY upstream slots by priority class.
+    Freed slots go to the most urgent class with someone waiting. Each class
+    has a bounded queue and a queue-time deadline; requests that find the
+    queue full or wait past the deadline are shed with Overloaded. Background
+    work may only hold part of the slots so interactive requests always get in.
+    """
+
+    def __init__(self, capacity: int = Config.LLM_MAX_CONCURRENCY):
+        self.capacity = capacity
+        self.active = 0
+        self.classes = {
+            INTERACTIVE: PriorityClass(INTERACTIVE, Config.ADMISSION_INTERACTIVE_QUEUE, Config.ADMISSION_INTERACTIVE_DEADLINE, capacity),
+            STANDARD: PriorityClass(STANDARD, Config.ADMISSION_STANDARD_QUEUE, Config.ADMISSION_STANDARD_DEADLINE, capacity),
+            BACKGROUND: PriorityClass(
+                BACKGROUND,
+                Config.ADMISSION_BACKGROUND_QUEUE,
+                Config.ADMISSION_BACKGROUND_DEADLINE,
+                max(1, int(capacity * Config.ADMISSION_BACKGROUND_SHARE)),
+            ),
+        }
+
+    def stats(self) -> dict:
+        stats = {"active": self.active, "capacity": self.capacity}
+        for name, cls in self.classes.items():
+            stats[f"{name}_active"] = cls.active
+            stats[f"{name}_queued"] = len(cls.waiters)
+            stats[f"{name}_shed_total"] = cls.shed_total
+        return stats
+
+    def _can_start(self, cls: PriorityClass) -> bool:
+        return self.active < self.capacity and cls.active < cls.max_active
+
+    def _position(self, cls: PriorityClass) -> int:
+        """Queue position of a request joining cls now, counting more urgent classes."""
+        position = 1
+        for name in PRIORITY_ORDER:
+            position += len(self.classes[name].waiters)
+            if name == cls.name:
+                break
+        return position
+
+    def _grant(self, cls: PriorityClass):
+        self.active += 1
+        cls.active += 1
+        cls.admitted_total += 1
+
+    def _release(self, cls: PriorityClass):
+        self.active -= 1
+        cls.active -= 1
+        self._wake()
+
+    def _wake(self):
+        for name in PRIORITY_ORDER:
+            cls = self.classes[name]
+            while cls.waiters and self._can_start(cls):
+                waiter = cls.waiters.popleft()
+                if waiter.done():
+                    continue
+                self._grant(cls)
+                waiter.set_result(None)
+            if cls.waiters and self.active >= self.capacity:
+                return
+
+    def _shed(self, cls: PriorityClass, reason: str):
+        cls.shed_total += 1
+        logger.warning(f"Shedding {cls.name} LLM request: {reason}")
+        raise Overloaded(reason)
+
+    @asynccontextmanager
+    async def slot(self, focus_mode: str, on_queued=None):
+        """
+        Holds one upstream slot for the duration of the block. If the request
+        has to queue, on_queued (an async callable) is awaited with its position.
+        """
+        cls = self.classes[FOCUS_CLASSES.get(focus_mode, STANDARD)]
+
+        if self._can_start(cls) and not self._more_urgent_waiting(cls):
+            self._grant(cls)
+        else:
+            if len(cls.waiters) >= cls.max_queue:
+                self._shed(cls, f"{cls.name} queue is full")
+
+            waiter = asyncio.get_running_loop().create_future()
+            position = self._position(cls)
+            cls.waiters.append(waiter)
+            if on_queued is not None:
+                try:
+                    await on_queued(position)
+                except Exception as e:
+                    logger.warning(f"Queue notification failed: {e}")
+
+            try:
+                await asyncio.wait_for(waiter, cls.deadline)
+            except asyncio.TimeoutError:
+                self._forget_waiter(cls, waiter)
+                self._shed(cls, f"waited more than {cls.deadline:.0f}s in the {cls.name} queue")
+            except BaseException:
+                self._forget_waiter(cls, waiter)
+                raise
+
+        try:
+            yield
+        finally:
+            self._release(cls)
+
+    def _more_urgent_waiting(self, cls: PriorityClass) -> bool:
+        for name in PRIORITY_ORDER:
+            if self.classes[name].waiters:
+                return True
+            if name == cls.name:
+                return False
+        return False
+
+    def _forget_waiter(self, cls: PriorityClass, waiter: asyncio.Future):
+        if waiter.done() and not waiter.cancelled():
+            # The slot was granted just as we gave up on it
+            self._release(cls)
+        elif waiter in cls.waiters:
+            cls.waiters.remove(waiter)
+
+admission = AdmissionController()
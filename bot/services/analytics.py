@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from telegram import Update
+from telegram.ext import ContextTypes
+from bot.config import Config
+from bot.models import AnalyticsCounter, DailyActiveUser, DailyStat, User, db
+from bot.services.database import run_db, upsert
+
+logger = logging.getLogger(__name__)
+
+USERS_COUNTER = "users"
+# Handler modules that see every update rather than serving a feature
+TRACKING_MODULES = {"analytics", "session_manager"}
+INSERT_BATCH = 1000
+
+def _batches(rows: list):
+    for start in range(0, len(rows), INSERT_BATCH):
+        yield rows[start:start + INSERT_BATCH]
+
+def _seed_counters():
+    """Counts the users once, the first time analytics runs against a database."""
+    if db.session.get(AnalyticsCounter, USERS_COUNTER) is None:
+        upsert(AnalyticsCounter, [{"name": USERS_COUNTER, "value": User.query.count()}], ["name"])
+        db.session.commit()
+
+def _write(stats: dict, counters: dict, active: set):
+    """Adds one flush worth of events to the rollup tables in a single transaction."""
+    active_rows = [{"day": day, "telegram_id": telegram_id} for day, telegram_id in active]
+    for batch in _batches(active_rows):
+        # Only users not yet seen that day come back, so each is counted once per day
+        result = upsert(DailyActiveUser, batch, ["day", "telegram_id"], returning=[DailyActiveUser.day])
+        if result is not None:
+            for (day,) in result:
+                stats[(day, "active_users", "")][0] += 1
+
+    stat_rows = [
+        {"day": day, "metric": metric, "dimension": dimension, "count": count, "total": total}
+        for (day, metric, dimension), (count, total) in stats.items()
+    ]
+    for batch in _batches(stat_rows):
+        upsert(DailyStat, batch, ["day", "metric", "dimension"], increment_columns=["count", "total"])
+    if counters:
+        upsert(
+            AnalyticsCounter,
+            [{"name": name, "value": value} for name, value in counters.items()],
+            ["name"],
+            increment_columns=["value"],
+        )
+    # Yesterday is kept for updates that arrive around midnight
+    DailyActiveUser.query.filter(DailyActiveUser.day < datetime.utcnow().date() - timedelta(days=1)).delete()
+    db.session.commit()
+
+def load_overview(days: int = 7):
+    """Returns ({counter: value}, {(day, metric, dimension): (count, total)}) for the last days."""
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    counters = {row.name: row.value for row in AnalyticsCounter.query.all()}
+    stats = {
+        (row.day, row.metric, row.dimension): (row.count, row.total)
+        for row in DailyStat.query.filter(DailyStat.day >= since).all()
+    }
+    return counters, stats
+
+class Analytics:
+    """
+    Buffers usage events in memory and adds them to the daily_stats rollups
+    and analytics_counters every flush_interval seconds, one upsert per table.
+    Handlers never wait on analytics writes, and the admin panel reads a few
+    small rows instead of counting the users table. Recording is thread-safe.
+    """
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._stats = defaultdict(lambda: [0, 0.0])
+        self._counters = defaultdict(int)
+        self._active = set()
+        self._lock = threading.Lock()
+        self._task = None
+        self.flushes = 0
+        self.flush_errors = 0
+
+    def stats(self) -> dict:
+        return {
+            "buffered_keys": len(self._stats) + len(self._active),
+            "flushes_total": self.flushes,
+            "flush_errors_total": self.flush_errors,
+        }
+
+    def record(self, metric: str, dimension: str = "", amount: float = 0.0):
+        """Counts one event for today, adding amount (seconds, tokens, ...) to the day's total."""
+        key = (datetime.utcnow().date(), metric, dimension[:40])
+        with self._lock:
+            entry = self._stats[key]
+            entry[0] += 1
+            entry[1] += amount
+
+    def user_created(self):
+        self.record("new_users")
+        with self._lock:
+            self._counters[USERS_COUNTER] += 1
+
+    def record_llm(self, focus_mode: str, seconds: float, usage=None):
+        """One finished LLM call with its latency and, if reported, token usage."""
+        self.record("llm_calls", focus_mode, seconds)
+        if usage is not None:
+            self.record("llm_prompt_tokens", focus_mode, getattr(usage, "prompt_tokens", 0) or 0)
+            self.record("llm_completion_tokens", focus_mode, getattr(usage, "completion_tokens", 0) or 0)
+
+    def handler_called(self, name: str, seconds: float):
+        """Handler listener (see metrics.handler_listeners): requests per feature, by handler module."""
+        feature = name.split(".", 1)[0]
+        if feature not in TRACKING_MODULES:
+            self.record("requests", feature, seconds)
+
+    async def track_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Registered as a TypeHandler in an early group; sees every update."""
+        if update.effective_user:
+            with self._lock:
+                self._active.add((datetime.utcnow().date(), update.effective_user.id))
+
+    def _take(self):
+        with self._lock:
+            taken = self._stats, self._counters, self._active
+            self._stats = defaultdict(lambda: [0, 0.0])
+            self._counters = defaultdict(int)
+            self._active = set()
+        return taken
+
+    def _restore(self, stats: dict, counters: dict, active: set):
+        """Puts events back after a failed flush so they go out with the next one."""
+        with self._lock:
+            for key, (count, total) in stats.items():
+                if key[1] == "active_users":
+                    continue
+                entry = self._stats[key]
+                entry[0] += count
+                entry[1] += total
+            for name, value in counters.items():
+                self._counters[name] += value
+            self._active |= active
+
+    async def flush(self):
+        stats, counters, active = self._take()
+        if not stats and not counters and not active:
+            return
+        try:
+            await run_db(_write, stats, counters, active)
+            self.flushes += 1
+        except Exception as e:
+            self.flush_errors += 1
+            logger.error(f"Analytics flush failed: {e}")
+            self._restore(stats, counters, active)
+
+    async def start(self):
+        await run_db(_seed_counters)
+        self._task = asyncio.create_task(self._run(), name="analytics-flush")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+analytics = Analytics(flush_interval=Config.ANALYTICS_FLUSH_SECONDS)
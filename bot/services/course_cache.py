@@ -0,0 +1,119 @@
+import logging
+import re
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from bot.config import Config
+from bot.models import CourseRequirement, db
+from bot.services.database import run_db
+
+logger = logging.getLogger(__name__)
+
+# Common abbreviations students type, mapped to the canonical course name
+COURSE_ALIASES = {
+    "csc": "computer science",
+    "cs": "computer science",
+    "comp sci": "computer science",
+    "compsci": "computer science",
+    "mbbs": "medicine and surgery",
+    "medicine": "medicine and surgery",
+    "eee": "electrical and electronics engineering",
+    "elect elect": "electrical and electronics engineering",
+    "mech eng": "mechanical engineering",
+    "civil eng": "civil engineering",
+    "mass comm": "mass communication",
+    "bus admin": "business administration",
+    "acc": "accounting",
+    "econs": "economics",
+    "pol sci": "political science",
+    "biochem": "biochemistry",
+    "micro": "microbiology",
+    "pharm": "pharmacy",
+}
+
+DEGREE_PREFIX = re.compile(r"^(b ?sc|b ?eng|b ?tech|b ?a|degree in|bachelor of|bachelors? in)\s+")
+
+def normalize_course_name(course_name: str) -> str:
+    """Reduces a free-text course name to the key it is cached under."""
+    name = course_name.lower().replace("&", " and ")
+    name = re.sub(r"[^a-z0-9 ]+", " ", name)
+    name = " ".join(name.split())
+    name = DEGREE_PREFIX.sub("", name)
+    return COURSE_ALIASES.get(name, name)[:100]
+
+class CourseAdviceCache:
+    """Small in-process LRU with a TTL that sits in front of the course_requirements table."""
+
+    def __init__(self, max_size: int, ttl: timedelta):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        advice, stored_at = entry
+        if datetime.utcnow() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return advice
+
+    def put(self, key: str, advice: str, stored_at: datetime):
+        self._entries[key] = (advice, stored_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+course_cache = CourseAdviceCache(
+    max_size=Config.COURSE_CACHE_SIZE,
+    ttl=timedelta(hours=Config.COURSE_CACHE_TTL_HOURS),
+)
+
+def _load_advice(key: str):
+    row = CourseRequirement.query.filter_by(course_name=key).first()
+    if row is None or datetime.utcnow() - row.created_at > course_cache.ttl:
+        return None
+    return row.advice, row.created_at
+
+def _store_advice(key: str, advice: str, stored_at: datetime):
+    row = CourseRequirement.query.filter_by(course_name=key).first()
+    if row is None:
+        db.session.add(CourseRequirement(course_name=key, advice=advice, created_at=stored_at))
+    else:
+        row.advice = advice
+        row.created_at = stored_at
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another worker cached the same course first; theirs is just as fresh
+        db.session.rollback()
+
+async def get_course_advice(course_name: str):
+    """Returns cached advice for the course, or None if it is missing or expired."""
+    key = normalize_course_name(course_name)
+    advice = course_cache.get(key)
+    if advice is not None:
+        return advice
+
+    try:
+        row = await run_db(_load_advice, key)
+    except Exception as e:
+        logger.error(f"Course cache lookup failed for '{key}': {e}")
+        return None
+    if row is None:
+        return None
+
+    advice, stored_at = row
+    course_cache.put(key, advice, stored_at)
+    return advice
+
+async def save_course_advice(course_name: str, advice: str):
+    key = normalize_course_name(course_name)
+    stored_at = datetime.utcnow()
+    course_cache.put(key, advice, stored_at)
+    try:
+        await run_db(_store_advice, key, advice, stored_at)
+    except Exception as e:
+        logger.error(f"Course cache write failed for '{key}': {e}")
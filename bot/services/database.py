@@ -0,0 +1,76 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.dialects import postgresql, sqlite
+from bot import app
+from bot.config import Config
+from bot.models import db
+from bot.services.metrics import DB_SECONDS, DB_ERRORS
+
+# Blocking SQLAlchemy work runs here instead of on the event loop. The pool is
+# no larger than the connection pool, so threads never wait on a connection.
+db_executor = ThreadPoolExecutor(max_workers=Config.DB_THREADS, thread_name_prefix="db")
+
+def _run_in_session(fn, *args, **kwargs):
+    with app.app_context():
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.remove()
+
+async def run_db(fn, *args, **kwargs):
+    """
+    Runs fn(*args, **kwargs) on the database thread pool inside an app context,
+    with a session that is rolled back on error and removed afterwards. fn
+    should return plain values rather than ORM objects bound to that session.
+    """
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    try:
+        return await loop.run_in_executor(db_executor, functools.partial(_run_in_session, fn, *args, **kwargs))
+    except Exception:
+        DB_ERRORS.labels(fn.__name__).inc()
+        raise
+    finally:
+        DB_SECONDS.labels(fn.__name__).observe(time.perf_counter() - started)
+
+def upsert(model, rows: list, index_elements: list, update_columns: list = None, returning: list = None,
+           increment_columns: list = None):
+    """
+    Inserts rows, updating update_columns on rows whose index_elements already
+    exist (INSERT ... ON CONFLICT). increment_columns are instead added to the
+    existing values, for counters. Must be called inside an app context; the
+    caller commits. With `returning`, the result of the statement is returned
+    (None on databases without ON CONFLICT support).
+    """
+    if not rows:
+        return None
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        insert = postgresql.insert
+    elif dialect == "sqlite":
+        insert = sqlite.insert
+    else:
+        for row in rows:
+            existing = db.session.get(model, tuple(row[column] for column in index_elements)) if increment_columns else None
+            if existing is not None:
+                for column in increment_columns:
+                    row[column] += getattr(existing, column)
+            db.session.merge(model(**row))
+        return None
+
+    stmt = insert(model.__table__).values(rows)
+    if update_columns or increment_columns:
+        set_ = {column: stmt.excluded[column] for column in update_columns or []}
+        for column in increment_columns or []:
+            set_[column] = model.__table__.c[column] + stmt.excluded[column]
+        stmt = stmt.on_conflict_do_update(index_elements=index_elements, set_=set_)
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=index_elements)
+    if returning:
+        stmt = stmt.returning(*returning)
+    return db.session.execute(stmt)
@@ -0,0 +1,243 @@
+import hashlib
+import io
+import re
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
+from xml.sax.saxutils import escape
+from bot.config import Config
+
+# --- Static package parts ---
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    '</Types>'
+)
+
+PACKAGE_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/>'
+    '</Relationships>'
+)
+
+DOCUMENT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/>'
+    '</Relationships>'
+)
+
+def _style(style_id: str, name: str, size: int, bold: bool = False, spacing_before: int = 0, extra: str = "") -> str:
+    return (
+        f'<w:style w:type="paragraph" w:styleId="{style_id}"><w:name w:val="{name}"/>'
+        '<w:basedOn w:val="Normal"/><w:next w:val="Normal"/><w:qFormat/>'
+        f'<w:pPr><w:keepNext/><w:spacing w:before="{spacing_before}" w:after="120"/>{extra}</w:pPr>'
+        f'<w:rPr>{"<w:b/>" if bold else ""}<w:sz w:val="{size}"/></w:rPr></w:style>'
+    )
+
+STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<w:styles xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+    '<w:docDefaults><w:rPrDefault><w:rPr>'
+    '<w:rFonts w:ascii="Times New Roman" w:hAnsi="Times New Roman" w:cs="Times New Roman"/>'
+    '<w:sz w:val="24"/></w:rPr></w:rPrDefault>'
+    '<w:pPrDefault><w:pPr><w:spacing w:after="160" w:line="360" w:lineRule="auto"/><w:jc w:val="both"/></w:pPr></w:pPrDefault>'
+    '</w:docDefaults>'
+    '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/><w:qFormat/></w:style>'
+    + _style("Title", "Title", 36, bold=True, extra='<w:jc w:val="center"/>')
+    + _style("Heading1", "heading 1", 32, bold=True, spacing_before=240, extra='<w:jc w:val="center"/><w:outlineLvl w:val="0"/>')
+    + _style("Heading2", "heading 2", 28, bold=True, spacing_before=240, extra='<w:jc w:val="left"/><w:outlineLvl w:val="1"/>')
+    + _style("Heading3", "heading 3", 24, bold=True, spacing_before=200, extra='<w:jc w:val="left"/><w:outlineLvl w:val="2"/>')
+    + '<w:style w:type="paragraph" w:styleId="ListParagraph"><w:name w:val="List Paragraph"/><w:basedOn w:val="Normal"/>'
+    '<w:pPr><w:spacing w:after="60"/><w:ind w:left="720" w:hanging="360"/><w:jc w:val="left"/></w:pPr></w:style>'
+    '<w:style w:type="paragraph" w:styleId="Bibliography"><w:name w:val="Bibliography"/><w:basedOn w:val="Normal"/>'
+    '<w:pPr><w:ind w:left="720" w:hanging="720"/><w:jc w:val="left"/></w:pPr></w:style>'
+    '</w:styles>'
+)
+
+DOCUMENT_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"><w:body>'
+)
+DOCUMENT_END = (
+    '<w:sectPr><w:pgSz w:w="11906" w:h="16838"/>'
+    '<w:pgMar w:top="1440" w:right="1440" w:bottom="1440" w:left="1440" w:header="708" w:footer="708" w:gutter="0"/>'
+    '</w:sectPr></w:body></w:document>'
+)
+PAGE_BREAK = '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+
+# --- Markdown to WordprocessingML ---
+
+HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*$")
+BULLET = re.compile(r"^\s*[-*+•]\s+(.*)$")
+NUMBERED = re.compile(r"^\s*(\d+[.)])\s+(.*)$")
+RULE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+# Underscore emphasis needs non-word characters on both sides, so x_1 stays as written
+INLINE = re.compile(
+    r"\*\*(?P<bold>.+?)\*\*"
+    r"|(?<!\w)__(?P<bold_underscore>.+?)__(?!\w)"
+    r"|\*(?P<italic>[^*\s][^*]*?)\*"
+    r"|(?<!\w)_(?P<italic_underscore>[^_\s][^_]*?)_(?!\w)"
+    r"|`(?P<code>[^`]+)`"
+    r"|\[(?P<label>[^\]]+)\]\((?P<url>[^)]+)\)"
+)
+REFERENCES_HEADING = re.compile(r"^(references|bibliography|works cited)\b", re.IGNORECASE)
+# Characters XML 1.0 does not allow, which occasionally appear in model output
+INVALID_XML = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+def _run(text: str, bold: bool = False, italic: bool = False, code: bool = False) -> str:
+    props = ""
+    if bold:
+        props += "<w:b/>"
+    if italic:
+        props += "<w:i/>"
+    if code:
+        props += '<w:rFonts w:ascii="Courier New" w:hAnsi="Courier New"/>'
+    text = escape(INVALID_XML.sub("", text))
+    return f'<w:r>{f"<w:rPr>{props}</w:rPr>" if props else ""}<w:t xml:space="preserve">{text}</w:t></w:r>'
+
+def _marker(text: str) -> str:
+    """List bullet or number followed by a tab to the hanging indent."""
+    return f'<w:r><w:t xml:space="preserve">{escape(text)}</w:t><w:tab/></w:r>'
+
+def inline_runs(text: str, bold: bool = False) -> str:
+    """Converts **bold**, *italic*, `code` and [links](url) in one line to runs."""
+    runs = []
+    position = 0
+    for match in INLINE.finditer(text):
+        # Text between matches, including unclosed markers, is kept as written
+        if match.start() > position:
+            runs.append(_run(text[position:match.start()], bold=bold))
+        position = match.end()
+        strong = match["bold"] or match["bold_underscore"]
+        emphasis = match["italic"] or match["italic_underscore"]
+        if strong:
+            runs.append(_run(strong, bold=True))
+        elif emphasis:
+            runs.append(_run(emphasis, bold=bold, italic=True))
+        elif match["code"]:
+            runs.append(_run(match["code"], bold=bold, code=True))
+        else:
+            runs.append(_run(f"{match['label']} ({match['url']})", bold=bold))
+    if position < len(text):
+        runs.append(_run(text[position:], bold=bold))
+    return "".join(runs)
+
+def _paragraph(runs: str, style: str = None) -> str:
+    props = f'<w:pPr><w:pStyle w:val="{style}"/></w:pPr>' if style else ""
+    return f"<w:p>{props}{runs}</w:p>"
+
+def render_markdown(markdown: str) -> str:
+    """Returns the <w:p> elements for a chapter written in Markdown."""
+    paragraphs = []
+    in_references = False
+    for line in markdown.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith("```") or RULE.match(stripped):
+            continue
+
+        heading = HEADING.match(stripped)
+        if heading:
+            level = min(len(heading.group(1)), 3)
+            text = heading.group(2).strip("*_ ")
+            in_references = bool(REFERENCES_HEADING.match(text))
+            paragraphs.append(_paragraph(inline_runs(text), f"Heading{level}"))
+            continue
+
+        # A bold line on its own, e.g. "**REFERENCES**", also starts a section
+        plain = stripped.strip("*_: ")
+        if REFERENCES_HEADING.match(plain) and len(plain) < 30:
+            in_references = True
+            paragraphs.append(_paragraph(inline_runs(plain), "Heading2"))
+            continue
+
+        bullet = BULLET.match(line)
+        numbered = NUMBERED.match(line)
+        if in_references:
+            text = bullet.group(1) if bullet else stripped
+            paragraphs.append(_paragraph(inline_runs(text), "Bibliography"))
+        elif bullet:
+            paragraphs.append(_paragraph(_marker("•") + inline_runs(bullet.group(1)), "ListParagraph"))
+        elif numbered:
+            paragraphs.append(_paragraph(_marker(numbered.group(1)) + inline_runs(numbered.group(2)), "ListParagraph"))
+        else:
+            paragraphs.append(_paragraph(inline_runs(stripped)))
+    return "".join(paragraphs)
+
+class RenderCache:
+    """Rendered chapter XML keyed by a hash of the Markdown, bounded by total size."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def render(self, markdown: str) -> str:
+        key = hashlib.sha256(markdown.encode("utf-8")).hexdigest()
+        with self._lock:
+            xml = self._entries.get(key)
+            if xml is not None:
+                self._entries.move_to_end(key)
+                return xml
+
+        xml = render_markdown(markdown)
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = xml
+                self._bytes += len(xml)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+        return xml
+
+render_cache = RenderCache(Config.DOCX_CACHE_MB * 1024 * 1024)
+
+def _write_package(target, bodies):
+    """Writes a .docx to target; bodies yields the document body XML piece by piece."""
+    with zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as package:
+        package.writestr("[Content_Types].xml", CONTENT_TYPES)
+        package.writestr("_rels/.rels", PACKAGE_RELS)
+        package.writestr("word/_rels/document.xml.rels", DOCUMENT_RELS)
+        package.writestr("word/styles.xml", STYLES)
+        with package.open("word/document.xml", "w") as document:
+            document.write(DOCUMENT_START.encode("utf-8"))
+            for body in bodies:
+                document.write(body.encode("utf-8"))
+            document.write(DOCUMENT_END.encode("utf-8"))
+
+def render_chapter(content: str) -> bytes:
+    """A .docx holding one chapter."""
+    buffer = io.BytesIO()
+    _write_package(buffer, [render_cache.render(content)])
+    return buffer.getvalue()
+
+def compile_project(title: str, chapters: list):
+    """
+    Streams the whole project (a title page, then each chapter on a new page)
+    into a spooled temporary file, which is returned rewound. chapters is a list
+    of Markdown strings in order. The caller closes the file.
+    """
+    def bodies():
+        yield _paragraph(inline_runs(title), "Title")
+        for content in chapters:
+            yield PAGE_BREAK
+            yield render_cache.render(content)
+
+    spool = tempfile.SpooledTemporaryFile(max_size=Config.DOCX_SPOOL_MB * 1024 * 1024)
+    _write_package(spool, bodies())
+    spool.seek(0)
+    return spool
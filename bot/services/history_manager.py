@@ -0,0 +1,88 @@
+import logging
+from bot.config import Config
+from bot.services.perplexica_service import query_perplexica, get_system_prompt, is_complete_answer, ERROR_MESSAGE, BUSY_MESSAGE
+
+logger = logging.getLogger(__name__)
+
+# Token budget for the whole prompt (system prompt + history + new question)
+PROMPT_BUDGETS = {
+    "tutor": 6000,
+    "academic": 6000,
+    "webSearch": 3000,
+    "project_generator": 12000,
+}
+DEFAULT_PROMPT_BUDGET = 4000
+
+# Rough per-message overhead of the chat format
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = (
+    "Update the running summary of a study session between a student and an AI assistant. "
+    "Keep the subject, the student's level and goals, what has already been explained, and any open questions. "
+    "Reply with the updated summary only, in at most 200 words.\n\n"
+    "CURRENT SUMMARY:\n{summary}\n\nNEW EXCHANGES:\n{exchanges}"
+)
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (about four characters per token for English text)."""
+    return len(text) // 4 + 1
+
+def messages_tokens(messages: list) -> int:
+    return sum(estimate_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+def record_turn(user_data: dict, question: str, answer: str):
+    """Adds an exchange to the history; error, busy and cut-off answers are left out."""
+    if not is_complete_answer(answer):
+        return
+    history = user_data.setdefault('history', [])
+    history.append({"role": "user", "content": question})
+    history.append({"role": "assistant", "content": answer})
+
+async def summarize(summary: str, folded: list) -> str:
+    exchanges = "\n".join(f"{m['role'].upper()}: {m['content']}" for m in folded)
+    prompt = SUMMARY_PROMPT.format(summary=summary or "(none yet)", exchanges=exchanges)
+    new_summary = await query_perplexica(prompt, focus_mode="summary")
+    if new_summary in (ERROR_MESSAGE, BUSY_MESSAGE):
+        # Keep the session going with a crude summary rather than dropping context
+        logger.warning("History summarization failed; falling back to truncation")
+        new_summary = f"{summary}\n{exchanges}".strip()[-2000:]
+    return new_summary
+
+async def prepare_history(user_data: dict, focus_mode: str, query: str = "") -> list:
+    """
+    Returns the history to send with the next request. The last
+    HISTORY_KEEP_TURNS turns are kept verbatim; older turns are folded into a
+    running summary stored in user_data['history_summary'], which is only
+    extended with newly folded turns. The result fits the focus mode's budget.
+    """
+    history = user_data.get('history', [])
+    summary = user_data.get('history_summary', "")
+    budget = PROMPT_BUDGETS.get(focus_mode, DEFAULT_PROMPT_BUDGET)
+    budget -= estimate_tokens(get_system_prompt(focus_mode)) + estimate_tokens(query) + 2 * MESSAGE_OVERHEAD_TOKENS
+
+    keep = Config.HISTORY_KEEP_TURNS * 2
+    fold_count = max(0, len(history) - keep)
+    while len(history) - fold_count > 2 and (
+        messages_tokens(history[fold_count:]) + estimate_tokens(summary) > budget
+    ):
+        fold_count += 2
+
+    if fold_count:
+        summary = await summarize(summary, history[:fold_count])
+        history = history[fold_count:]
+        user_data['history'] = history
+        user_data['history_summary'] = summary
+
+    messages = []
+    if summary:
+        messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+    messages.extend(history)
+
+    # A single very long turn can still be over budget; trim it from the front
+    overflow = messages_tokens(messages) - budget
+    if overflow > 0 and history:
+        oldest = messages[-len(history)]
+        cut = min(len(oldest["content"]), overflow * 4)
+        messages[-len(history)] = {"role": oldest["role"], "content": "…" + oldest["content"][cut:]}
+
+    return messages
@@ -0,0 +1,115 @@
+import logging
+import re
+from datetime import datetime
+from sqlalchemy import inspect, or_, text, tuple_
+from bot.models import Assignment, HistoryEntry, ProjectChapter, db
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 8
+SNIPPET_LENGTH = 160
+
+ASSIGNMENT = "assignment"
+CHAPTER = "chapter"
+
+def setup_search_index():
+    """
+    Creates the full-text index if it is missing: a weighted tsvector column
+    with a GIN index on PostgreSQL, an FTS5 table keyed by entry id on SQLite.
+    Cheap when the index exists, so it runs on every start.
+    """
+    dialect = db.engine.dialect.name
+    inspector = inspect(db.engine)
+    if dialect == "postgresql":
+        if "search_vector" not in {column["name"] for column in inspector.get_columns("history_entries")}:
+            logger.info("Creating the history full-text index...")
+            db.session.execute(text("ALTER TABLE history_entries ADD COLUMN IF NOT EXISTS search_vector tsvector"))
+            db.session.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_history_entries_search_vector "
+                "ON history_entries USING GIN (search_vector)"
+            ))
+    elif dialect == "sqlite":
+        if "history_fts" not in inspector.get_table_names():
+            logger.info("Creating the history full-text index...")
+            db.session.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(title, body, tokenize='porter unicode61')"
+            ))
+    db.session.commit()
+
+def make_snippet(body: str) -> str:
+    plain = " ".join(re.sub(r"[#*_`>|]+", " ", body).split())
+    return plain if len(plain) <= SNIPPET_LENGTH else plain[:SNIPPET_LENGTH - 1].rsplit(" ", 1)[0] + "…"
+
+def _index_text(entry_id: int, title: str, body: str):
+    dialect = db.session.get_bind().dialect.name
+    params = {"id": entry_id, "title": title, "body": body}
+    if dialect == "postgresql":
+        db.session.execute(text(
+            "UPDATE history_entries SET search_vector = "
+            "setweight(to_tsvector('english', :title), 'A') || to_tsvector('english', :body) WHERE id = :id"
+        ), params)
+    elif dialect == "sqlite":
+        db.session.execute(text("DELETE FROM history_fts WHERE rowid = :id"), params)
+        db.session.execute(text("INSERT INTO history_fts (rowid, title, body) VALUES (:id, :title, :body)"), params)
+
+def index_entry(user_id: int, kind: str, ref_id: int, title: str, body: str, created_at: datetime = None):
+    """Adds or refreshes the history entry of an assignment or chapter. The caller commits."""
+    entry = HistoryEntry.query.filter_by(kind=kind, ref_id=ref_id).first()
+    if entry is None:
+        entry = HistoryEntry(user_id=user_id, kind=kind, ref_id=ref_id, created_at=created_at or datetime.utcnow())
+        db.session.add(entry)
+    entry.title = title[:200]
+    entry.snippet = make_snippet(body or "")
+    db.session.flush()
+    _index_text(entry.id, entry.title, body or "")
+
+def _match(search: str):
+    """A filter on HistoryEntry for the words in search, using the dialect's text index."""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == "postgresql":
+        return text(
+            "history_entries.search_vector @@ websearch_to_tsquery('english', :search)"
+        ).bindparams(search=search)
+    words = re.findall(r"\w+", search)
+    if dialect == "sqlite":
+        # Quoted terms, so user input is never parsed as FTS5 query syntax
+        return text(
+            "history_entries.id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH :search)"
+        ).bindparams(search=" ".join(f'"{word}"' for word in words))
+    return or_(*(HistoryEntry.title.ilike(f"%{word}%") for word in words))
+
+def list_entries(user_id: int, search: str = None, before: int = None, limit: int = PAGE_SIZE):
+    """
+    One page of the user's history, newest first, optionally restricted to
+    entries matching search. Pages are keyset-paginated: before is the id of
+    the last entry of the previous page. Returns (entries, has_more).
+    """
+    query = HistoryEntry.query.filter(HistoryEntry.user_id == user_id)
+    if search is not None:
+        if not re.search(r"\w", search):
+            return [], False
+        query = query.filter(_match(search))
+    if before is not None:
+        cursor = db.session.get(HistoryEntry, before)
+        if cursor is None or cursor.user_id != user_id:
+            return [], False
+        query = query.filter(tuple_(HistoryEntry.created_at, HistoryEntry.id) < tuple_(cursor.created_at, cursor.id))
+
+    rows = query.order_by(HistoryEntry.created_at.desc(), HistoryEntry.id.desc()).limit(limit + 1).all()
+    entries = [(row.id, row.kind, row.title, row.snippet, row.created_at) for row in rows[:limit]]
+    return entries, len(rows) > limit
+
+def load_entry(user_id: int, entry_id: int):
+    """Returns (title, full text) of one of the user's history entries, or None."""
+    entry = db.session.get(HistoryEntry, entry_id)
+    if entry is None or entry.user_id != user_id:
+        return None
+    if entry.kind == ASSIGNMENT:
+        source = db.session.get(Assignment, entry.ref_id)
+        body = source.ai_response if source else None
+    else:
+        source = db.session.get(ProjectChapter, entry.ref_id)
+        body = source.content if source else None
+    if body is None:
+        return None
+    return entry.title, body
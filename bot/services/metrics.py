@@ -0,0 +1,123 @@
+import functools
+import logging
+import random
+import time
+from prometheus_client import Counter, Histogram, REGISTRY, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from telegram.ext import ConversationHandler
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+DB_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Time spent in each update handler", ["handler"], buckets=LATENCY_BUCKETS)
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Exceptions raised by update handlers", ["handler"])
+
+LLM_REQUESTS = Counter("bot_llm_requests_total", "query_perplexica/stream_perplexica calls", ["focus_mode", "kind"])
+LLM_FIRST_TOKEN_SECONDS = Histogram("bot_llm_first_token_seconds", "Time to the first streamed token", ["focus_mode", "model"], buckets=LATENCY_BUCKETS)
+LLM_SECONDS = Histogram("bot_llm_seconds", "Total upstream LLM call time", ["focus_mode", "model"], buckets=LATENCY_BUCKETS)
+LLM_TOKENS = Counter("bot_llm_tokens_total", "Tokens used by LLM calls", ["focus_mode", "type"])
+LLM_ERRORS = Counter("bot_llm_errors_total", "Failed upstream LLM calls", ["model", "error"])
+LLM_RETRIES = Counter("bot_llm_retries_total", "LLM retries and fallbacks", ["model", "action"])
+
+DB_SECONDS = Histogram("bot_db_seconds", "Time spent in run_db calls, including the wait for a thread", ["function"], buckets=DB_BUCKETS)
+DB_ERRORS = Counter("bot_db_errors_total", "run_db calls that raised", ["function"])
+
+def record_usage(focus_mode: str, usage):
+    """Adds the prompt/completion token counts of an API usage object, if there is one."""
+    if usage is None:
+        return
+    LLM_TOKENS.labels(focus_mode, "prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+    LLM_TOKENS.labels(focus_mode, "completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+
+class StatsCollector:
+    """
+    Exposes the stats() dicts of in-process services (outbound queue,
+    sessions, admission control, caches) as gauges, or counters for keys
+    ending in _total.
+    """
+
+    def __init__(self):
+        self.sources = {}
+
+    def add(self, name: str, stats):
+        self.sources[name] = stats
+
+    def collect(self):
+        for name, stats in self.sources.items():
+            try:
+                values = stats()
+            except Exception as e:
+                logger.warning(f"Could not collect {name} stats: {e}")
+                continue
+            for key, value in values.items():
+                metric = f"bot_{name}_{key}"
+                if key.endswith("_total"):
+                    family = CounterMetricFamily(metric[:-len("_total")], f"{name} {key}")
+                else:
+                    family = GaugeMetricFamily(metric, f"{name} {key}")
+                family.add_metric([], value)
+                yield family
+
+stats_collector = StatsCollector()
+REGISTRY.register(stats_collector)
+
+# Called with (handler name, seconds) after every instrumented handler, e.g. by analytics
+handler_listeners = []
+
+def handler_name(callback) -> str:
+    return f"{callback.__module__.rsplit('.', 1)[-1]}.{callback.__name__}"
+
+def trace_slow_update(name: str, update, seconds: float):
+    if Config.TRACE_SLOW_SECONDS <= 0 or seconds < Config.TRACE_SLOW_SECONDS:
+        return
+    if random.random() >= Config.TRACE_SAMPLE_RATE:
+        return
+    user = getattr(update, "effective_user", None)
+    chat = getattr(update, "effective_chat", None)
+    logger.warning(
+        f"Slow update: handler={name} seconds={seconds:.2f} update_id={getattr(update, 'update_id', None)} "
+        f"user={user.id if user else None} chat={chat.id if chat else None}"
+    )
+
+def timed_callback(callback):
+    name = handler_name(callback)
+
+    @functools.wraps(callback)
+    async def wrapper(update, context, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await callback(update, context, *args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.labels(name).inc()
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            HANDLER_SECONDS.labels(name).observe(seconds)
+            trace_slow_update(name, update, seconds)
+            for listener in handler_listeners:
+                listener(name, seconds)
+
+    wrapper.instrumented = True
+    return wrapper
+
+def instrument_handler(handler):
+    """Wraps the callback of handler, or of every handler inside a ConversationHandler."""
+    if isinstance(handler, ConversationHandler):
+        nested = list(handler.entry_points) + list(handler.fallbacks)
+        for state_handlers in handler.states.values():
+            nested.extend(state_handlers)
+        for inner in nested:
+            instrument_handler(inner)
+    elif not getattr(handler.callback, "instrumented", False):
+        handler.callback = timed_callback(handler.callback)
+
+def start_metrics_server():
+    """Serves /metrics on METRICS_PORT (offset by the shard number in worker mode)."""
+    if Config.METRICS_PORT <= 0:
+        return
+    port = Config.METRICS_PORT + (Config.WORKER_SHARD if Config.BOT_MODE == "worker" else 0)
+    start_http_server(port, addr=Config.METRICS_ADDR)
+    logger.info(f"Metrics available on http://{Config.METRICS_ADDR}:{port}/metrics")
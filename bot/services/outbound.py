@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes, passed to bot methods as rate_limit_args. Interactive
+# replies are the default; bulk sends wait while an interactive send is
+# waiting for the global bucket.
+INTERACTIVE_PRIORITY = 0
+BULK_PRIORITY = 1
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def delay(self) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def is_idle(self) -> bool:
+        return self.delay() == 0.0 and self.tokens >= self.capacity
+
+class OutboundScheduler(BaseRateLimiter):
+    """
+    Rate limiter for every Bot API call the application makes. Calls that
+    target a chat take a token from a global bucket (about 30 msg/s) and one
+    from the chat's own bucket (about 1 msg/s, 20 msg/min for groups). Edits
+    and deletes have a separate per-chat bucket, so streaming an answer does
+    not hold up the chat's messages. When the global bucket runs out, bulk
+    sends wait behind interactive ones, and RetryAfter answers pause the
+    chat and retry the call.
+    """
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(Config.OUTBOUND_GLOBAL_RATE, Config.OUTBOUND_GLOBAL_RATE)
+        self.chat_buckets = {}
+        self.max_retries = Config.OUTBOUND_MAX_RETRIES
+        self.waiting = {INTERACTIVE_PRIORITY: 0, BULK_PRIORITY: 0}
+        # Senders whose chat bucket is ready but the global one is not
+        self.global_waiting = {INTERACTIVE_PRIORITY: 0, BULK_PRIORITY: 0}
+        self.sent_total = 0
+        self.retry_after_total = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "interactive_queue_depth": self.waiting[INTERACTIVE_PRIORITY],
+            "bulk_queue_depth": self.waiting[BULK_PRIORITY],
+            "chat_buckets": len(self.chat_buckets),
+            "sent_total": self.sent_total,
+            "retry_after_total": self.retry_after_total,
+        }
+
+    def _chat_bucket(self, chat_id, edit: bool = False) -> TokenBucket:
+        bucket = self.chat_buckets.get((chat_id, edit))
+        if bucket is None:
+            if len(self.chat_buckets) > Config.OUTBOUND_MAX_CHAT_BUCKETS:
+                self.chat_buckets = {k: b for k, b in self.chat_buckets.items() if not b.is_idle()}
+            is_group = isinstance(chat_id, str) or (isinstance(chat_id, int) and chat_id < 0)
+            if edit:
+                rate = Config.OUTBOUND_EDIT_RATE
+            else:
+                rate = Config.OUTBOUND_GROUP_RATE if is_group else Config.OUTBOUND_CHAT_RATE
+            bucket = TokenBucket(rate, Config.OUTBOUND_CHAT_BURST)
+            self.chat_buckets[(chat_id, edit)] = bucket
+        return bucket
+
+    async def _acquire(self, chat_id, priority: int, edit: bool):
+        self.waiting[priority] += 1
+        try:
+            while True:
+                if priority == BULK_PRIORITY and self.global_waiting[INTERACTIVE_PRIORITY]:
+                    await asyncio.sleep(0.05)
+                    continue
+                chat_bucket = self._chat_bucket(chat_id, edit)
+                chat_wait = chat_bucket.delay()
+                if chat_wait > 0:
+                    await asyncio.sleep(chat_wait)
+                    continue
+                global_wait = self.global_bucket.delay()
+                if global_wait <= 0:
+                    self.global_bucket.take()
+                    chat_bucket.take()
+                    return
+                self.global_waiting[priority] += 1
+                try:
+                    await asyncio.sleep(global_wait)
+                finally:
+                    self.global_waiting[priority] -= 1
+        finally:
+            self.waiting[priority] -= 1
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        priority = rate_limit_args if rate_limit_args in self.waiting else INTERACTIVE_PRIORITY
+        edit = endpoint.startswith(("edit", "delete"))
+
+        for attempt in range(self.max_retries + 1):
+            if chat_id is not None:
+                await self._acquire(chat_id, priority, edit)
+            try:
+                result = await callback(*args, **kwargs)
+                self.sent_total += 1
+                return result
+            except RetryAfter as e:
+                self.retry_after_total += 1
+                delay = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else float(e.retry_after)
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(f"Flood limit on {endpoint} for chat {chat_id}; retrying in {delay}s")
+                if chat_id is not None:
+                    # Flood control covers the whole chat, edits included
+                    self._chat_bucket(chat_id).pause(delay)
+                    self._chat_bucket(chat_id, edit=True).pause(delay)
+                else:
+                    await asyncio.sleep(delay)
+
+outbound_scheduler = OutboundScheduler()
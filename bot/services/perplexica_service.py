@@ -1,10 +1,55 @@
+import asyncio
+import hashlib
+import json
 import logging
-from groq import Groq
+import random
+import time
+import httpx
+from groq import AsyncGroq, APIConnectionError, APIStatusError, RateLimitError
 from bot.config import Config
+from bot.services.admission import admission, Overloaded
+from bot.services.metrics import (
+    LLM_REQUESTS, LLM_FIRST_TOKEN_SECONDS, LLM_SECONDS, LLM_ERRORS, LLM_RETRIES, record_usage
+)
+from bot.services.analytics import analytics
 
 logger = logging.getLogger(__name__)
 
-groq_client = Groq(api_key=Config.GROQ_API_KEY)
+# A single keep-alive connection pool shared by every handler
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=Config.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=Config.LLM_MAX_CONNECTIONS,
+    ),
+    timeout=httpx.Timeout(Config.LLM_TIMEOUT, connect=10.0),
+)
+
+groq_client = AsyncGroq(
+    api_key=Config.GROQ_API_KEY,
+    base_url=Config.GROQ_BASE_URL,
+    http_client=http_client,
+    timeout=Config.LLM_TIMEOUT,
+    # Retries and fallbacks are handled by _call_with_fallback
+    max_retries=0,
+)
+
+# Models tried for each focus mode, in order. Later entries are fallbacks
+# and the second entry is also the hedge target.
+PRIMARY_MODEL = "llama-3.3-70b-versatile"
+FAST_MODEL = "llama-3.1-8b-instant"
+
+MODEL_ROUTES = {
+    "tutor": [PRIMARY_MODEL, FAST_MODEL],
+    "academic": [PRIMARY_MODEL, FAST_MODEL],
+    "webSearch": [FAST_MODEL, PRIMARY_MODEL],
+    "summary": [FAST_MODEL, PRIMARY_MODEL],
+    "project_generator": [PRIMARY_MODEL, FAST_MODEL],
+}
+DEFAULT_ROUTE = [PRIMARY_MODEL, FAST_MODEL]
+
+# Upstream calls currently running, keyed by request_key(), so identical
+# concurrent requests can share one call
+inflight_requests = {}
 
 def get_system_prompt(focus_mode: str) -> str:
     if focus_mode == "project_generator":
@@ -29,22 +74,233 @@ When a student requests a subject, follow this structure:
         
     return "You are a helpful AI assistant."
 
-async def query_perplexica(query: str, focus_mode: str, history: list = None) -> str:
+async def close_llm_client():
+    """Closes the shared connection pool. Called once on application shutdown."""
+    await groq_client.close()
+
+ERROR_MESSAGE = "Sorry, the AI service is temporarily unavailable. Please try again."
+BUSY_MESSAGE = "🚦 The AI service is very busy right now. Please try again in a few minutes."
+CUT_OFF_MESSAGE = "\n\n⚠️ The answer was cut off. Please try again."
+
+def is_complete_answer(answer: str) -> bool:
+    """False for empty, failed or truncated answers, which must not be cached or reused."""
+    return bool(answer.strip()) and answer not in (ERROR_MESSAGE, BUSY_MESSAGE) and not answer.endswith(CUT_OFF_MESSAGE)
+
+def build_messages(query: str, focus_mode: str, history: list = None) -> list:
     if history is None:
         history = []
-        
+
     system_prompt = get_system_prompt(focus_mode)
-    
+
     messages = [{"role": "system", "content": system_prompt}]
     messages.extend(history)
     messages.append({"role": "user", "content": query})
+    return messages
+
+def request_key(query: str, focus_mode: str, history: list = None) -> tuple:
+    normalized_query = " ".join(query.split()).casefold()
+    history_hash = hashlib.sha256(
+        json.dumps(history or [], sort_keys=True, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+    return (focus_mode, normalized_query, history_hash)
+
+def backoff_delay(attempt: int, error: Exception) -> float:
+    """Full-jitter exponential backoff, or the server's Retry-After when it sends one."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), Config.LLM_RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+    return random.uniform(0, min(Config.LLM_RETRY_MAX_DELAY, Config.LLM_RETRY_BASE_DELAY * 2 ** attempt))
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (RateLimitError, APIConnectionError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+async def _call_with_fallback(route: list, call):
+    """
+    Awaits call(model) for each model in route until one succeeds. Rate limits
+    move straight on to the next model; 5xx and connection errors are retried
+    on the same model with jittered backoff first. Other errors are raised.
+    """
+    last_error = None
+    for index, model in enumerate(route):
+        has_fallback = index < len(route) - 1
+        for attempt in range(Config.LLM_MAX_RETRIES + 1):
+            try:
+                return await call(model)
+            except Exception as e:
+                LLM_ERRORS.labels(model, type(e).__name__).inc()
+                if not is_retryable(e):
+                    raise
+                last_error = e
+                if isinstance(e, RateLimitError) and has_fallback:
+                    logger.warning(f"{model} is rate limited, falling back to {route[index + 1]}")
+                    LLM_RETRIES.labels(model, "fallback").inc()
+                    break
+                if attempt == Config.LLM_MAX_RETRIES:
+                    logger.warning(f"{model} failed after {attempt + 1} attempts: {e}")
+                    if has_fallback:
+                        LLM_RETRIES.labels(model, "fallback").inc()
+                    break
+                LLM_RETRIES.labels(model, "retry").inc()
+                delay = backoff_delay(attempt, e)
+                logger.warning(f"{model} failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+    raise last_error
+
+async def _hedged(route: list, call, discard=None):
+    """
+    Runs _call_with_fallback, and if it has not finished after LLM_HEDGE_AFTER
+    seconds (and there is spare upstream capacity) races it against the same
+    request on the next model in the route. The loser is cancelled; discard is
+    called with the result of a loser that finished anyway.
+    """
+    primary = asyncio.ensure_future(_call_with_fallback(route, call))
+    if Config.LLM_HEDGE_AFTER <= 0 or len(route) < 2:
+        return await primary
 
+    done, _ = await asyncio.wait({primary}, timeout=Config.LLM_HEDGE_AFTER)
+    if done or admission.active >= admission.capacity:
+        return await primary
+
+    logger.info(f"Hedging slow {route[0]} request with {route[1]}")
+    LLM_RETRIES.labels(route[0], "hedge").inc()
+    hedge = asyncio.ensure_future(_call_with_fallback(route[1:], call))
+    pending = {primary, hedge}
+    winner = None
     try:
-        groq_response = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=messages
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    continue
+                if winner is None:
+                    winner = task
+                elif discard is not None:
+                    await discard(task.result())
+    finally:
+        for task in pending:
+            task.cancel()
+    if winner is None:
+        raise primary.exception()
+    return winner.result()
+
+async def _complete(messages: list, focus_mode: str, timeout: float = None, on_queued=None) -> str:
+    async def call(model: str) -> str:
+        started = time.perf_counter()
+        groq_response = await groq_client.chat.completions.create(
+            model=model,
+            messages=messages,
+            timeout=timeout or Config.LLM_TIMEOUT
         )
+        seconds = time.perf_counter() - started
+        LLM_SECONDS.labels(focus_mode, model).observe(seconds)
+        record_usage(focus_mode, groq_response.usage)
+        analytics.record_llm(focus_mode, seconds, groq_response.usage)
         return groq_response.choices[0].message.content
+
+    try:
+        async with admission.slot(focus_mode, on_queued):
+            return await _hedged(MODEL_ROUTES.get(focus_mode, DEFAULT_ROUTE), call)
+    except Overloaded:
+        return BUSY_MESSAGE
     except Exception as e:
         logger.error(f"Groq API Error: {e}")
-        return "Sorry, the AI service is temporarily unavailable. Please try again."
+        return ERROR_MESSAGE
+
+async def query_perplexica(query: str, focus_mode: str, history: list = None, timeout: float = None, on_queued=None) -> str:
+    """
+    Returns the model's answer. Concurrent calls with the same focus mode, prompt
+    and history are coalesced into a single upstream request. Returns
+    BUSY_MESSAGE if the request was shed by admission control; on_queued is
+    awaited with the queue position if it has to wait for a slot.
+    """
+    key = request_key(query, focus_mode, history)
+    task = inflight_requests.get(key)
+    LLM_REQUESTS.labels(focus_mode, "joined" if task else "complete").inc()
+    if task is None:
+        messages = build_messages(query, focus_mode, history)
+        task = asyncio.ensure_future(_complete(messages, focus_mode, timeout, on_queued))
+        inflight_requests[key] = task
+
+        def forget(finished_task):
+            if inflight_requests.get(key) is finished_task:
+                del inflight_requests[key]
+
+        task.add_done_callback(forget)
+    else:
+        logger.info(f"Joining in-flight {focus_mode} request")
+
+    # Shielded so that one caller giving up does not cancel the call for the others
+    return await asyncio.shield(task)
+
+async def stream_perplexica(query: str, focus_mode: str, history: list = None, timeout: float = None, on_queued=None):
+    """
+    Async generator version of query_perplexica that yields the answer in pieces
+    as the model produces them.
+    """
+    messages = build_messages(query, focus_mode, history)
+    received_text = False
+    LLM_REQUESTS.labels(focus_mode, "stream").inc()
+
+    async def open_stream(model: str):
+        # Fallbacks and hedging apply until the first piece of text arrives
+        started = time.perf_counter()
+        stream = await groq_client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True,
+            timeout=timeout or Config.LLM_TIMEOUT
+        )
+        iterator = stream.__aiter__()
+        try:
+            async for chunk in iterator:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    LLM_FIRST_TOKEN_SECONDS.labels(focus_mode, model).observe(time.perf_counter() - started)
+                    return stream, iterator, chunk.choices[0].delta.content, model, started
+        except BaseException:
+            await stream.close()
+            raise
+        return stream, iterator, None, model, started
+
+    async def close_stream(opened):
+        await opened[0].close()
+
+    try:
+        async with admission.slot(focus_mode, on_queued):
+            stream, iterator, first, model, started = await _hedged(
+                MODEL_ROUTES.get(focus_mode, DEFAULT_ROUTE), open_stream, close_stream
+            )
+            usage = None
+            try:
+                if first:
+                    received_text = True
+                    yield first
+                async for chunk in iterator:
+                    # Groq reports token usage on the last chunk
+                    x_groq = getattr(chunk, "x_groq", None)
+                    if getattr(x_groq, "usage", None) is not None:
+                        usage = x_groq.usage
+                        record_usage(focus_mode, usage)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+                seconds = time.perf_counter() - started
+                LLM_SECONDS.labels(focus_mode, model).observe(seconds)
+                analytics.record_llm(focus_mode, seconds, usage)
+            finally:
+                await stream.close()
+    except Overloaded:
+        yield BUSY_MESSAGE
+    except Exception as e:
+        logger.error(f"Groq streaming error: {e}")
+        if received_text:
+            yield CUT_OFF_MESSAGE
+        else:
+            yield ERROR_MESSAGE
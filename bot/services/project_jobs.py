@@ -0,0 +1,627 @@
+import asyncio
+import io
+import json
+import logging
+import re
+import socket
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import and_, inspect, or_, text
+from sqlalchemy.exc import IntegrityError
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+from bot.config import Config
+from bot.models import Project, ProjectChapter, ProjectJob, db
+from bot.services.database import run_db
+from bot.services.perplexica_service import query_perplexica, ERROR_MESSAGE, BUSY_MESSAGE
+from bot.services.outbound import BULK_PRIORITY
+from bot.services.docx_renderer import render_chapter
+from bot.services.history_search import index_entry, CHAPTER
+
+logger = logging.getLogger(__name__)
+
+# Unique per process, so a restarted container never takes its previous run's jobs for its own
+WORKER_ID = f"{socket.gethostname()}:{uuid.uuid4().hex[:8]}"
+
+class ChapterGenerationError(Exception):
+    pass
+
+class ProjectDeferred(Exception):
+    """Admission control shed a generation request; the job waits and runs again later."""
+
+DEFERRED = "deferred: LLM service busy"
+
+def checked_reply(reply: str, what: str) -> str:
+    if reply == BUSY_MESSAGE:
+        raise ProjectDeferred(f"{what} was deferred")
+    if reply == ERROR_MESSAGE:
+        raise ChapterGenerationError(f"{what} failed")
+    return reply
+
+CHAPTER_TITLE = re.compile(r"^Chapter (\d+)")
+
+OUTLINE_PROMPT = (
+    "Project Title: {title}\n{topic}\n\n"
+    "Plan this final year project as exactly {num_chapters} chapters. Reply with JSON only, in this form:\n"
+    '{{"chapters": [{{"title": "chapter title", "summary": "3-4 sentences on what the chapter covers", '
+    '"key_points": ["point", "..."]}}], "key_terms": ["terms, variables and acronyms every chapter must use consistently"]}}'
+)
+
+OUTLINE_CHAPTER_PROMPT = (
+    "Project Title: {title}\n{topic}\n\n"
+    "PROJECT OUTLINE:\n{outline}\n\n"
+    "KEY TERMS: {key_terms}\n\n"
+    "Write Chapter {number}: {chapter_title} in full. It must cover: {summary}\n"
+    "Key points: {key_points}\n"
+    "Do not repeat material that belongs to other chapters; refer to them by chapter number where needed."
+)
+
+CONSISTENCY_PROMPT = (
+    "Below are the outline and excerpts from every chapter of a research project that were written separately. "
+    "List terminology, acronym, variable or naming inconsistencies between the chapters and how to fix them. "
+    'Reply with JSON only: {{"replacements": [{{"find": "exact text as it appears", "replace": "consistent text"}}]}}. '
+    "Reply with an empty list if the chapters are consistent.\n\n"
+    "OUTLINE:\n{outline}\n\n{excerpts}"
+)
+
+# Characters taken from the start and end of each chapter for the consistency pass
+EXCERPT_LENGTH = 600
+MAX_REPLACEMENTS = 20
+# A fix touching more places than this is more likely a misreading than a naming slip
+MAX_OCCURRENCES = 5
+
+def parse_json_reply(reply: str) -> dict:
+    """Extracts the JSON object from a model reply that may be wrapped in prose or code fences."""
+    start, end = reply.find("{"), reply.rfind("}")
+    if start == -1 or end <= start:
+        raise ValueError("No JSON object in reply")
+    return json.loads(reply[start:end + 1])
+
+def outline_text(outline: dict) -> str:
+    return "\n".join(
+        f"Chapter {number}: {chapter['title']} - {chapter.get('summary', '')}"
+        for number, chapter in enumerate(outline['chapters'], start=1)
+    )
+
+def chapter_prompt(project: dict, number: int) -> str:
+    if number == 1:
+        return (
+            f"Project Title: {project['title']}\n"
+            f"{project['topic']}\n\n"
+            "Generate the first chapter (Introduction) of this project. After you are done, simply say 'Chapter 1 Complete.' and nothing else."
+        )
+    return f"Excellent. Now, generate Chapter {number} based on the previous chapters. After you are done, simply say 'Chapter {number} Complete.' and nothing else."
+
+# --- Database work (runs in a worker thread) ---
+
+def ensure_chapter_schema():
+    """
+    Adds project_chapters.number to tables created before it existed, fills it
+    in from the "Chapter N" titles and makes (project_id, number) unique.
+    Chapters stored twice before then keep a NULL number on the later copy.
+    """
+    columns = {column["name"] for column in inspect(db.engine).get_columns("project_chapters")}
+    if "number" in columns:
+        return
+    logger.info("Adding project_chapters.number...")
+    db.session.execute(text("ALTER TABLE project_chapters ADD COLUMN number INTEGER"))
+    numbered, seen = [], set()
+    rows = db.session.query(ProjectChapter.id, ProjectChapter.project_id, ProjectChapter.title).order_by(ProjectChapter.id)
+    for chapter_id, project_id, title in rows:
+        match = CHAPTER_TITLE.match(title)
+        if match and (project_id, int(match.group(1))) not in seen:
+            seen.add((project_id, int(match.group(1))))
+            numbered.append({"id": chapter_id, "number": int(match.group(1))})
+    db.session.bulk_update_mappings(ProjectChapter, numbered)
+    db.session.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS uq_project_chapters_project_id_number ON project_chapters (project_id, number)"
+    ))
+    db.session.commit()
+
+def _create_job(user_id: int, chat_id: int, details: dict):
+    topic = (
+        f"Department: {details['department']}\n"
+        f"Research Type: {details['research_type']}\n"
+        f"Referencing Style: {details['referencing']}"
+    )
+    project = Project(user_id=user_id, title=details['title'][:200], topic=topic, status='queued')
+    job = ProjectJob(
+        project=project,
+        chat_id=chat_id,
+        num_chapters=details['num_chapters'],
+        mode=Config.PROJECT_GENERATION_MODE,
+    )
+    db.session.add_all([project, job])
+    db.session.commit()
+    return job.id
+
+def _fail_exhausted_jobs(stale: datetime) -> list:
+    """
+    Fails running jobs whose lease expired after their last allowed attempt:
+    a job that keeps crashing its worker would otherwise be reclaimed forever.
+    Returns (job_id, chat_id) for each job this call failed.
+    """
+    exhausted = ProjectJob.query.filter(
+        ProjectJob.status == 'running',
+        ProjectJob.locked_at < stale,
+        ProjectJob.attempts >= Config.PROJECT_JOB_MAX_ATTEMPTS,
+    ).all()
+    failed = []
+    for job in exhausted:
+        # Conditional, so a job is failed and its chat notified by one worker only
+        updated = (
+            ProjectJob.query.filter(ProjectJob.id == job.id, ProjectJob.status == 'running', ProjectJob.locked_at < stale)
+            .update(
+                {
+                    ProjectJob.status: 'failed',
+                    ProjectJob.error: 'lease expired after the last attempt',
+                    ProjectJob.locked_by: None,
+                    ProjectJob.locked_at: None,
+                },
+                synchronize_session=False,
+            )
+        )
+        if updated:
+            Project.query.filter_by(id=job.project_id).update({Project.status: 'failed'}, synchronize_session=False)
+            failed.append((job.id, job.chat_id))
+    return failed
+
+def _claim_job():
+    """
+    Claims the oldest runnable job: queued, or running under an expired lease
+    (its worker died) with attempts left. Postgres skips rows other workers
+    have locked; the conditional UPDATE makes the claim safe on SQLite as well.
+    Returns the claimed job id (or None) and the jobs failed for running out
+    of attempts, whose chats still need to be told.
+    """
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=Config.PROJECT_JOB_LEASE_SECONDS)
+    exhausted = _fail_exhausted_jobs(stale)
+    runnable = or_(
+        ProjectJob.status == 'queued',
+        and_(
+            ProjectJob.status == 'running',
+            ProjectJob.locked_at < stale,
+            ProjectJob.attempts < Config.PROJECT_JOB_MAX_ATTEMPTS,
+        ),
+    )
+    job = (
+        ProjectJob.query.filter(runnable)
+        .order_by(ProjectJob.id)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if job is None:
+        db.session.commit()
+        return None, exhausted
+    claimed = (
+        ProjectJob.query.filter(ProjectJob.id == job.id, runnable)
+        .update(
+            {
+                ProjectJob.status: 'running',
+                ProjectJob.locked_by: WORKER_ID,
+                ProjectJob.locked_at: now,
+                ProjectJob.attempts: ProjectJob.attempts + 1,
+            },
+            synchronize_session=False,
+        )
+    )
+    db.session.commit()
+    return (job.id if claimed else None), exhausted
+
+def chapter_number(chapter: ProjectChapter):
+    """The chapter's number, read from its "Chapter N..." title for rows stored without one."""
+    if chapter.number is not None:
+        return chapter.number
+    match = CHAPTER_TITLE.match(chapter.title)
+    return int(match.group(1)) if match else None
+
+def numbered_chapters(chapters: list) -> dict:
+    """Maps chapter number to content; the first row stored for a number wins."""
+    numbered = {}
+    for chapter in chapters:
+        number = chapter_number(chapter)
+        if number is not None and number not in numbered:
+            numbered[number] = chapter.content
+    return numbered
+
+def _load_job(job_id: int) -> dict:
+    job = db.session.get(ProjectJob, job_id)
+    project = job.project
+    chapters = (
+        ProjectChapter.query.filter_by(project_id=project.id)
+        .order_by(ProjectChapter.id)
+        .all()
+    )
+    project.status = 'generating'
+    db.session.commit()
+    return {
+        'id': job.id,
+        'project_id': project.id,
+        'chat_id': job.chat_id,
+        'num_chapters': job.num_chapters,
+        'chapters_sent': job.chapters_sent,
+        'attempts': job.attempts,
+        'title': project.title,
+        'topic': project.topic,
+        'mode': job.mode,
+        'outline': json.loads(job.outline) if job.outline else None,
+        'chapters': numbered_chapters(chapters),
+    }
+
+def _save_chapter(job_id: int, project_id: int, number: int, title: str, content: str) -> str:
+    """
+    Checkpoints a finished chapter and renews the job's lease in one transaction.
+    Returns the stored text: another worker's copy if it saved the chapter first.
+    """
+    chapter = ProjectChapter(project_id=project_id, number=number, title=title[:200], content=content)
+    db.session.add(chapter)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        logger.warning(f"Chapter {number} of project {project_id} was already saved; keeping the stored copy")
+        return ProjectChapter.query.filter_by(project_id=project_id, number=number).one().content
+    project = db.session.get(Project, project_id)
+    index_entry(project.user_id, CHAPTER, chapter.id, f"{project.title}: {chapter.title}", content)
+    ProjectJob.query.filter_by(id=job_id).update({ProjectJob.locked_at: datetime.utcnow()})
+    db.session.commit()
+    return content
+
+def _renew_lease(job_id: int) -> bool:
+    """Extends this worker's lease on a running job. Returns False if the job is no longer ours."""
+    renewed = (
+        ProjectJob.query.filter_by(id=job_id, status='running', locked_by=WORKER_ID)
+        .update({ProjectJob.locked_at: datetime.utcnow()})
+    )
+    db.session.commit()
+    return bool(renewed)
+
+def _save_outline(job_id: int, outline: dict):
+    ProjectJob.query.filter_by(id=job_id).update(
+        {ProjectJob.outline: json.dumps(outline), ProjectJob.locked_at: datetime.utcnow()}
+    )
+    db.session.commit()
+
+def _update_chapters(job_id: int, project_id: int, chapters: dict, outline: dict):
+    """Stores the chapters rewritten by the consistency pass."""
+    project = db.session.get(Project, project_id)
+    for chapter in ProjectChapter.query.filter_by(project_id=project_id).filter(ProjectChapter.number.isnot(None)):
+        if chapter.number in chapters:
+            chapter.content = chapters[chapter.number]
+            index_entry(project.user_id, CHAPTER, chapter.id, f"{project.title}: {chapter.title}", chapter.content)
+    ProjectJob.query.filter_by(id=job_id).update({ProjectJob.outline: json.dumps(outline)})
+    db.session.commit()
+
+def _mark_sent(job_id: int, chapters_sent: int):
+    ProjectJob.query.filter_by(id=job_id).update({ProjectJob.chapters_sent: chapters_sent})
+    db.session.commit()
+
+def _finish_job(job_id: int, status: str, error: str = None):
+    job = db.session.get(ProjectJob, job_id)
+    job.status = status
+    job.error = error
+    job.locked_by = None
+    job.locked_at = None
+    if status == 'done':
+        job.project.status = 'completed'
+    elif status == 'failed':
+        job.project.status = 'failed'
+    db.session.commit()
+
+# --- Job execution ---
+
+async def enqueue_project(user_id: int, chat_id: int, details: dict) -> int:
+    """Persists a project and queues it for generation. Returns the job id."""
+    return await run_db(_create_job, user_id, chat_id, details)
+
+async def send_chapter(bot, chat_id: int, number: int, content: str):
+    loop = asyncio.get_running_loop()
+    doc_stream = io.BytesIO(await loop.run_in_executor(None, render_chapter, content))
+    doc_stream.name = f"Chapter_{number}.docx"
+    await bot.send_document(
+        chat_id=chat_id,
+        document=doc_stream,
+        caption=f"Here is Chapter {number} of your project.",
+        rate_limit_args=BULK_PRIORITY
+    )
+
+async def deliver_chapters(bot, job: dict):
+    """Sends finished chapters the user has not received yet, in order."""
+    number = job['chapters_sent'] + 1
+    while number in job['chapters']:
+        await send_chapter(bot, job['chat_id'], number, job['chapters'][number])
+        await run_db(_mark_sent, job['id'], number)
+        job['chapters_sent'] = number
+        number += 1
+
+async def generate_sequentially(bot, job: dict):
+    """Writes each chapter with the full text of all previous chapters as context."""
+    await deliver_chapters(bot, job)
+
+    history = []
+    for number in sorted(job['chapters']):
+        history.append({"role": "user", "content": chapter_prompt(job, number)})
+        history.append({"role": "assistant", "content": job['chapters'][number]})
+
+    for number in range(len(job['chapters']) + 1, job['num_chapters'] + 1):
+        status_msg = await bot.send_message(
+            chat_id=job['chat_id'], text=f"✍️ Generating Chapter {number}...", rate_limit_args=BULK_PRIORITY
+        )
+        prompt = chapter_prompt(job, number)
+        ai_response = await query_perplexica(prompt, focus_mode="project_generator", history=history)
+        await status_msg.delete()
+        checked_reply(ai_response, f"Chapter {number} generation")
+
+        ai_response = await run_db(_save_chapter, job['id'], job['project_id'], number, f"Chapter {number}", ai_response)
+        job['chapters'][number] = ai_response
+        history.append({"role": "user", "content": prompt})
+        history.append({"role": "assistant", "content": ai_response})
+        await deliver_chapters(bot, job)
+
+async def plan_outline(job: dict) -> dict:
+    prompt = OUTLINE_PROMPT.format(title=job['title'], topic=job['topic'], num_chapters=job['num_chapters'])
+    reply = checked_reply(await query_perplexica(prompt, focus_mode="project_generator"), "Outline generation")
+    try:
+        outline = parse_json_reply(reply)
+        chapters = outline['chapters'][:job['num_chapters']]
+    except (ValueError, KeyError, TypeError) as e:
+        raise ChapterGenerationError(f"Outline was not valid JSON: {e}")
+    if len(chapters) < job['num_chapters'] or not all(isinstance(c, dict) and c.get('title') for c in chapters):
+        raise ChapterGenerationError("Outline did not describe every chapter")
+
+    outline = {'chapters': chapters, 'key_terms': outline.get('key_terms', [])}
+    await run_db(_save_outline, job['id'], outline)
+    return outline
+
+async def write_outlined_chapter(job: dict, number: int, slots: asyncio.Semaphore):
+    outline = job['outline']
+    chapter = outline['chapters'][number - 1]
+    prompt = OUTLINE_CHAPTER_PROMPT.format(
+        title=job['title'],
+        topic=job['topic'],
+        outline=outline_text(outline),
+        key_terms=", ".join(outline['key_terms']) or "none",
+        number=number,
+        chapter_title=chapter['title'],
+        summary=chapter.get('summary', ''),
+        key_points="; ".join(chapter.get('key_points', [])),
+    )
+    async with slots:
+        ai_response = await query_perplexica(prompt, focus_mode="project_generator")
+    checked_reply(ai_response, f"Chapter {number} generation")
+
+    job['chapters'][number] = await run_db(
+        _save_chapter, job['id'], job['project_id'], number, f"Chapter {number}: {chapter['title']}", ai_response
+    )
+
+def apply_replacements(chapters: dict, replacements: list, excerpts: str) -> int:
+    """
+    Applies the consistency fixes as whole-word replacements. The model only saw
+    the excerpts, so a fix is skipped unless its text appears there, and when
+    it would change more than MAX_OCCURRENCES places. Returns the fixes applied.
+    """
+    applied = 0
+    for replacement in replacements:
+        if not isinstance(replacement, dict):
+            continue
+        find, replace = replacement.get('find'), replacement.get('replace')
+        if not isinstance(find, str) or not isinstance(replace, str) or len(find) < 3 or find == replace:
+            continue
+        pattern = re.compile(rf"(?<!\w){re.escape(find)}(?!\w)")
+        if not pattern.search(excerpts):
+            continue
+        occurrences = sum(len(pattern.findall(content)) for content in chapters.values())
+        if occurrences > MAX_OCCURRENCES:
+            logger.info(f"Skipping consistency fix {find!r}: {occurrences} occurrences")
+            continue
+        for number, content in chapters.items():
+            chapters[number] = pattern.sub(lambda _: replace, content)
+        applied += 1
+    return applied
+
+async def check_consistency(job: dict):
+    """
+    One cheap pass over the outline and the start and end of every chapter that
+    returns terminology fixes, which are then applied with apply_replacements.
+    """
+    excerpts = "\n\n".join(
+        f"CHAPTER {number} (start):\n{content[:EXCERPT_LENGTH]}\n\nCHAPTER {number} (end):\n{content[-EXCERPT_LENGTH:]}"
+        for number, content in sorted(job['chapters'].items())
+    )
+    prompt = CONSISTENCY_PROMPT.format(outline=outline_text(job['outline']), excerpts=excerpts)
+    reply = await query_perplexica(prompt, focus_mode="project_generator")
+
+    replacements = []
+    if reply not in (ERROR_MESSAGE, BUSY_MESSAGE):
+        try:
+            replacements = parse_json_reply(reply).get('replacements', [])[:MAX_REPLACEMENTS]
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"Ignoring unparseable consistency pass for job {job['id']}: {e}")
+
+    apply_replacements(job['chapters'], replacements, excerpts)
+
+    job['outline']['consistency_checked'] = True
+    await run_db(_update_chapters, job['id'], job['project_id'], job['chapters'], job['outline'])
+
+async def generate_from_outline(bot, job: dict):
+    """
+    Plans the project once, then writes the chapters concurrently from the
+    outline instead of from each other's full text.
+    """
+    status_msg = None
+    try:
+        if job['outline'] is None:
+            status_msg = await bot.send_message(
+                chat_id=job['chat_id'], text="🗂️ Planning your project outline...", rate_limit_args=BULK_PRIORITY
+            )
+            job['outline'] = await plan_outline(job)
+
+        missing = [n for n in range(1, job['num_chapters'] + 1) if n not in job['chapters']]
+        if missing:
+            text = f"✍️ Writing {len(missing)} chapters..."
+            if status_msg:
+                await status_msg.edit_text(text)
+            else:
+                status_msg = await bot.send_message(chat_id=job['chat_id'], text=text, rate_limit_args=BULK_PRIORITY)
+            slots = asyncio.Semaphore(Config.PROJECT_CHAPTER_CONCURRENCY)
+            # Let every chapter finish (and checkpoint) before reporting a failure,
+            # so a retry only has to write the chapters that are still missing
+            results = await asyncio.gather(
+                *(write_outlined_chapter(job, n, slots) for n in missing), return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+
+        if not job['outline'].get('consistency_checked'):
+            await check_consistency(job)
+    finally:
+        if status_msg:
+            await status_msg.delete()
+
+    await deliver_chapters(bot, job)
+
+async def run_job(bot, job_id: int):
+    job = await run_db(_load_job, job_id)
+
+    if job['attempts'] > 1 and job['chapters']:
+        logger.info(f"Resuming project job {job_id} with {len(job['chapters'])} chapters done")
+
+    if job['mode'] == 'outline':
+        await generate_from_outline(bot, job)
+    else:
+        await generate_sequentially(bot, job)
+
+    await run_db(_finish_job, job_id, 'done')
+    keyboard = [
+        [InlineKeyboardButton("📚 Download Full Project", callback_data=f"PROJECT_EXPORT_{job['project_id']}")],
+        [InlineKeyboardButton("🔙 Back to Menu", callback_data="BACK_TO_MENU")]
+    ]
+    # The job is committed as done; a failed notification must not requeue or fail it
+    try:
+        await bot.send_message(
+            chat_id=job['chat_id'],
+            text="✅ All chapters have been generated!",
+            reply_markup=InlineKeyboardMarkup(keyboard)
+        )
+    except Exception as e:
+        logger.error(f"Could not notify chat {job['chat_id']} about finished job {job_id}: {e}")
+
+def _defer_job(job_id: int) -> bool:
+    """Requeues a job without using up an attempt. Returns True the first time it is deferred."""
+    job = db.session.get(ProjectJob, job_id)
+    first_deferral = job.error != DEFERRED
+    job.status = 'queued'
+    job.attempts = max(job.attempts - 1, 0)
+    job.error = DEFERRED
+    job.locked_by = None
+    job.locked_at = None
+    db.session.commit()
+    return first_deferral
+
+async def defer_job(bot, job_id: int, chat_id: int):
+    if await run_db(_defer_job, job_id):
+        await bot.send_message(
+            chat_id=chat_id,
+            text="⏳ The AI service is very busy right now, so your project has been queued. It will continue automatically.",
+            rate_limit_args=BULK_PRIORITY
+        )
+
+def _job_attempts(job_id: int):
+    job = db.session.get(ProjectJob, job_id)
+    return job.attempts, job.chat_id
+
+async def notify_failure(bot, job_id: int, chat_id: int):
+    try:
+        await bot.send_message(chat_id=chat_id, text="Sorry, an error occurred while generating your project. Please try again later.")
+    except Exception as e:
+        logger.error(f"Could not notify chat {chat_id} about failed job {job_id}: {e}")
+
+async def handle_job_failure(bot, job_id: int, error: Exception):
+    attempts, chat_id = await run_db(_job_attempts, job_id)
+
+    if attempts < Config.PROJECT_JOB_MAX_ATTEMPTS:
+        logger.warning(f"Project job {job_id} failed (attempt {attempts}), requeueing: {error}")
+        await run_db(_finish_job, job_id, 'queued', str(error))
+        return
+
+    logger.error(f"Project job {job_id} failed permanently: {error}")
+    await run_db(_finish_job, job_id, 'failed', str(error))
+    await notify_failure(bot, job_id, chat_id)
+
+class ProjectWorkerPool:
+    """
+    Runs up to PROJECT_WORKERS project jobs at a time inside the bot process,
+    polling the project_jobs table for work. A heartbeat renews each running
+    job's lease, so a slow chapter is never mistaken for a dead worker.
+    """
+
+    def __init__(self, size: int = Config.PROJECT_WORKERS, poll_interval: float = Config.PROJECT_JOB_POLL_SECONDS):
+        self.size = size
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = Config.PROJECT_JOB_LEASE_SECONDS / 4
+        self._tasks = []
+
+    def start(self, bot):
+        for n in range(self.size):
+            self._tasks.append(asyncio.create_task(self._work(bot), name=f"project-worker-{n}"))
+        logger.info(f"Started {self.size} project workers ({WORKER_ID})")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _heartbeat(self, job_id: int):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                if not await run_db(_renew_lease, job_id):
+                    logger.info(f"Project job {job_id} is no longer held by {WORKER_ID}")
+                    return
+            except Exception as e:
+                logger.error(f"Renewing the lease on project job {job_id} failed: {e}")
+
+    async def _run(self, bot, job_id: int):
+        heartbeat = asyncio.create_task(self._heartbeat(job_id), name=f"project-lease-{job_id}")
+        try:
+            await run_job(bot, job_id)
+        finally:
+            heartbeat.cancel()
+
+    async def _work(self, bot):
+        while True:
+            try:
+                job_id, exhausted = await run_db(_claim_job)
+            except Exception as e:
+                logger.error(f"Claiming project job failed: {e}")
+                job_id, exhausted = None, []
+
+            for failed_id, chat_id in exhausted:
+                logger.error(f"Project job {failed_id} failed permanently: lease expired after the last attempt")
+                await notify_failure(bot, failed_id, chat_id)
+
+            if job_id is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            try:
+                await self._run(bot, job_id)
+            except asyncio.CancelledError:
+                # Shutting down: hand the job back so the next worker resumes it
+                # from the last checkpointed chapter without waiting for the lease
+                await run_db(_finish_job, job_id, 'queued')
+                raise
+            except ProjectDeferred as e:
+                logger.info(f"Project job {job_id} deferred: {e}")
+                try:
+                    _, chat_id = await run_db(_job_attempts, job_id)
+                    await defer_job(bot, job_id, chat_id)
+                except Exception as e:
+                    logger.error(f"Deferring project job {job_id} failed: {e}")
+                await asyncio.sleep(Config.ADMISSION_BACKGROUND_DEADLINE / 10)
+            except Exception as e:
+                await handle_job_failure(bot, job_id, e)
+
+project_workers = ProjectWorkerPool()
@@ -0,0 +1,132 @@
+import logging
+import re
+import time
+import zlib
+import numpy as np
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_DIM = 1024
+
+# Words that change how a question is phrased but not what it asks for
+FILLER_WORDS = {
+    "a", "about", "an", "and", "are", "can", "define", "definition", "describe", "do", "does",
+    "explain", "explanation", "for", "give", "i", "in", "is", "me", "meaning", "of", "on",
+    "please", "pls", "simple", "tell", "terms", "the", "to", "understand", "want", "what",
+    "whats", "you", "waec", "neco", "jamb", "utme", "exam", "exams",
+}
+
+def question_terms(text: str) -> list:
+    words = re.sub(r"[^a-z0-9 ]+", " ", text.lower()).split()
+    terms = [w for w in words if w not in FILLER_WORDS]
+    return terms or words
+
+# Numbers and math symbols; questions that differ in any of these ask different things
+EXACT_TOKEN = re.compile(r"\d+(?:\.\d+)?|[-+*/^=<>%×÷√π∑∫≤≥≠]")
+WORD_HYPHEN = re.compile(r"(?<=[a-z])-(?=[a-z])")
+
+def exact_key(text: str) -> int:
+    """Hash of the question's numbers and operators, which must match exactly for a cache hit."""
+    tokens = EXACT_TOKEN.findall(WORD_HYPHEN.sub(" ", text.lower()))
+    return zlib.crc32(" ".join(sorted(tokens)).encode("utf-8"))
+
+def embed(text: str) -> np.ndarray:
+    """
+    Unit-length hashed feature vector of the question's content words and
+    their character trigrams, so reworded or misspelled questions land close.
+    """
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for term in question_terms(text):
+        padded = f"<{term}>"
+        features = [padded[i:i + 3] for i in range(len(padded) - 2)]
+        for feature in features:
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % EMBEDDING_DIM] += 1.0 if h & 0x80000000 else -1.0
+        # Whole words weigh about as much as all their trigrams together
+        vector[zlib.crc32(term.encode("utf-8")) % EMBEDDING_DIM] += len(features) ** 0.5
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class SemanticCache:
+    """
+    Answers for first-turn tutor questions, looked up by cosine similarity of
+    embed() vectors among entries with the same exact_key(), so "x + 4" never
+    answers "x + 6". The vectors live in one preallocated matrix so a lookup is
+    a single matrix-vector product. Entries expire after ttl seconds; when the
+    cache is full the least recently used entry is replaced.
+    """
+
+    def __init__(self, max_size: int, ttl: float, threshold: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self._vectors = np.zeros((max_size, EMBEDDING_DIM), dtype=np.float32)
+        self._keys = np.zeros(max_size, dtype=np.uint32)
+        self._expires = np.zeros(max_size, dtype=np.float64)
+        self._last_used = np.zeros(max_size, dtype=np.float64)
+        self._answers = [None] * max_size
+        self._costs = [0.0] * max_size
+        self._size = 0
+        self.lookups = 0
+        self.hits = 0
+        self.seconds_saved = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "entries": self._size,
+            "lookups_total": self.lookups,
+            "hits_total": self.hits,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "seconds_saved_total": self.seconds_saved,
+        }
+
+    def _nearest(self, vector: np.ndarray, key: int, now: float):
+        if not self._size:
+            return None, 0.0
+        scores = self._vectors[:self._size] @ vector
+        scores[self._expires[:self._size] <= now] = -1.0
+        scores[self._keys[:self._size] != key] = -1.0
+        slot = int(np.argmax(scores))
+        return slot, float(scores[slot])
+
+    def get(self, question: str):
+        """Returns a cached answer to a question similar enough to this one, or None."""
+        now = time.monotonic()
+        self.lookups += 1
+        slot, score = self._nearest(embed(question), exact_key(question), now)
+        if slot is None or score < self.threshold:
+            return None
+
+        self.hits += 1
+        self.seconds_saved += self._costs[slot]
+        self._last_used[slot] = now
+        logger.info(f"Tutor cache hit (similarity {score:.2f})")
+        return self._answers[slot]
+
+    def put(self, question: str, answer: str, cost: float):
+        """Stores an answer; cost is the number of seconds it took to generate."""
+        now = time.monotonic()
+        vector, key = embed(question), exact_key(question)
+        slot, score = self._nearest(vector, key, now)
+
+        if slot is None or score < 0.98:
+            if self._size < self.max_size:
+                slot = self._size
+                self._size += 1
+            else:
+                expired = np.flatnonzero(self._expires <= now)
+                slot = int(expired[0]) if expired.size else int(np.argmin(self._last_used))
+
+        self._vectors[slot] = vector
+        self._keys[slot] = key
+        self._expires[slot] = now + self.ttl
+        self._last_used[slot] = now
+        self._answers[slot] = answer
+        self._costs[slot] = cost
+
+tutor_cache = SemanticCache(
+    max_size=Config.TUTOR_CACHE_SIZE,
+    ttl=Config.TUTOR_CACHE_TTL_HOURS * 3600,
+    threshold=Config.TUTOR_CACHE_THRESHOLD,
+)
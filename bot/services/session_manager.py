@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import sys
+import time
+from collections import OrderedDict
+from telegram import Update
+from telegram.ext import Application, ContextTypes
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+def estimate_size(obj) -> int:
+    """Approximate memory held by a user_data value, following dicts, lists, tuples and sets."""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item) for item in obj)
+    return size
+
+class SessionManager:
+    """
+    Tracks when each user was last active and keeps the user_data held in
+    memory bounded. Users idle for longer than SESSION_IDLE_SECONDS are evicted,
+    and if the resident data still exceeds SESSION_MEMORY_LIMIT_MB the least
+    recently active users are evicted until it fits. Evicted data is written
+    through the application's persistence first and lazily reloaded from it on
+    the user's next update.
+    """
+
+    def __init__(
+        self,
+        idle_seconds: float = Config.SESSION_IDLE_SECONDS,
+        memory_limit_bytes: int = Config.SESSION_MEMORY_LIMIT_MB * 1024 * 1024,
+        sweep_interval: float = Config.SESSION_SWEEP_SECONDS,
+    ):
+        self.idle_seconds = idle_seconds
+        self.memory_limit_bytes = memory_limit_bytes
+        self.sweep_interval = sweep_interval
+        # Users who recently sent an update may have one in flight, and their
+        # changes may not have reached the persistence yet
+        self.min_resident_seconds = max(60, 2 * Config.PERSISTENCE_UPDATE_INTERVAL)
+        # user_id -> monotonic time of last activity, least recent first
+        self._last_seen = OrderedDict()
+        self._resident_bytes = 0
+        self._evicted_total = 0
+        self._task = None
+
+    async def track_activity(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Registered as a TypeHandler in an early group; sees every update."""
+        if update.effective_user:
+            self._last_seen[update.effective_user.id] = time.monotonic()
+            self._last_seen.move_to_end(update.effective_user.id)
+
+    def stats(self) -> dict:
+        return {
+            "resident_sessions": len(self._last_seen),
+            "resident_bytes": self._resident_bytes,
+            "evicted_total": self._evicted_total,
+        }
+
+    def start(self, application: Application):
+        self._task = asyncio.create_task(self._run(application), name="session-sweeper")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self, application: Application):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep(application)
+            except Exception as e:
+                logger.error(f"Session sweep failed: {e}")
+
+    async def sweep(self, application: Application):
+        now = time.monotonic()
+        to_evict = [uid for uid, seen in self._last_seen.items() if now - seen > self.idle_seconds]
+
+        sizes = {
+            uid: estimate_size(application.user_data.get(uid, {}))
+            for uid in self._last_seen if uid not in to_evict
+        }
+        total = sum(sizes.values())
+        if total > self.memory_limit_bytes:
+            for uid in list(sizes):
+                if total <= self.memory_limit_bytes:
+                    break
+                if now - self._last_seen[uid] < self.min_resident_seconds:
+                    break
+                to_evict.append(uid)
+                total -= sizes.pop(uid)
+
+        self._resident_bytes = total
+        if to_evict:
+            await self.evict(application, to_evict)
+            logger.info(
+                f"Evicted {len(to_evict)} sessions; {len(self._last_seen)} resident using {total // 1024} KB"
+            )
+
+    async def evict(self, application: Application, user_ids: list):
+        persistence = application.persistence
+        if persistence:
+            for uid in user_ids:
+                user_data = application.user_data.get(uid)
+                if user_data:
+                    await persistence.update_user_data(uid, user_data)
+            await persistence.flush()
+
+        for uid in user_ids:
+            user_data = application.user_data.get(uid)
+            if user_data is not None:
+                # Cleared in place: the application keeps the (now empty) dict
+                user_data.clear()
+            if persistence and hasattr(persistence, "forget"):
+                persistence.forget('user', uid)
+            self._last_seen.pop(uid, None)
+            self._evicted_total += 1
+
+session_manager = SessionManager()
@@ -0,0 +1,146 @@
+import hashlib
+import logging
+import re
+import threading
+import unicodedata
+import zlib
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import func
+from bot.config import Config
+from bot.models import Assignment, AssignmentBand, AssignmentFingerprint, db
+
+logger = logging.getLogger(__name__)
+
+SHINGLE_SIZE = 5
+NUM_HASHES = 128
+BANDS = 32
+ROWS_PER_BAND = NUM_HASHES // BANDS
+MAX_CANDIDATES = 20
+
+# Fixed hash family so signatures stay comparable across restarts and workers
+PRIME = (1 << 31) - 1
+_random = np.random.RandomState(20240601)
+HASH_A = _random.randint(1, PRIME, NUM_HASHES).astype(np.uint64)
+HASH_B = _random.randint(0, PRIME, NUM_HASHES).astype(np.uint64)
+
+def normalize_topic(topic: str) -> str:
+    """Case, punctuation, accents and spacing removed, so trivially different briefs compare equal."""
+    text = unicodedata.normalize("NFKD", topic).casefold()
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[\W_]+", " ", text).split())
+
+def shingles(normalized: str) -> set:
+    if len(normalized) <= SHINGLE_SIZE:
+        return {normalized}
+    return {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+
+def minhash(normalized: str) -> np.ndarray:
+    """MinHash signature of the topic's character shingles."""
+    values = np.array([zlib.crc32(s.encode("utf-8")) % PRIME for s in shingles(normalized)], dtype=np.uint64)
+    return ((HASH_A[:, None] * values[None, :] + HASH_B[:, None]) % PRIME).min(axis=1).astype(np.uint32)
+
+def band_keys(signature: np.ndarray) -> list:
+    """One signed 64-bit key per band; two topics sharing any key become candidates."""
+    keys = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(bytes([band]) + rows.tobytes(), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "big", signed=True))
+    return keys
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return float(np.mean(a == b))
+
+class TopicIndex:
+    """
+    Finds an earlier analysis of the same assignment brief: first by an exact
+    hash of the normalized topic, then by MinHash LSH over character shingles
+    for near-duplicates. Fingerprints live in the database, so every worker
+    shares them. lookup() and add() run inside an app context (see run_db).
+    """
+
+    def __init__(self, max_age_days: int, threshold: float):
+        self.max_age = timedelta(days=max_age_days)
+        self.threshold = threshold
+        self.lookups = 0
+        self.exact_hits = 0
+        self.near_hits = 0
+        self._lock = threading.Lock()
+
+    def stats(self) -> dict:
+        hits = self.exact_hits + self.near_hits
+        return {
+            "lookups_total": self.lookups,
+            "exact_hits_total": self.exact_hits,
+            "near_hits_total": self.near_hits,
+            "hit_rate": hits / self.lookups if self.lookups else 0.0,
+        }
+
+    def _count(self, attribute: str):
+        with self._lock:
+            setattr(self, attribute, getattr(self, attribute) + 1)
+
+    def lookup(self, topic: str):
+        """Returns (similarity, analysis) of the closest recent analysis above the threshold, or None."""
+        self._count("lookups")
+        normalized = normalize_topic(topic)
+        if not normalized:
+            return None
+        cutoff = datetime.utcnow() - self.max_age
+
+        exact = (
+            AssignmentFingerprint.query
+            .filter(
+                AssignmentFingerprint.topic_hash == hashlib.sha256(normalized.encode("utf-8")).hexdigest(),
+                AssignmentFingerprint.created_at >= cutoff,
+            )
+            .order_by(AssignmentFingerprint.created_at.desc())
+            .first()
+        )
+        if exact is not None:
+            self._count("exact_hits")
+            return 1.0, db.session.get(Assignment, exact.assignment_id).ai_response
+
+        signature = minhash(normalized)
+        candidates = (
+            db.session.query(AssignmentBand.assignment_id)
+            .filter(AssignmentBand.band.in_(band_keys(signature)))
+            .group_by(AssignmentBand.assignment_id)
+            .order_by(func.count().desc())
+            .limit(MAX_CANDIDATES)
+            .subquery()
+        )
+        best, best_score = None, 0.0
+        for fingerprint in AssignmentFingerprint.query.filter(
+            AssignmentFingerprint.assignment_id.in_(db.session.query(candidates.c.assignment_id)),
+            AssignmentFingerprint.created_at >= cutoff,
+        ):
+            score = similarity(signature, np.frombuffer(fingerprint.minhash, dtype=np.uint32))
+            if score > best_score:
+                best, best_score = fingerprint, score
+        if best is None or best_score < self.threshold:
+            return None
+
+        self._count("near_hits")
+        logger.info(f"Near-duplicate assignment topic (similarity {best_score:.2f})")
+        return best_score, db.session.get(Assignment, best.assignment_id).ai_response
+
+    def add(self, assignment_id: int, topic: str):
+        """Indexes a saved assignment; the caller commits."""
+        normalized = normalize_topic(topic)
+        if not normalized:
+            return
+        signature = minhash(normalized)
+        db.session.add(AssignmentFingerprint(
+            assignment_id=assignment_id,
+            topic_hash=hashlib.sha256(normalized.encode("utf-8")).hexdigest(),
+            minhash=signature.tobytes(),
+        ))
+        db.session.add_all(AssignmentBand(band=key, assignment_id=assignment_id) for key in set(band_keys(signature)))
+
+assignment_index = TopicIndex(
+    max_age_days=Config.ASSIGNMENT_DEDUP_DAYS,
+    threshold=Config.ASSIGNMENT_DEDUP_THRESHOLD,
+)
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import logging
+import uuid
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_
+from telegram import Update
+from telegram.ext import Application
+from bot.config import Config
+from bot.models import QueuedUpdate, db
+from bot.services.database import run_db, upsert
+from bot.utils.decorators import pending_texts, running_users
+
+logger = logging.getLogger(__name__)
+
+# Unique per process: a restarted container keeps its hostname and PID 1, and
+# must not mistake the claims of its previous run for ones still in progress
+WORKER_ID = uuid.uuid4().hex
+
+# How often a chat's FIFO checks whether its running update has been handed off
+HANDOFF_POLL_SECONDS = 0.05
+
+def update_chat_id(payload: dict):
+    """
+    Finds the chat an update belongs to without parsing it into telegram
+    objects. Falls back to the sender for updates without a chat (inline
+    queries, polls answers).
+    """
+    for key, value in payload.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        if "chat" in value:
+            return value["chat"]["id"]
+        if isinstance(value.get("message"), dict) and "chat" in value["message"]:
+            return value["message"]["chat"]["id"]
+        for sender in ("from", "user"):
+            if isinstance(value.get(sender), dict):
+                return value[sender]["id"]
+    return None
+
+def shard_for(chat_id) -> int:
+    return (chat_id or 0) % Config.UPDATE_SHARDS
+
+def enqueue_update(payload: dict):
+    """
+    Stores a raw update for the worker that owns its chat, unless an update
+    with the same update_id was already stored (Telegram redelivers updates
+    whose webhook call failed). Called by webhook_app inside an app context.
+    """
+    chat_id = update_chat_id(payload)
+    upsert(QueuedUpdate, [{
+        "update_id": payload["update_id"],
+        "shard": shard_for(chat_id),
+        "chat_id": chat_id,
+        "payload": json.dumps(payload),
+        "created_at": datetime.utcnow(),
+    }], ["update_id"])
+    db.session.commit()
+
+def _claim_batch(shard: int, limit: int, skip_chats: list = ()) -> list:
+    """Claims up to limit unprocessed updates of the shard, leaving out the chats in skip_chats."""
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=Config.UPDATE_LEASE_SECONDS)
+    query = QueuedUpdate.query.filter(
+        QueuedUpdate.shard == shard,
+        QueuedUpdate.done_at.is_(None),
+        or_(
+            QueuedUpdate.claimed_at.is_(None),
+            # Left behind by a worker that died; this worker's own claims are still in progress
+            and_(QueuedUpdate.claimed_at < stale, QueuedUpdate.claimed_by != WORKER_ID),
+        ),
+    )
+    if skip_chats:
+        query = query.filter(or_(QueuedUpdate.chat_id.notin_(skip_chats), QueuedUpdate.chat_id.is_(None)))
+    rows = (
+        query
+        .order_by(QueuedUpdate.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    for row in rows:
+        row.claimed_by = WORKER_ID
+        row.claimed_at = now
+    batch = [(row.id, row.chat_id, row.payload) for row in rows]
+    db.session.commit()
+    return batch
+
+def handed_off(update: Update) -> bool:
+    """
+    True once single_request is debouncing or running a request for the user:
+    it joins or turns away their further messages itself, so they can start.
+    """
+    user = update.effective_user
+    return user is not None and (user.id in pending_texts or user.id in running_users)
+
+def _acknowledge(update_ids: list):
+    """Marks updates as processed and deletes those older than UPDATE_DEDUP_HOURS."""
+    now = datetime.utcnow()
+    QueuedUpdate.query.filter(QueuedUpdate.id.in_(update_ids)).update({QueuedUpdate.done_at: now}, synchronize_session=False)
+    QueuedUpdate.query.filter(
+        QueuedUpdate.done_at < now - timedelta(hours=Config.UPDATE_DEDUP_HOURS)
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+class UpdateConsumer:
+    """
+    Feeds one shard of the update queue into the application. Each chat has an
+    in-memory FIFO of claimed updates, started in arrival order; an update
+    takes one of the CONCURRENT_UPDATES slots only once it reaches the head of
+    its chat's FIFO, so a chat sending a burst holds at most one slot. The
+    next update of a chat starts when the previous one finishes, or as soon as
+    single_request has taken over the user (see handed_off). At most
+    UPDATE_CHAT_BACKLOG updates per chat are claimed; the rest wait in the table.
+    """
+
+    def __init__(self, application: Application, shard: int = Config.WORKER_SHARD):
+        self.application = application
+        self.shard = shard
+        self._slots = asyncio.Semaphore(Config.CONCURRENT_UPDATES)
+        # chat_id -> claimed updates not started yet, and the task starting them
+        self._queues = {}
+        self._chains = {}
+        self._running = set()
+        self._claimed = 0
+        self._done = []
+
+    def _finished(self, update_id: int):
+        self._done.append(update_id)
+        self._claimed -= 1
+
+    async def _process(self, update_id: int, update: Update):
+        try:
+            await self.application.process_update(update)
+        except Exception as e:
+            logger.error(f"Processing queued update {update_id} failed: {e}")
+        finally:
+            self._finished(update_id)
+            self._slots.release()
+
+    async def _run_chat(self, chat_id):
+        queue = self._queues[chat_id]
+        try:
+            while queue:
+                update_id, payload = queue.popleft()
+                try:
+                    update = Update.de_json(json.loads(payload), self.application.bot)
+                except Exception as e:
+                    logger.error(f"Decoding queued update {update_id} failed: {e}")
+                    self._finished(update_id)
+                    continue
+
+                await self._slots.acquire()
+                task = asyncio.create_task(self._process(update_id, update))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+                while not task.done() and not handed_off(update):
+                    await asyncio.wait({task}, timeout=HANDOFF_POLL_SECONDS)
+        finally:
+            del self._queues[chat_id]
+            del self._chains[chat_id]
+
+    def _dispatch(self, update_id: int, chat_id, payload: str):
+        self._claimed += 1
+        self._queues.setdefault(chat_id, deque()).append((update_id, payload))
+        if chat_id not in self._chains:
+            self._chains[chat_id] = asyncio.create_task(self._run_chat(chat_id))
+
+    async def run(self):
+        logger.info(f"Consuming update shard {self.shard} of {Config.UPDATE_SHARDS} ({WORKER_ID})")
+        while True:
+            if self._done:
+                done, self._done = self._done, []
+                try:
+                    await run_db(_acknowledge, done)
+                except Exception as e:
+                    logger.error(f"Acknowledging {len(done)} updates failed: {e}")
+                    self._done.extend(done)
+
+            # Claimed rows wait in memory for at most a batch beyond the free slots
+            room = min(Config.UPDATE_BATCH_SIZE, Config.CONCURRENT_UPDATES + Config.UPDATE_BATCH_SIZE - self._claimed)
+            full = [chat_id for chat_id, queue in self._queues.items() if len(queue) >= Config.UPDATE_CHAT_BACKLOG]
+            batch = []
+            if room > 0:
+                try:
+                    batch = await run_db(_claim_batch, self.shard, room, full)
+                except Exception as e:
+                    logger.error(f"Claiming updates failed: {e}")
+
+            for update_id, chat_id, payload in batch:
+                self._dispatch(update_id, chat_id, payload)
+
+            if not batch:
+                await asyncio.sleep(Config.UPDATE_POLL_SECONDS)
+
+    async def drain(self):
+        """Waits for dispatched updates to finish and acknowledges them."""
+        await asyncio.gather(*self._chains.values(), return_exceptions=True)
+        await asyncio.gather(*self._running, return_exceptions=True)
+        if self._done:
+            await run_db(_acknowledge, self._done)
+            self._done = []
@@ -0,0 +1,78 @@
+import logging
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime
+from bot.config import Config
+from bot.models import User, db
+from bot.services.database import run_db, upsert
+from bot.services.analytics import analytics
+
+logger = logging.getLogger(__name__)
+
+CachedUser = namedtuple('CachedUser', ['id', 'is_admin'])
+
+def _upsert_user(telegram_id: int, username: str) -> CachedUser:
+    """Creates the user if missing (refreshing the username otherwise) in a single statement."""
+    created_at = datetime.utcnow()
+    result = upsert(
+        User,
+        [{
+            "telegram_id": telegram_id,
+            "username": username,
+            "is_admin": telegram_id == Config.ADMIN_USER_ID,
+            "created_at": created_at,
+        }],
+        index_elements=["telegram_id"],
+        update_columns=["username"],
+        returning=[User.id, User.is_admin, User.created_at],
+    )
+    row = result.first() if result is not None else None
+    db.session.commit()
+    # An existing user keeps their original created_at
+    if row is not None and row.created_at == created_at:
+        analytics.user_created()
+    if row is None:
+        row = db.session.query(User.id, User.is_admin).filter_by(telegram_id=telegram_id).one()
+    return CachedUser(row.id, bool(row.is_admin))
+
+class UserRegistry:
+    """
+    Bounded LRU cache of telegram_id -> (user id, is_admin) with a TTL, so menu
+    navigation and per-message lookups don't cost a database round trip.
+    Anything that changes a user must go through this class (or call
+    invalidate) so the cache stays correct.
+    """
+
+    def __init__(self, max_size: int = Config.USER_CACHE_SIZE, ttl: float = Config.USER_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def _cached(self, telegram_id: int):
+        entry = self._entries.get(telegram_id)
+        if entry is None:
+            return None
+        user, expires_at = entry
+        if time.monotonic() > expires_at:
+            del self._entries[telegram_id]
+            return None
+        self._entries.move_to_end(telegram_id)
+        return user
+
+    def _remember(self, telegram_id: int, user: CachedUser):
+        self._entries[telegram_id] = (user, time.monotonic() + self.ttl)
+        self._entries.move_to_end(telegram_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, telegram_id: int):
+        self._entries.pop(telegram_id, None)
+
+    async def get_or_create(self, telegram_id: int, username: str = None) -> CachedUser:
+        user = self._cached(telegram_id)
+        if user is None:
+            user = await run_db(_upsert_user, telegram_id, username)
+            self._remember(telegram_id, user)
+        return user
+
+user_registry = UserRegistry()
@@ -1,8 +1,7 @@
+import asyncio
 from functools import wraps
 from telegram import Update
 from telegram.ext import ContextTypes
-from bot import app
-from bot.models import User
 from bot.config import Config
 
 def admin_required(func):
@@ -18,3 +17,62 @@ def admin_required(func):
             return
         return await func(update, context, *args, **kwargs)
     return wrapper
+
+BUSY_MESSAGE = "⏳ I'm still working on your previous question. Please wait for the answer before sending another one."
+
+# Texts collected per user while a request is being debounced
+pending_texts = {}
+# Users with a request currently running
+running_users = set()
+
+def single_request(func):
+    """
+    Decorator for text handlers that call the LLM. Messages a user sends within
+    REQUEST_DEBOUNCE_SECONDS are joined and answered as one request, which is
+    passed to the handler as `text`. Messages sent while that request is running
+    are turned away, so each user has at most one request (and one writer of
+    their history) at a time.
+    """
+    @wraps(func)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
+        user_id = update.effective_user.id
+        text = update.message.text.strip()
+
+        if user_id in running_users:
+            await update.message.reply_text(BUSY_MESSAGE)
+            return None
+        if user_id in pending_texts:
+            pending_texts[user_id].append(text)
+            return None
+
+        pending_texts[user_id] = [text]
+        try:
+            await asyncio.sleep(Config.REQUEST_DEBOUNCE_SECONDS)
+        finally:
+            texts = pending_texts.pop(user_id)
+
+        running_users.add(user_id)
+        try:
+            return await func(update, context, "\n".join(texts), *args, **kwargs)
+        finally:
+            running_users.discard(user_id)
+    return wrapper
+
+def single_callback(func):
+    """
+    The single_request rule for button handlers that call the LLM: a tap while
+    the user has a request pending or running is answered with BUSY_MESSAGE.
+    """
+    @wraps(func)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
+        user_id = update.effective_user.id
+        if user_id in running_users or user_id in pending_texts:
+            await update.callback_query.answer(BUSY_MESSAGE, show_alert=True)
+            return None
+
+        running_users.add(user_id)
+        try:
+            return await func(update, context, *args, **kwargs)
+        finally:
+            running_users.discard(user_id)
+    return wrapper
@@ -1,43 +1,271 @@
+import asyncio
+import re
 from telegram import Update
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
 
 MAX_MESSAGE_LENGTH = 4096
 
+# Telegram allows roughly one edit per second per chat, so streamed answers are
+# flushed at most this often.
+STREAM_EDIT_INTERVAL = 1.5
+STREAM_CURSOR = " ▌"
+
+# Entities that must be closed at the end of a chunk and reopened at the start
+# of the next one when a split falls inside them (legacy Telegram Markdown)
+PRE, CODE, BOLD, ITALIC = "pre", "code", "bold", "italic"
+CLOSERS = {PRE: "\n```", CODE: "`", BOLD: "*", ITALIC: "_"}
+OPENERS = {PRE: "```\n", CODE: "`", BOLD: "*", ITALIC: "_"}
+
+# Room left in every chunk for the closing markers and the streaming cursor
+SPLIT_RESERVE = 16
+
+# Text between the characters that can change the splitter's state, outside
+# and inside code; feed() takes these runs in one step instead of per character
+PLAIN_RUN = re.compile(r"[^`*_\[\)\\]+")
+VERBATIM_RUN = re.compile(r"[^`]+")
+
+# Texts longer than this are split in a worker thread, off the event loop
+THREADED_SPLIT_LENGTH = 64 * 1024
+
+def utf16_length(text: str) -> int:
+    """Message length the way Telegram measures it."""
+    return len(text.encode("utf-16-le")) // 2
+
+class MarkdownSplitter:
+    """
+    Splits Markdown text into chunks Telegram will accept, in a single pass.
+
+    Text can be fed in pieces (e.g. straight from stream_perplexica); feed()
+    returns the chunks completed so far and finish() returns the rest. Chunks
+    are split at the last newline, else the last space, else hard at the
+    limit, never inside a link. Bold, italic, inline code and code blocks that
+    are open at a split are closed at the end of the chunk and reopened at the
+    start of the next. Lengths are counted in UTF-16 code units.
+    """
+
+    def __init__(self, max_length: int = MAX_MESSAGE_LENGTH):
+        self.limit = max_length - SPLIT_RESERVE
+        self._pieces = []
+        self._prefix = ""
+        self._length = 0
+        self._buffered = 0
+        self._open = []
+        # (buffer index, length, open entities) of the best split points so far
+        self._newline_cut = None
+        self._space_cut = None
+        self._skip = None
+        self._ticks = 0
+        self._star_pending = False
+        self._escaped = False
+        self._in_link = False
+        self._line_start = True
+
+    def _toggle(self, entity: str):
+        if entity in self._open:
+            self._open.remove(entity)
+        else:
+            self._open.append(entity)
+
+    def _resolve_ticks(self):
+        ticks, self._ticks = self._ticks, 0
+        if PRE in self._open:
+            if ticks >= 3:
+                self._toggle(PRE)
+        elif CODE in self._open:
+            self._toggle(CODE)
+        elif ticks >= 3:
+            self._toggle(PRE)
+        elif ticks == 1:
+            self._toggle(CODE)
+
+    def _cut(self) -> str:
+        buffer = "".join(self._pieces)
+        cut = self._newline_cut or self._space_cut
+        if cut and cut[0] > 0:
+            index, length, state = cut
+        else:
+            index, length, state = len(buffer), self._length, tuple(self._open)
+
+        head, rest = buffer[:index], buffer[index:]
+        chunk = self._prefix + head + "".join(CLOSERS[e] for e in reversed(state))
+        self._prefix = "".join(OPENERS[e] for e in state)
+
+        stripped = rest.lstrip("\n") if PRE in state else rest.lstrip()
+        # Stripped characters are whitespace, so one UTF-16 unit each
+        rest_length = self._length - length - (len(rest) - len(stripped))
+        self._pieces = [stripped] if stripped else []
+        self._buffered = len(stripped)
+        self._length = utf16_length(self._prefix) + rest_length
+        self._newline_cut = self._space_cut = None
+        self._skip = None if stripped else ("newline" if PRE in state else "all")
+        return chunk
+
+    def _consume_run(self, text: str, start: int, end: int, segment_start: int) -> int:
+        """
+        Takes the run text[start:end] (see PLAIN_RUN) in one step, with the same
+        effect as feeding it character by character, cut short so it fits in
+        the current chunk. Returns where the run stopped (start if nothing fit).
+        """
+        run = text[start:end]
+        width = len(run) if run.isascii() else utf16_length(run)
+        while end > start and self._length + width > self.limit:
+            end = start + (end - start) // 2
+            run = text[start:end]
+            width = len(run) if run.isascii() else utf16_length(run)
+        if end == start:
+            return start
+
+        def offset(position: int) -> tuple:
+            prefix_width = position if width == len(run) else utf16_length(run[:position])
+            return self._buffered + start + position - segment_start, self._length + prefix_width
+
+        self._skip = None
+        if self._star_pending:
+            self._star_pending = False
+            if run[0] != " ":
+                self._toggle(BOLD)
+        state = tuple(self._open)
+        first_newline, last_newline = run.find("\n"), run.rfind("\n")
+        space = run.rfind(" ")
+        # Links end at a newline, so only a space before the first one can be inside a link
+        if space != -1 and (not self._in_link or (first_newline != -1 and space > first_newline)):
+            self._space_cut = (*offset(space), state)
+        if last_newline != -1:
+            self._newline_cut = (*offset(last_newline), state)
+            self._in_link = False
+        self._length += width
+        self._escaped = False
+        if run[last_newline + 1:].strip(" \t"):
+            self._line_start = False
+        elif last_newline != -1:
+            self._line_start = True
+        return end
+
+    def feed(self, text: str) -> list:
+        chunks = []
+        segment_start = 0
+        i, text_length = 0, len(text)
+        while i < text_length:
+            if self._ticks and text[i] != "`":
+                self._resolve_ticks()
+            verbatim = PRE in self._open or CODE in self._open
+            # A run never needs more characters than the chunk has room for
+            room = min(text_length, i + max(self.limit - self._length, 0))
+            run = (VERBATIM_RUN if verbatim else PLAIN_RUN).match(text, i, room)
+            if run and not (self._skip and text[i].isspace()):
+                end = self._consume_run(text, i, run.end(), segment_start)
+                if end > i:
+                    i = end
+                    continue
+
+            char = text[i]
+            width = 2 if ord(char) > 0xFFFF else 1
+
+            if char == "`" and not self._escaped:
+                # Runs of backticks are resolved once the run ends
+                self._ticks += 1
+                self._length += width
+                self._line_start = False
+                i += 1
+                continue
+            if self._ticks:
+                self._resolve_ticks()
+
+            if self._length + width > self.limit:
+                self._pieces.append(text[segment_start:i])
+                self._buffered += i - segment_start
+                segment_start = i
+                chunks.append(self._cut())
+
+            if self._skip and (char == "\n" if self._skip == "newline" else char.isspace()):
+                self._pieces.append(text[segment_start:i])
+                self._buffered += i - segment_start
+                segment_start = i + 1
+                if self._skip == "newline":
+                    self._skip = None
+                i += 1
+                continue
+            self._skip = None
+
+            index = self._buffered + (i - segment_start)
+            verbatim = PRE in self._open or CODE in self._open
+
+            if self._star_pending:
+                self._star_pending = False
+                # "* item" is a bullet, not the start of bold text
+                if char != " ":
+                    self._toggle(BOLD)
+
+            if char == "\n":
+                self._newline_cut = (index, self._length, tuple(self._open))
+                self._in_link = False
+            elif char == " " and not self._in_link:
+                self._space_cut = (index, self._length, tuple(self._open))
+
+            self._length += width
+
+            if self._escaped:
+                self._escaped = False
+            elif not verbatim:
+                if char == "\\":
+                    self._escaped = True
+                elif char == "*":
+                    if self._line_start:
+                        self._star_pending = True
+                    else:
+                        self._toggle(BOLD)
+                elif char == "_":
+                    self._toggle(ITALIC)
+                elif char == "[":
+                    self._in_link = True
+                elif char == ")":
+                    self._in_link = False
+
+            if char == "\n":
+                self._line_start = True
+            elif char not in " \t":
+                self._line_start = False
+            i += 1
+
+        self._pieces.append(text[segment_start:])
+        self._buffered += len(text) - segment_start
+        return chunks
+
+    def pending(self) -> str:
+        """Text of the chunk being built, without closing markers."""
+        return self._prefix + "".join(self._pieces)
+
+    def finish(self) -> list:
+        if self._ticks:
+            self._resolve_ticks()
+        text = self.pending()
+        if not text.strip():
+            return []
+        return [text + "".join(CLOSERS[e] for e in reversed(self._open))]
+
 def split_text(text: str, max_length: int = MAX_MESSAGE_LENGTH) -> list[str]:
     """
-    Splits a long string into a list of smaller strings, each within the max_length.
-    Tries to split at newlines or spaces to keep words intact.
+    Splits a long string into a list of smaller strings, each within the max_length
+    (in UTF-16 units). Tries to split at newlines or spaces to keep words intact,
+    and keeps Markdown entities balanced in every chunk.
     """
-    if len(text) <= max_length:
+    if utf16_length(text) <= max_length:
         return [text]
 
-    chunks = []
-    while len(text) > 0:
-        if len(text) <= max_length:
-            chunks.append(text)
-            break
-
-        # Find the best place to split before the max_length
-        split_pos = text.rfind('\n', 0, max_length)
-        if split_pos == -1:
-            split_pos = text.rfind(' ', 0, max_length)
-        
-        # If no newline or space is found, force a split at max_length
-        if split_pos == -1:
-            split_pos = max_length
-        
-        chunks.append(text[:split_pos])
-        text = text[split_pos:].lstrip()
-        
-    return chunks
+    splitter = MarkdownSplitter(max_length)
+    return splitter.feed(text) + splitter.finish()
 
 async def send_long_message(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, reply_markup=None):
     """
     Sends a long message by splitting it into multiple parts if necessary.
     The reply_markup (buttons) is only attached to the very last message.
     """
-    chunks = split_text(text)
+    if len(text) > THREADED_SPLIT_LENGTH:
+        chunks = await asyncio.get_running_loop().run_in_executor(None, split_text, text)
+    else:
+        chunks = split_text(text)
     
     for i, chunk in enumerate(chunks):
         is_last_chunk = (i == len(chunks) - 1)
@@ -45,9 +273,73 @@ async def send_long_message(update: Update, context: ContextTypes.DEFAULT_TYPE,
         # Only add the keyboard to the last message
         final_reply_markup = reply_markup if is_last_chunk else None
         
-        await context.bot.send_message(
-            chat_id=update.effective_chat.id,
-            text=chunk,
-            reply_markup=final_reply_markup,
-            parse_mode=ParseMode.MARKDOWN
-        )
+        await send_markdown_message(context, update.effective_chat.id, chunk, reply_markup=final_reply_markup)
+
+async def edit_message(message, text: str, reply_markup=None, markdown: bool = False):
+    """
+    Edits a message in place. Markdown that Telegram cannot parse (which is common
+    for half-streamed answers) falls back to plain text.
+    """
+    try:
+        if markdown:
+            try:
+                return await message.edit_text(text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+            except BadRequest as e:
+                if "not modified" in str(e).lower():
+                    return message
+        return await message.edit_text(text, reply_markup=reply_markup)
+    except BadRequest as e:
+        if "not modified" not in str(e).lower():
+            raise
+        return message
+
+async def send_markdown_message(context: ContextTypes.DEFAULT_TYPE, chat_id: int, text: str, reply_markup=None):
+    """Sends a Markdown message, falling back to plain text if it does not parse."""
+    try:
+        return await context.bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+    except BadRequest:
+        return await context.bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup)
+
+def queue_notice(message):
+    """Returns an on_queued callback (see query_perplexica) that shows the queue position in message."""
+    async def notify(position: int):
+        await edit_message(message, f"⏳ The AI service is busy. Your request is queued, position {position}...")
+    return notify
+
+async def cached_answer(answer: str):
+    """Feeds an already known answer to send_streaming_message."""
+    yield answer
+
+async def send_streaming_message(update: Update, context: ContextTypes.DEFAULT_TYPE, status_msg, chunks, reply_markup=None, header: str = "") -> str:
+    """
+    Progressively edits status_msg with the text produced by the async iterator
+    `chunks` (see stream_perplexica). Edits are throttled to STREAM_EDIT_INTERVAL
+    and the text rolls over to a new message at the MarkdownSplitter boundaries.
+    The reply_markup is attached to the final message. Returns the full streamed
+    text, without the header.
+    """
+    loop = asyncio.get_running_loop()
+    chat_id = update.effective_chat.id
+    parts = []
+    message = status_msg
+    splitter = MarkdownSplitter()
+    splitter.feed(header)
+    last_edit = loop.time()
+
+    async for piece in chunks:
+        parts.append(piece)
+
+        for chunk in splitter.feed(piece):
+            # The current message is full: finalize it and continue in a new one
+            await edit_message(message, chunk, markdown=True)
+            message = await context.bot.send_message(chat_id=chat_id, text=(splitter.pending() or "…") + STREAM_CURSOR)
+            last_edit = loop.time()
+
+        pending = splitter.pending()
+        if pending.strip() and loop.time() - last_edit >= STREAM_EDIT_INTERVAL:
+            await edit_message(message, pending + STREAM_CURSOR)
+            last_edit = loop.time()
+
+    final = splitter.finish()
+    await edit_message(message, final[0] if final else "…", reply_markup=reply_markup, markdown=True)
+    return "".join(parts)
@@ -0,0 +1,66 @@
+from bot import app
+from bot.models import Assignment, HistoryEntry, Project, ProjectChapter, db
+from bot.services.history_search import index_entry, setup_search_index, ASSIGNMENT, CHAPTER
+import logging
+
+# Configure basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200
+
+# Indexes added to tables that already existed; create_all() only creates new tables
+NEW_INDEXES = [
+    *Assignment.__table__.indexes,
+    *Project.__table__.indexes,
+    *ProjectChapter.__table__.indexes,
+]
+
+def unindexed(model, kind: str):
+    """Rows of model that have no history entry yet."""
+    return model.query.outerjoin(
+        HistoryEntry, (HistoryEntry.kind == kind) & (HistoryEntry.ref_id == model.id)
+    ).filter(HistoryEntry.id.is_(None))
+
+def backfill(model, kind: str, describe) -> int:
+    """Adds history entries for existing rows in batches; safe to interrupt and re-run."""
+    indexed = 0
+    last_id = 0
+    while True:
+        rows = unindexed(model, kind).filter(model.id > last_id).order_by(model.id).limit(BATCH_SIZE).all()
+        if not rows:
+            return indexed
+        for row in rows:
+            user_id, title, body = describe(row)
+            index_entry(user_id, kind, row.id, title, body, row.created_at)
+            indexed += 1
+        db.session.commit()
+        last_id = rows[-1].id
+        logger.info(f"{model.__tablename__}: {indexed} rows indexed so far")
+
+def index_history():
+    """
+    Creates the history tables and indexes, then indexes every existing
+    assignment and project chapter so it shows up in /history.
+    """
+    try:
+        with app.app_context():
+            db.create_all()
+            for index in NEW_INDEXES:
+                index.create(db.engine, checkfirst=True)
+            setup_search_index()
+            count = backfill(Assignment, ASSIGNMENT, lambda a: (a.user_id, a.topic, a.ai_response))
+            logger.info(f"✅ {count} assignments indexed.")
+            count = backfill(
+                ProjectChapter, CHAPTER,
+                lambda c: (c.project.user_id, f"{c.project.title}: {c.title}", c.content),
+            )
+            logger.info(f"✅ {count} project chapters indexed.")
+    except Exception as e:
+        logger.error(f"❌ An error occurred while indexing the history: {e}")
+        import traceback
+        traceback.print_exc()
+
+if __name__ == "__main__":
+    logger.info("Starting history indexing script...")
+    index_history()
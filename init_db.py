@@ -1,5 +1,7 @@
 from bot import app
-from bot.models import User, Project, ProjectChapter, Assignment, CourseRequirement, db
+from bot.models import add_hash_columns, User, Project, ProjectChapter, ProjectJob, Assignment, AssignmentFingerprint, AssignmentBand, Blob, HistoryEntry, DailyStat, DailyActiveUser, AnalyticsCounter, CourseRequirement, db
+from bot.services.history_search import setup_search_index
+from bot.services.project_jobs import ensure_chapter_schema
 import logging
 
 # Configure basic logging
@@ -15,6 +17,9 @@ def init_database():
         with app.app_context():
             logger.info("Creating all database tables...")
             db.create_all()
+            add_hash_columns()
+            ensure_chapter_schema()
+            setup_search_index()
             logger.info("✅ Database tables created successfully (or already exist).")
     except Exception as e:
         logger.error(f"❌ An error occurred during database initialization: {e}")
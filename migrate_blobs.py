@@ -0,0 +1,71 @@
+from bot import app
+from bot.models import BLOB_COLUMNS, Blob, db
+import argparse
+import logging
+
+# Configure basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200
+
+def move_rows(model, attribute: str, hash_column: str) -> int:
+    """Moves inline text into the blob store in batches; safe to interrupt and re-run."""
+    moved = 0
+    last_id = 0
+    while True:
+        rows = (
+            model.query.filter(model.id > last_id, getattr(model, hash_column).is_(None))
+            .order_by(model.id)
+            .limit(BATCH_SIZE)
+            .all()
+        )
+        if not rows:
+            return moved
+        for row in rows:
+            value = getattr(row, attribute)
+            if value is not None:
+                # The attribute's setter stores the blob and clears the inline column
+                setattr(row, attribute, value)
+                moved += 1
+        db.session.commit()
+        last_id = rows[-1].id
+        logger.info(f"{model.__tablename__}: {moved} rows moved so far")
+
+def prune_blobs() -> int:
+    """Deletes blobs no row refers to any more, e.g. chapters rewritten by the consistency pass."""
+    referenced = [
+        db.session.query(getattr(model, hash_column)).filter(getattr(model, hash_column).isnot(None))
+        for model, _, _, hash_column in BLOB_COLUMNS
+    ]
+    deleted = Blob.query.filter(~Blob.hash.in_(referenced[0].union(*referenced[1:]))).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+def migrate(prune: bool = False):
+    """
+    Moves existing assignment and chapter text into compressed blobs (the bot
+    adds the blobs table and hash columns itself on start). The bot keeps
+    working while this runs: rows that have not been moved yet are still read
+    from their inline column.
+    """
+    try:
+        with app.app_context():
+            for model, _, attribute, hash_column in BLOB_COLUMNS:
+                moved = move_rows(model, attribute, hash_column)
+                logger.info(f"✅ {model.__tablename__}: {moved} rows moved to the blob store.")
+            if prune:
+                logger.info(f"✅ Pruned {prune_blobs()} unreferenced blobs.")
+            if db.engine.dialect.name == "postgresql":
+                logger.info("Run VACUUM FULL on assignments and project_chapters to return the freed space to the OS.")
+    except Exception as e:
+        logger.error(f"❌ An error occurred during the blob migration: {e}")
+        import traceback
+        traceback.print_exc()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move AI outputs into the content-addressed blob store.")
+    parser.add_argument("--prune", action="store_true", help="also delete blobs no row refers to")
+    args = parser.parse_args()
+    logger.info("Starting blob store migration...")
+    migrate(prune=args.prune)
@@ -0,0 +1,49 @@
+import hmac
+import logging
+from flask import Flask, request, jsonify
+from bot.config import Config
+from bot.models import db
+from bot.services.update_queue import enqueue_update
+
+logger = logging.getLogger(__name__)
+
+# Receives Telegram updates and queues them for the bot workers
+# (BOT_MODE=worker). Nothing here talks to Telegram or the LLM, so each
+# request is acknowledged as soon as the update is stored.
+if not Config.WEBHOOK_SECRET:
+    # Without it anyone could POST forged updates (e.g. from the admin's user id)
+    raise RuntimeError("WEBHOOK_SECRET must be set to run the webhook receiver")
+
+app = Flask(__name__)
+app.config.from_object(Config)
+db.init_app(app)
+
+with app.app_context():
+    try:
+        db.create_all()
+    except Exception as e:
+        # Another gunicorn worker or the bot may be creating the tables right now
+        logger.warning(f"Creating tables failed: {e}")
+
+@app.route("/health", methods=["GET"])
+def health():
+    return jsonify(status="ok")
+
+@app.route("/telegram/webhook", methods=["POST"])
+def telegram_webhook():
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not Config.WEBHOOK_SECRET or not hmac.compare_digest(token, Config.WEBHOOK_SECRET):
+        return jsonify(error="forbidden"), 403
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or "update_id" not in payload:
+        return jsonify(error="invalid update"), 400
+
+    try:
+        enqueue_update(payload)
+    except Exception as e:
+        logger.error(f"Queueing update {payload.get('update_id')} failed: {e}")
+        db.session.rollback()
+        # A non-2xx answer makes Telegram deliver the update again later
+        return jsonify(error="unavailable"), 503
+    return "", 200